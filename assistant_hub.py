@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""
+Hub for satellite mode: one board runs STT, intents, the LLM and TTS for
+several satellites (see satellite.py and satellite_protocol.py).
+
+Every satellite gets a HubSession with its own wake word detector,
+recognizer, endpointer, intent router (timers ring in the room that set
+them) and LLM session, keyed by the satellite name so its conversation
+survives reconnects (a satellite without a name gets a fresh one each
+time). The Vosk model, the Piper process, the audio cache and the LLM
+response cache are shared. LLM requests go through one
+LLMScheduler: short questions first, LLM_CONCURRENCY answers at a time.
+
+Backpressure: a session accepts at most its granted credits of audio
+blocks and returns credit as its worker consumes them, so a busy hub makes
+satellites buffer (and eventually drop) instead of growing a queue. In the
+other direction, a satellite stops reading while its answer queue is full
+and the hub's send blocks.
+
+Usage:
+    python3 assistant_hub.py [--host 0.0.0.0] [--port 8765]
+"""
+import argparse
+import json
+import os
+import queue
+import socket
+import threading
+import time
+
+import main_assistant as assistant
+from conversation_history import ConversationHistory, simple_summary
+from config_store import get_inline_command_beep, get_language
+from response_cache import ResponseCache
+from rkllm_client import LLMScheduler
+from satellite_protocol import (AUDIO, BEEP, BYE, CREDIT, DEFAULT_PORT, HELLO, IDLE, LISTEN, PLAY,
+                                PROTOCOL_VERSION, REJECT, WELCOME, Connection, ProtocolError,
+                                decode_json)
+from startup import Startup
+from text_segmenter import segment_stream
+from vad import Endpointer
+
+# Satellites served at once; more are rejected with "hub full"
+MAX_SESSIONS = 8
+# Audio blocks a satellite may have in flight to its session (~4 s at 2048 frames)
+SESSION_CREDITS = 32
+# Blocks consumed before credit is returned in one CREDIT frame
+CREDIT_BATCH = 8
+# Answers generated by the LLM at the same time (the NPU serves one well)
+LLM_CONCURRENCY = 1
+# Seconds of audio per block sent by the satellites
+BLOCK_SECONDS = 2048 / 16000
+# Seconds between stats reports in the console
+HUB_STATS_INTERVAL = 300.0
+
+class VoskSpeech:
+    """Per-session recognizers over one shared Vosk model"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def wake_detector(self, session):
+        return assistant.WakeWordDetector(self.model, assistant.wake_phrase(), rate=16000,
+                                          use_grammar=assistant.WAKE_WORD_USE_GRAMMAR)
+
+    def recognizer(self, session):
+        from vosk import KaldiRecognizer
+        return KaldiRecognizer(self.model, 16000)
+
+class HubSession:
+    def __init__(self, hub, conn, session_id, name, language, named=True):
+        self.hub = hub
+        self.conn = conn
+        self.id = session_id
+        self.name = name
+        # Unnamed satellites are called ip:port, a new name on every reconnect,
+        # so their LLM session ends with the connection
+        self.named = named
+        self.language = language
+        self.wake_detector = hub.speech.wake_detector(self)
+        self.recognizer = hub.speech.recognizer(self)
+        self.endpointer = Endpointer(BLOCK_SECONDS,
+                                     no_speech_timeout=assistant.COMMAND_NO_SPEECH_TIMEOUT,
+                                     end_silence=assistant.COMMAND_END_SILENCE,
+                                     max_utterance=assistant.COMMAND_MAX_DURATION)
+        # Timers set from this room ring in this room
+        self.router = assistant.build_intent_router(
+            on_timer_done=lambda: self.say(assistant.TIMER_DONE_MESSAGE))
+        self.llm_client = hub.scheduler.session(name, system_prompt=assistant.get_system_prompt(language),
+                                                language=language)
+        self.blocks = queue.Queue()
+        self._credit_lock = threading.Lock()
+        self._available = hub.credits  # Blocks the satellite may still send
+        self._consumed = 0             # Blocks consumed since the last CREDIT
+        self.credit_batch = max(1, min(CREDIT_BATCH, hub.credits // 2))
+        self.closed = threading.Event()
+
+        # Counters
+        self.blocks_received = 0
+        self.overflows = 0  # Blocks sent without credit (dropped)
+        self.max_queued = 0
+        self.wake_words = 0
+        self.commands = 0
+        self.local_answers = 0
+        self.llm_answers = 0
+
+    def start(self):
+        self.conn.send_json(WELCOME, {'session': self.id, 'credits': self.hub.credits})
+        threading.Thread(target=self._read_loop, name=f"hub-read-{self.name}", daemon=True).start()
+        threading.Thread(target=self._run, name=f"hub-session-{self.name}", daemon=True).start()
+
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        self.llm_client.cancel()
+        self.blocks.put(None)
+        self.conn.close()
+        self.hub.remove(self)
+        if not self.named:
+            self.hub.scheduler.end_session(self.name)
+
+    def _read_loop(self):
+        try:
+            while True:
+                kind, payload = self.conn.recv()
+                if kind == AUDIO:
+                    self.blocks_received += 1
+                    with self._credit_lock:
+                        if self._available <= 0:
+                            self.overflows += 1
+                            continue
+                        self._available -= 1
+                    self.blocks.put(payload)
+                    self.max_queued = max(self.max_queued, self.blocks.qsize())
+                elif kind == BYE:
+                    break
+        except (OSError, EOFError, ProtocolError):
+            pass
+        finally:
+            print(f"[Hub: satellite '{self.name}' disconnected]")
+            self.close()
+
+    def _return_credit(self, blocks):
+        with self._credit_lock:
+            self._consumed += blocks
+            if self._consumed < self.credit_batch:
+                return
+            grant, self._consumed = self._consumed, 0
+            self._available += grant
+        self._send_json(CREDIT, {'blocks': grant})
+
+    def _discard_pending(self):
+        """Drop the audio queued while we were answering (the satellite's own voice)"""
+        dropped = 0
+        while True:
+            try:
+                if self.blocks.get_nowait() is None:
+                    self.blocks.put(None)
+                    break
+                dropped += 1
+            except queue.Empty:
+                break
+        if dropped:
+            self._return_credit(dropped)
+
+    def _send(self, kind, payload=b""):
+        try:
+            self.conn.send(kind, payload)
+        except OSError:
+            pass  # The reader notices the closed connection
+
+    def _send_json(self, kind, message):
+        self._send(kind, json.dumps(message).encode('utf-8'))
+
+    def say(self, text):
+        """Send a short fixed answer, through the audio cache"""
+        wav_data = self.hub.audio_cache.synthesize(text)
+        print(f"Assistant [{self.name}]: {text}")
+        if wav_data:
+            self._send(PLAY, wav_data)
+
+    def speak_stream(self, text_iterator):
+        """Synthesize the answer sentence by sentence and send each segment as it is ready"""
+        for segment in segment_stream(text_iterator, language=self.language):
+            if self.closed.is_set():
+                break
+            wav_path = self.hub.tts_engine.synthesize(segment)
+            if not wav_path:
+                continue
+            try:
+                with open(wav_path, 'rb') as f:
+                    wav_data = f.read()
+                os.remove(wav_path)
+            except OSError as e:
+                print(f"[Warning: could not read {wav_path}: {e}]")
+                continue
+            print(f"Assistant [{self.name}]: {segment}")
+            self._send(PLAY, wav_data)
+
+    def answer(self, text):
+        print(f"Command received [{self.name}]: {text}")
+        self.commands += 1
+        intent, response = self.router.handle(text, self.language)
+        if intent and response:
+            self.local_answers += 1
+            self.say(response)
+            return
+        self.llm_answers += 1
+        # Dropped from the scheduler's queue if the satellite goes away while waiting
+        self.speak_stream(self.llm_client.chat_stream(text, cancel_event=self.closed))
+
+    def _run(self):
+        """The main_assistant state machine, fed from the satellite instead of a microphone"""
+        state = 'idle'
+        last_partial = ""
+        last_wake_word_time = 0
+        rec = self.recognizer
+        while not self.closed.is_set():
+            data = self.blocks.get()
+            if data is None:
+                break
+            self._return_credit(1)
+
+            text = None
+            if state == 'idle':
+                if not self.wake_detector.process(data):
+                    continue
+                if time.time() - last_wake_word_time < assistant.WAKE_WORD_COOLDOWN:
+                    continue
+                print(f"[Hub: wake word from '{self.name}']")
+                self.wake_words += 1
+                last_wake_word_time = time.time()
+                if assistant.WAKE_WORD_INLINE_COMMAND:
+                    text = assistant.transcribe_inline_command(rec, self.wake_detector.utterance_audio())
+                rec.Reset()
+                self.wake_detector.reset()
+                if not text or get_inline_command_beep():
+                    self._send(BEEP)
+                if not text:
+                    self._send(LISTEN)
+                    state = 'listening_command'
+                    self.endpointer.reset()
+                    last_partial = ""
+                    continue
+
+            elif state == 'listening_command':
+                speech = self.wake_detector.vad.is_speech(data)
+                if rec.AcceptWaveform(data):
+                    text = json.loads(rec.Result()).get("text", "").strip()
+                else:
+                    partial_text = json.loads(rec.PartialResult()).get("partial", "")
+                    if partial_text != last_partial:
+                        speech = True
+                        last_partial = partial_text
+                endpoint = self.endpointer.process(speech)
+                if not text and endpoint == Endpointer.SPEECH_ENDED:
+                    text = json.loads(rec.FinalResult()).get("text", "").strip()
+                    if not text:
+                        self.endpointer.resume()
+                if not text:
+                    if endpoint == Endpointer.NO_SPEECH:
+                        print(f"[Hub: no command from '{self.name}']")
+                        self._send(IDLE)
+                        state = 'idle'
+                    continue
+
+            self._send(IDLE)
+            try:
+                self.answer(text)
+            except Exception as e:
+                print(f"[Hub: error answering '{self.name}': {e}]")
+            self.wake_detector.reset()
+            self._discard_pending()
+            state = 'idle'
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'language': self.language,
+            'queued_blocks': self.blocks.qsize(),
+            'blocks_received': self.blocks_received,
+            'overflows': self.overflows,
+            'max_queued': self.max_queued,
+            'wake_words': self.wake_words,
+            'commands': self.commands,
+            'local_answers': self.local_answers,
+            'llm_answers': self.llm_answers,
+        }
+
+class Hub:
+    def __init__(self, speech, tts_engine, audio_cache, llm_url=None, response_cache=None,
+                 max_sessions=MAX_SESSIONS, llm_concurrency=LLM_CONCURRENCY, credits=SESSION_CREDITS):
+        """
+        speech: VoskSpeech (or anything with wake_detector(session) and recognizer(session)).
+        tts_engine and audio_cache are shared by every session.
+        """
+        self.speech = speech
+        self.tts_engine = tts_engine
+        self.audio_cache = audio_cache
+        self.max_sessions = max_sessions
+        self.credits = credits
+        # One LLM session per satellite name, kept across reconnects
+        self.scheduler = LLMScheduler(url=llm_url, response_cache=response_cache,
+                                      max_concurrent=llm_concurrency, history_factory=self._new_history)
+        self.sessions = {}
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._server = None
+        self._stopping = threading.Event()
+
+        # Counters
+        self.rejected = 0
+
+    @staticmethod
+    def _new_history():
+        return ConversationHistory(max_tokens=assistant.HISTORY_MAX_TOKENS,
+                                   idle_reset=assistant.HISTORY_IDLE_RESET,
+                                   summarizer=simple_summary if assistant.HISTORY_COMPACT else None)
+
+    def start(self, host="0.0.0.0", port=DEFAULT_PORT):
+        """Listen for satellites in the background; returns the port (useful with port=0)"""
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(self.max_sessions)
+        self._stopping.clear()
+        threading.Thread(target=self._accept_loop, args=(self._server,), name="hub-accept",
+                         daemon=True).start()
+        port = self._server.getsockname()[1]
+        print(f"Hub listening for satellites on {host}:{port}")
+        return port
+
+    def _accept_loop(self, server):
+        while not self._stopping.is_set():
+            try:
+                sock, address = server.accept()
+            except OSError:
+                break  # stop()
+            if self._stopping.is_set():
+                sock.close()
+                break
+            threading.Thread(target=self._handshake, args=(Connection(sock), address),
+                             daemon=True).start()
+
+    def _reject(self, conn, reason):
+        self.rejected += 1
+        try:
+            conn.send_json(REJECT, {'reason': reason})
+        except OSError:
+            pass
+        conn.close()
+
+    def _handshake(self, conn, address):
+        try:
+            kind, payload = conn.recv()
+            hello = decode_json(payload)
+        except (OSError, EOFError, ProtocolError):
+            conn.close()
+            return
+        if kind != HELLO or not isinstance(hello, dict) or hello.get('version') != PROTOCOL_VERSION:
+            self._reject(conn, f"expected HELLO with protocol version {PROTOCOL_VERSION}")
+            return
+        if hello.get('rate', 16000) != 16000:
+            self._reject(conn, "audio must be 16 kHz")
+            return
+        named = bool(hello.get('name'))
+        name = str(hello.get('name')) if named else f"{address[0]}:{address[1]}"
+        session_id = None
+        with self._lock:
+            if len(self.sessions) < self.max_sessions:
+                session_id = self._next_id
+                self._next_id += 1
+        if session_id is None:
+            print(f"[Hub: rejected '{name}', {self.max_sessions} satellites already connected]")
+            self._reject(conn, "hub full")
+            return
+        session = HubSession(self, conn, session_id, name, hello.get('language') or get_language(),
+                             named)
+        with self._lock:
+            self.sessions[session_id] = session
+        print(f"[Hub: satellite '{name}' connected from {address[0]} (session {session_id})]")
+        session.start()
+
+    def remove(self, session):
+        with self._lock:
+            self.sessions.pop(session.id, None)
+
+    def stats(self):
+        with self._lock:
+            sessions = list(self.sessions.values())
+        return {
+            'sessions': [session.stats() for session in sessions],
+            'rejected': self.rejected,
+            'llm': self.scheduler.stats(),
+        }
+
+    def stop(self):
+        self._stopping.set()
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.shutdown(socket.SHUT_RDWR)  # Wakes the accept(); close() alone does not on Linux
+            except OSError:
+                pass
+            server.close()
+        with self._lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            session.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve satellites: STT, intents, LLM and TTS")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-sessions", type=int, default=MAX_SESSIONS)
+    args = parser.parse_args()
+
+    startup = Startup()
+    startup.add('vosk_model', assistant.load_stt_model)
+    assistant.add_tts_startup(startup)
+    response_cache = ResponseCache(persist_path=assistant.LLM_CACHE_FILE) if assistant.LLM_CACHE_ENABLED else None
+    assistant.weather_provider.start_background_refresh(assistant.get_weather_settings_for_refresh)
+
+    hub = Hub(VoskSpeech(startup.result('vosk_model')), assistant.tts_engine, assistant.audio_cache,
+              response_cache=response_cache, max_sessions=args.max_sessions)
+    startup.result('tts_engine')
+    hub.start(args.host, args.port)
+    startup.mark_ready()
+    startup.print_timeline()
+
+    try:
+        while True:
+            time.sleep(HUB_STATS_INTERVAL)
+            stats = hub.stats()
+            llm = stats['llm']
+            print(f"[Hub: {len(stats['sessions'])} satellites, {stats['rejected']} rejected, "
+                  f"LLM queue {llm['queue_depth']} (max {llm['max_queue_depth']}), "
+                  f"wait p95 {llm['wait_ms_all']['p95']} ms]")
+            for session in stats['sessions']:
+                print(f"  {session['name']}: {session['commands']} commands "
+                      f"({session['local_answers']} local, {session['llm_answers']} LLM), "
+                      f"{session['overflows']} overflows")
+    except KeyboardInterrupt:
+        print("\nExiting...")
+    finally:
+        hub.stop()
+        assistant.tts_engine.shutdown()
+        print(assistant.audio_cache.format_stats())
+        assistant.weather_provider.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Content-addressed cache of synthesized speech.
+
+WAV data is keyed by a hash of (text, voice model, speaking parameters) and
+kept in two tiers: an in-memory LRU bounded in bytes, and a directory on
+disk that survives restarts. Fixed phrases are prewarmed at startup so they
+play without waiting for Piper.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from tts_engine import clean_tts_text
+
+AUDIO_CACHE_DIR = "tts_cache"
+# Bytes of WAV data kept in memory (about 45 s of 22050 Hz 16-bit mono)
+AUDIO_CACHE_MEMORY_BYTES = 2 * 1024 * 1024
+# Files kept on disk; the least recently used are removed beyond this
+AUDIO_CACHE_MAX_FILES = 2000
+
+class AudioCache:
+    def __init__(self, engine, cache_dir=AUDIO_CACHE_DIR, max_memory_bytes=AUDIO_CACHE_MEMORY_BYTES,
+                 max_files=AUDIO_CACHE_MAX_FILES, speaking_params=""):
+        self.engine = engine
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_files = max_files
+        self.speaking_params = speaking_params
+        self._memory = OrderedDict()  # key -> WAV bytes, least recently used first
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._puts_since_prune = 0
+
+        # Counters
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._voice_id = self._describe_voice()
+
+    def _describe_voice(self):
+        """Identify the voice by path and file timestamp, so replacing the model invalidates entries"""
+        try:
+            mtime = int(os.path.getmtime(self.engine.model))
+        except OSError:
+            mtime = 0
+        return f"{os.path.abspath(self.engine.model)}:{mtime}"
+
+    def key(self, text):
+        raw = "\n".join([clean_tts_text(text), self._voice_id, self.speaking_params])
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def _remember(self, key, wav):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            self._memory[key] = wav
+            self._memory_bytes += len(wav)
+            while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def get(self, text):
+        """Return cached WAV bytes for the text, or None"""
+        key = self.key(text)
+        with self._lock:
+            wav = self._memory.get(key)
+            if wav is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return wav
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                wav = f.read()
+            os.utime(path)  # Mark as recently used for pruning
+        except OSError:
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        self._remember(key, wav)
+        return wav
+
+    def put(self, text, wav):
+        key = self.key(text)
+        self._remember(key, wav)
+        path = self._disk_path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(wav)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[Warning: could not write audio cache file: {e}]")
+        self._puts_since_prune += 1
+        if self._puts_since_prune >= 50:
+            self._puts_since_prune = 0
+            self._prune_disk()
+
+    def _prune_disk(self):
+        try:
+            paths = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                     if name.endswith(".wav")]
+            if len(paths) <= self.max_files:
+                return
+            paths.sort(key=os.path.getmtime)
+            for path in paths[:len(paths) - self.max_files]:
+                os.remove(path)
+        except OSError as e:
+            print(f"[Warning: could not prune audio cache: {e}]")
+
+    def synthesize(self, text):
+        """Return WAV bytes for the text, synthesizing and caching on a miss"""
+        wav = self.get(text)
+        if wav is not None:
+            return wav
+        wav_path = self.engine.synthesize(text)
+        if not wav_path:
+            return None
+        try:
+            with open(wav_path, 'rb') as f:
+                wav = f.read()
+        except OSError as e:
+            print(f"[Warning: could not read synthesized audio: {e}]")
+            return None
+        finally:
+            try:
+                os.remove(wav_path)
+            except OSError:
+                pass
+        self.put(text, wav)
+        return wav
+
+    def prewarm(self, phrases):
+        """Make sure each phrase is synthesized and loaded in memory"""
+        for phrase in phrases:
+            self.synthesize(phrase)
+        print(f"[Audio cache prewarmed {len(phrases)} phrases. {self.format_stats()}]")
+
+    def stats(self):
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'memory_entries': len(self._memory),
+            'memory_bytes': self._memory_bytes,
+        }
+
+    def format_stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hit_rate = 100.0 * (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+        return (f"Audio cache: {hit_rate:.0f}% hits ({self.memory_hits} memory, "
+                f"{self.disk_hits} disk, {self.misses} misses)")
@@ -0,0 +1,132 @@
+"""
+Background microphone capture.
+
+PyAudio runs the stream in callback mode, so frames are pulled from the
+device on PortAudio's own thread and copied into a fixed-size, preallocated
+ring buffer. The recognizer loop consumes blocks at its own pace and never
+stalls capture while TTS, the LLM or an HTTP request is blocking it.
+
+The ring has a single producer (the callback) and a single consumer (read()).
+Each side only advances its own counter, so no lock is needed; the consumer
+detects blocks overwritten while it lagged and counts them as dropped.
+"""
+import threading
+
+import pyaudio
+
+SAMPLE_RATE = 16000
+FRAMES_PER_BUFFER = 2048
+# Seconds of audio kept in the ring (also the maximum pre-roll)
+RING_SECONDS = 10.0
+
+class AudioCapture:
+    def __init__(self, pa, rate=SAMPLE_RATE, frames_per_buffer=FRAMES_PER_BUFFER,
+                 input_device_index=None, ring_seconds=RING_SECONDS):
+        self.pa = pa
+        self.rate = rate
+        self.frames_per_buffer = frames_per_buffer
+        self.input_device_index = input_device_index
+        self.block_bytes = frames_per_buffer * 2  # 16-bit mono
+        self.capacity = max(2, int(ring_seconds * rate / frames_per_buffer))
+
+        self._ring = bytearray(self.capacity * self.block_bytes)
+        self._lengths = [0] * self.capacity
+        self._write_index = 0  # Total blocks written, only advanced by the callback
+        self._read_index = 0   # Total blocks consumed, only advanced by read()
+        self._data_ready = threading.Event()
+        self.stream = None
+
+        # Counters
+        self.input_overflows = 0  # Reported by PortAudio: the device dropped frames
+        self.dropped_blocks = 0   # The consumer lagged more than the ring capacity
+
+    def start(self):
+        self.stream = self.pa.open(format=pyaudio.paInt16,
+                                   channels=1,
+                                   rate=self.rate,
+                                   input=True,
+                                   input_device_index=self.input_device_index,
+                                   frames_per_buffer=self.frames_per_buffer,
+                                   stream_callback=self._on_audio)
+        self.stream.start_stream()
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+        # Wake up a consumer blocked in read()
+        self._data_ready.set()
+
+    def _on_audio(self, in_data, frame_count, time_info, status):
+        if status & pyaudio.paInputOverflow:
+            self.input_overflows += 1
+
+        slot = self._write_index % self.capacity
+        length = min(len(in_data), self.block_bytes)
+        offset = slot * self.block_bytes
+        self._ring[offset:offset + length] = in_data[:length]
+        self._lengths[slot] = length
+        self._write_index += 1
+        self._data_ready.set()
+        return (None, pyaudio.paContinue)
+
+    def _copy_block(self, index):
+        slot = index % self.capacity
+        offset = slot * self.block_bytes
+        return bytes(self._ring[offset:offset + self._lengths[slot]])
+
+    def read(self, timeout=None):
+        """
+        Return the next captured block, waiting up to timeout seconds.
+        Returns None on timeout or after stop().
+        """
+        while True:
+            self._data_ready.clear()
+            available = self._write_index - self._read_index
+            if available > 0:
+                break
+            if self.stream is None or not self._data_ready.wait(timeout):
+                return None
+
+        if available > self.capacity - 1:
+            # The oldest blocks were overwritten; keep one slot of margin for the writer
+            skipped = available - (self.capacity - 1)
+            self.dropped_blocks += skipped
+            self._read_index += skipped
+
+        index = self._read_index
+        data = self._copy_block(index)
+        if self._write_index - index >= self.capacity:
+            # Overwritten while copying
+            self.dropped_blocks += 1
+            self._read_index += 1
+            return self.read(timeout)
+        self._read_index = index + 1
+        return data
+
+    def pending_blocks(self):
+        return self._write_index - self._read_index
+
+    def skip_to_latest(self):
+        """Discard everything not consumed yet (e.g. our own voice captured during playback)"""
+        self._read_index = self._write_index
+
+    def preroll(self, seconds):
+        """Return up to the last `seconds` of captured audio without consuming it"""
+        blocks = int(seconds * self.rate / self.frames_per_buffer + 0.999)
+        end = self._write_index
+        start = max(0, end - min(blocks, self.capacity - 1))
+        data = b"".join(self._copy_block(i) for i in range(start, end))
+        if self._write_index - start >= self.capacity:
+            # The oldest block was overwritten while copying; drop it
+            data = data[self.block_bytes:]
+        return data
+
+    def stats(self):
+        return {
+            'input_overflows': self.input_overflows,
+            'dropped_blocks': self.dropped_blocks,
+            'pending_blocks': self.pending_blocks(),
+            'capacity_blocks': self.capacity,
+        }
@@ -0,0 +1,399 @@
+"""
+In-process audio output.
+
+The output device is opened once and fed by a single player thread, so a
+sound costs no process spawn, no device open and no "let the device go"
+sleep. Sounds are decoded to 16-bit mono PCM at the device rate and queued
+on one of two channels: SPEECH (answers, beeps) and CUE (acknowledgements,
+timer alarms). Each channel plays its sounds back to back; when both have
+audio they are mixed, with the cue ducked under the speech.
+
+Sinks: PyAudioSink for the real card, NullSink and WavFileSink for tests
+and machines without audio.
+"""
+import io
+import os
+import threading
+import time
+import warnings
+import wave
+from array import array
+from collections import deque
+
+# C sample conversion; the array fallbacks below cover Pythons without it (3.13+)
+with warnings.catch_warnings():
+    warnings.simplefilter('ignore', DeprecationWarning)
+    try:
+        import audioop
+    except ImportError:
+        audioop = None
+
+SPEECH = 'speech'
+CUE = 'cue'
+CHANNELS = (SPEECH, CUE)
+
+# Device rate; Piper's medium voices are 22050 Hz, so speech needs no conversion
+OUTPUT_RATE = 22050
+# Rates tried in order if the device refuses OUTPUT_RATE
+FALLBACK_RATES = (48000, 44100)
+# Frames written to the device per period (~46 ms at 22050 Hz)
+PERIOD_FRAMES = 1024
+# Volume of the cue channel while speech is playing
+CUE_DUCK_GAIN = 0.35
+
+def read_wav(source):
+    """Decode WAV bytes or a WAV file path into (pcm, rate, channels). 16-bit only."""
+    handle = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+    with wave.open(handle, 'rb') as wav_file:
+        if wav_file.getsampwidth() != 2:
+            raise ValueError("only 16-bit WAV is supported")
+        return wav_file.readframes(wav_file.getnframes()), wav_file.getframerate(), wav_file.getnchannels()
+
+def to_mono(pcm, channels):
+    if channels == 1:
+        return pcm
+    pcm = pcm[:len(pcm) - len(pcm) % (2 * channels)]
+    if audioop and channels == 2:
+        return audioop.tomono(pcm, 2, 0.5, 0.5)
+    samples = array('h', pcm)
+    mono = array('h', (sum(frame) // channels
+                       for frame in zip(*(samples[c::channels] for c in range(channels)))))
+    return mono.tobytes()
+
+def resample(pcm, src_rate, dst_rate):
+    """Linear-interpolation resampling of 16-bit mono PCM"""
+    if src_rate == dst_rate or not pcm:
+        return pcm
+    pcm = pcm[:len(pcm) - len(pcm) % 2]
+    if audioop:
+        return audioop.ratecv(pcm, 2, 1, src_rate, dst_rate, None)[0]
+    samples = array('h', pcm)
+    count = int(len(samples) * dst_rate / src_rate)
+    step = src_rate / dst_rate
+    last = len(samples) - 1
+    out = array('h', bytes(2 * count))
+    for i in range(count):
+        position = i * step
+        j = int(position)
+        k = min(j + 1, last)
+        out[i] = int(samples[j] + (samples[k] - samples[j]) * (position - j))
+    return out.tobytes()
+
+def mix(first, second, second_gain=1.0):
+    """Mix two 16-bit mono PCM chunks (the shorter one is padded with silence)"""
+    if len(first) < len(second):
+        first = first + bytes(len(second) - len(first))
+    elif len(second) < len(first):
+        second = second + bytes(len(first) - len(second))
+    if audioop:
+        if second_gain != 1.0:
+            second = audioop.mul(second, 2, second_gain)
+        return audioop.add(first, second, 2)  # Saturates instead of wrapping
+    return array('h', (max(-32768, min(32767, int(x + y * second_gain)))
+                       for x, y in zip(array('h', first), array('h', second)))).tobytes()
+
+class Sound:
+    """A queued sound. wait() returns True once it has played, False if it was cancelled."""
+
+    def __init__(self, pcm, channel, label=None):
+        self.pcm = pcm
+        self.channel = channel
+        self.label = label
+        self.position = 0  # Bytes already written
+        self.cancelled = False
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        self.done.wait(timeout)
+        return self.done.is_set() and not self.cancelled
+
+def find_output_device(pa, card):
+    """PyAudio index of an ALSA card (number or name), or None for the default device"""
+    if card is None:
+        return None
+    for index in range(pa.get_device_count()):
+        info = pa.get_device_info_by_index(index)
+        if info.get('maxOutputChannels', 0) < 1:
+            continue
+        name = info.get('name', '')
+        if isinstance(card, int) and f"(hw:{card}," in name:
+            return index
+        if not isinstance(card, int) and str(card) in name:
+            return index
+    print(f"[Warning: audio output card {card} not found, using the default device]")
+    return None
+
+class PyAudioSink:
+    """The output card, opened once through PyAudio"""
+
+    def __init__(self, card=None, rate=OUTPUT_RATE, period_frames=PERIOD_FRAMES):
+        import pyaudio  # Only needed for the real device
+        self._pyaudio = pyaudio
+        self.period_frames = period_frames
+        self.pa = pyaudio.PyAudio()
+        self.device_index = find_output_device(self.pa, card)
+        self.stream = None
+        last_error = None
+        for candidate in (rate,) + tuple(r for r in FALLBACK_RATES if r != rate):
+            try:
+                self.stream = self._open(candidate)
+                self.rate = candidate
+                break
+            except (IOError, OSError, ValueError) as e:
+                last_error = e
+        if self.stream is None:
+            self.pa.terminate()
+            raise IOError(f"could not open audio output: {last_error}")
+        if self.device_index is not None:
+            self.name = self.pa.get_device_info_by_index(self.device_index)['name']
+        else:
+            self.name = "default"
+
+    def _open(self, rate):
+        return self.pa.open(format=self._pyaudio.paInt16, channels=1, rate=rate, output=True,
+                            output_device_index=self.device_index,
+                            frames_per_buffer=self.period_frames, start=False)
+
+    def write(self, pcm):
+        """Write PCM, blocking while the device buffer is full. Returns True on an underrun."""
+        if self.stream.is_stopped():
+            self.stream.start_stream()
+        try:
+            self.stream.write(pcm, exception_on_underflow=True)
+        except IOError as e:
+            if getattr(e, 'errno', None) == self._pyaudio.paOutputUnderflowed:
+                # PyAudio has already closed the stream when it raises this: open a new one
+                self.stream = self._open(self.rate)
+                return True
+            raise
+        return False
+
+    def drain(self):
+        """Let the buffered audio play out, then stop the stream until the next write"""
+        if not self.stream.is_stopped():
+            self.stream.stop_stream()
+
+    def abort(self):
+        """Stop right away, dropping the buffered audio (closing a stream discards it)"""
+        if not self.stream.is_stopped():
+            self.stream.close()
+            self.stream = self._open(self.rate)
+
+    def close(self):
+        self.stream.close()
+        self.pa.terminate()
+
+class NullSink:
+    """Discards audio. With realtime, write() takes as long as the audio would play."""
+
+    def __init__(self, rate=OUTPUT_RATE, realtime=True):
+        self.rate = rate
+        self.realtime = realtime
+        self.name = "null"
+        self.bytes_written = 0
+
+    def write(self, pcm):
+        self.bytes_written += len(pcm)
+        if self.realtime:
+            time.sleep(len(pcm) / (2.0 * self.rate))
+        return False
+
+    def drain(self):
+        pass
+
+    def abort(self):
+        pass
+
+    def close(self):
+        pass
+
+class WavFileSink(NullSink):
+    """Writes everything played (silence between sounds excluded) to a WAV file"""
+
+    def __init__(self, path, rate=OUTPUT_RATE, realtime=False):
+        super().__init__(rate=rate, realtime=realtime)
+        self.name = path
+        self._file = wave.open(path, 'wb')
+        self._file.setnchannels(1)
+        self._file.setsampwidth(2)
+        self._file.setframerate(rate)
+
+    def write(self, pcm):
+        self._file.writeframes(pcm)
+        return super().write(pcm)
+
+    def close(self):
+        self._file.close()
+
+class AudioOutput:
+    def __init__(self, sink, period_frames=PERIOD_FRAMES, cue_gain=CUE_DUCK_GAIN):
+        self.sink = sink
+        self.rate = sink.rate
+        self.period_bytes = 2 * period_frames
+        self.cue_gain = cue_gain
+        self._channels = {channel: deque() for channel in CHANNELS}
+        self._cond = threading.Condition()
+        self._discard = False  # A playing sound was cancelled: drop the device buffer
+        self._stopping = False
+        self._decoded = {}     # path -> (mtime, pcm), for cue files such as beep.wav
+        self._thread = None
+
+        # Counters
+        self.underruns = 0
+        self.sink_errors = 0
+        self.sounds_played = 0
+        self.sounds_cancelled = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="audio-output", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Cancel everything queued, stop the player thread and close the sink"""
+        with self._cond:
+            self._stopping = True
+            for channel in CHANNELS:
+                self._cancel_channel(channel)
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.sink.close()
+
+    def play_pcm(self, pcm, rate, channels=1, channel=SPEECH, label=None):
+        """Queue 16-bit PCM; returns the Sound"""
+        pcm = resample(to_mono(pcm, channels), rate, self.rate)
+        sound = Sound(pcm, channel, label)
+        with self._cond:
+            if self._stopping:
+                sound.cancelled = True
+                sound.done.set()
+                return sound
+            self._channels[channel].append(sound)
+            self._cond.notify()
+        return sound
+
+    def play_wav(self, wav_data, channel=SPEECH, label=None):
+        pcm, rate, channels = read_wav(wav_data)
+        return self.play_pcm(pcm, rate, channels, channel, label)
+
+    def play_file(self, path, channel=SPEECH):
+        """Queue a WAV file. The decoded audio is kept while the file is unchanged."""
+        mtime = os.path.getmtime(path)
+        cached = self._decoded.get(path)
+        if cached is None or cached[0] != mtime:
+            pcm, rate, channels = read_wav(path)
+            cached = (mtime, resample(to_mono(pcm, channels), rate, self.rate))
+            self._decoded[path] = cached
+        return self.play_pcm(cached[1], self.rate, 1, channel, label=path)
+
+    def cancel(self, sound):
+        """Stop a sound, queued or playing. Safe to call from any thread and more than once."""
+        with self._cond:
+            queue = self._channels[sound.channel]
+            if sound in queue:
+                if queue[0] is sound and sound.position > 0:
+                    self._discard = True
+                queue.remove(sound)
+                self._finish(sound, cancelled=True)
+            self._cond.notify()
+
+    def _cancel_channel(self, channel):
+        queue = self._channels[channel]
+        if queue and queue[0].position > 0:
+            self._discard = True
+        while queue:
+            self._finish(queue.popleft(), cancelled=True)
+
+    def _finish(self, sound, cancelled=False):
+        sound.cancelled = cancelled
+        if cancelled:
+            self.sounds_cancelled += 1
+        else:
+            self.sounds_played += 1
+        sound.done.set()
+
+    def _take(self, channel, finished):
+        """Up to one period of the channel's audio, moving on to its next sound when one ends"""
+        queue = self._channels[channel]
+        chunk = b""
+        while queue and len(chunk) < self.period_bytes:
+            sound = queue[0]
+            piece = sound.pcm[sound.position:sound.position + self.period_bytes - len(chunk)]
+            sound.position += len(piece)
+            chunk += piece
+            if sound.position >= len(sound.pcm):
+                finished.append(queue.popleft())
+        return chunk
+
+    def _run(self):
+        finished = []  # Written to the device, signalled once the device has played them
+        playing = False
+        period = b''
+        while True:
+            with self._cond:
+                busy = any(self._channels.values())
+                if not busy and not finished and not playing:
+                    if self._stopping:
+                        break
+                    self._cond.wait()
+                    continue
+                discard, self._discard = self._discard, False
+                if busy:
+                    speech = self._take(SPEECH, finished)
+                    cue = self._take(CUE, finished)
+                    if speech and cue:
+                        period = mix(speech, cue, self.cue_gain)
+                    else:
+                        period = speech or cue
+
+            try:
+                if discard:
+                    self.sink.abort()
+                if not busy:
+                    # Nothing left to play: let the device empty, then report the sounds as played
+                    self.sink.drain()
+                    playing = False
+                    with self._cond:
+                        for sound in finished:
+                            self._finish(sound)
+                    finished = []
+                    continue
+
+                playing = True
+                if self.sink.write(period):
+                    self.underruns += 1
+            except Exception as e:
+                # Waiters must not hang on a device error: drop everything and keep the thread alive
+                print(f"[Audio output error, queued sounds dropped: {e}]")
+                self.sink_errors += 1
+                playing = False
+                with self._cond:
+                    for sound in finished:
+                        self._finish(sound, cancelled=True)
+                    finished = []
+                    for channel in CHANNELS:
+                        self._cancel_channel(channel)
+                    self._discard = False
+                try:
+                    self.sink.abort()
+                except Exception as e:
+                    print(f"[Audio output reset failed: {e}]")
+                continue
+            with self._cond:
+                if finished and any(self._channels.values()):
+                    # The next sound is already being written right behind them
+                    for sound in finished:
+                        self._finish(sound)
+                    finished = []
+
+    def stats(self):
+        return {
+            'device': self.sink.name,
+            'rate': self.rate,
+            'underruns': self.underruns,
+            'sink_errors': self.sink_errors,
+            'sounds_played': self.sounds_played,
+            'sounds_cancelled': self.sounds_cancelled,
+        }
@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+End-to-end latency benchmark for the voice assistant.
+
+Runs the real main() loop (Vosk wake word and STT, endpointing, intents, LLM
+streaming, sentence segmentation) with the edges replaced:
+  - the microphone replays WAV utterances in real time,
+  - the RKLLM server is fake_rkllm_server.py with a configurable token rate,
+  - Piper and aplay are simulated with configurable synthesis and audio durations.
+
+Each turn is timed per stage and the percentiles are written as JSON, so
+results can be compared between commits:
+  wake_to_beep                end of the wake word in the audio -> beep starts
+  speech_end_to_command       end of the command in the audio -> command text recognized
+  command_to_first_token      command recognized -> first LLM token received
+  first_token_to_first_audio  first LLM token -> first answer audio starts
+  command_to_first_audio      command recognized -> first answer audio starts (any intent)
+
+Usage:
+    python3 benchmark_latency.py utterances/*.wav
+    python3 benchmark_latency.py --wake-wav hola.wav commands/*.wav --tokens-per-second 6
+    python3 benchmark_latency.py utterances/*.wav --baseline latency_baseline.json
+
+WAV files must be 16 kHz, 16-bit mono. Without --wake-wav each file holds
+the wake word, a short pause and the command. Needs the Vosk model.
+"""
+import argparse
+import io
+import json
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+import wave
+
+from turn_trace import percentile
+from vad import VoiceActivityDetector
+
+SAMPLE_RATE = 16000
+FRAMES_PER_BUFFER = 2048
+BLOCK_SECONDS = FRAMES_PER_BUFFER / SAMPLE_RATE
+# Silence between two speech regions that separates the wake word from the command
+SEGMENT_GAP = 0.3
+
+STAGES = [
+    ('wake_to_beep', 'wake_end', 'beep'),
+    ('speech_end_to_command', 'speech_end', 'command'),
+    ('command_to_first_token', 'command', 'first_token'),
+    ('first_token_to_first_audio', 'first_token', 'first_audio'),
+    ('command_to_first_audio', 'command', 'first_audio'),
+]
+
+def read_pcm(path):
+    with wave.open(path, 'rb') as wav_file:
+        if (wav_file.getframerate(), wav_file.getsampwidth(), wav_file.getnchannels()) != (SAMPLE_RATE, 2, 1):
+            raise ValueError(f"{path} must be 16 kHz 16-bit mono "
+                             f"(convert with: sox in.wav -r 16000 -b 16 -c 1 out.wav)")
+        return wav_file.readframes(wav_file.getnframes())
+
+def speech_regions(pcm):
+    """Return [(start_block, end_block)] of speech, merging gaps shorter than SEGMENT_GAP"""
+    vad = VoiceActivityDetector()
+    block_bytes = FRAMES_PER_BUFFER * 2
+    regions = []
+    max_gap = int(SEGMENT_GAP / BLOCK_SECONDS)
+    for index in range(0, len(pcm) // block_bytes):
+        if not vad.is_speech(pcm[index * block_bytes:(index + 1) * block_bytes]):
+            continue
+        if regions and index - regions[-1][1] <= max_gap:
+            regions[-1][1] = index + 1
+        else:
+            regions.append([index, index + 1])
+    return regions
+
+class Utterance:
+    def __init__(self, name, pcm, wake_end, speech_end):
+        self.name = name
+        self.pcm = pcm
+        self.wake_end = wake_end      # Byte offsets where the wake word and the command end
+        self.speech_end = speech_end
+
+def load_utterances(paths, wake_wav=None, pause=0.5):
+    block_bytes = FRAMES_PER_BUFFER * 2
+    utterances = []
+    wake_pcm = read_pcm(wake_wav) if wake_wav else None
+    for path in paths:
+        pcm = read_pcm(path)
+        if wake_pcm is not None:
+            wake_regions = speech_regions(wake_pcm)
+            wake_end = wake_regions[-1][1] * block_bytes if wake_regions else len(wake_pcm)
+            silence = b"\0\0" * int(pause * SAMPLE_RATE)
+            command_start = len(wake_pcm) + len(silence)
+            regions = speech_regions(pcm)
+            speech_end = command_start + (regions[-1][1] * block_bytes if regions else len(pcm))
+            pcm = wake_pcm + silence + pcm
+        else:
+            regions = speech_regions(pcm)
+            if len(regions) < 2:
+                print(f"[Warning: {path}: could not find a pause between wake word and command, skipped]")
+                continue
+            wake_end = regions[0][1] * block_bytes
+            speech_end = regions[-1][1] * block_bytes
+        utterances.append(Utterance(os.path.basename(path), pcm, wake_end, speech_end))
+    return utterances
+
+class TurnRecorder:
+    """Collect the monotonic timestamps of the turn in progress"""
+
+    def __init__(self):
+        self.turns = []
+        self.current = None
+        self.turn_done = threading.Event()
+        self._lock = threading.Lock()
+
+    def start_turn(self, name):
+        with self._lock:
+            self.current = {'utterance': name}
+            self.turns.append(self.current)
+            self.turn_done.clear()
+
+    def mark(self, event, value=None, overwrite=False):
+        with self._lock:
+            if self.current is None or (event in self.current and not overwrite):
+                return
+            self.current[event] = value if value is not None else time.monotonic()
+
+    def end_turn(self):
+        self.mark('turn_end')
+        self.turn_done.set()
+
+class ReplayCapture:
+    """Stands in for AudioCapture: feeds WAV utterances in real time, then silence"""
+
+    def __init__(self, utterances, recorder, gap=2.0, turn_timeout=30.0):
+        self.utterances = utterances
+        self.recorder = recorder
+        self.gap = gap
+        self.turn_timeout = turn_timeout
+        self.ready = threading.Event()  # Set when main() is listening (startup beep)
+        self._blocks = queue.Queue()
+        self._finished = False
+        self._stopped = threading.Event()
+        self.block_bytes = FRAMES_PER_BUFFER * 2
+
+    def start(self):
+        threading.Thread(target=self._feed, daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _feed(self):
+        silence = b"\0" * self.block_bytes
+        self.ready.wait()
+        next_time = time.monotonic()
+
+        def push(block):
+            nonlocal next_time
+            next_time += BLOCK_SECONDS
+            time.sleep(max(0.0, next_time - time.monotonic()))
+            self._blocks.put(block)
+
+        def push_silence(seconds, until=None):
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline and not self._stopped.is_set():
+                if until is not None and until.is_set():
+                    return True
+                push(silence)
+            return False
+
+        push_silence(self.gap)
+        for utterance in self.utterances:
+            if self._stopped.is_set():
+                break
+            self.recorder.start_turn(utterance.name)
+            pcm = utterance.pcm + b"\0" * (-len(utterance.pcm) % self.block_bytes)
+            for offset in range(0, len(pcm), self.block_bytes):
+                push(pcm[offset:offset + self.block_bytes])
+                end = offset + self.block_bytes
+                if end >= utterance.wake_end:
+                    self.recorder.mark('wake_end')
+                if end >= utterance.speech_end:
+                    self.recorder.mark('speech_end')
+            if not push_silence(self.turn_timeout, until=self.recorder.turn_done):
+                self.recorder.mark('timed_out', True)
+                print(f"[Benchmark: turn for {utterance.name} did not finish]")
+            push_silence(self.gap)
+        self._finished = True
+
+    def read(self, timeout=None):
+        try:
+            return self._blocks.get(timeout=timeout)
+        except queue.Empty:
+            if self._finished:
+                raise KeyboardInterrupt  # Ends main() through its normal shutdown path
+            return None
+
+    def pending_blocks(self):
+        return self._blocks.qsize()
+
+    def skip_to_latest(self):
+        try:
+            while True:
+                self._blocks.get_nowait()
+        except queue.Empty:
+            pass
+
+    def preroll(self, seconds):
+        return b""
+
+    def stats(self):
+        return {'input_overflows': 0, 'dropped_blocks': 0,
+                'pending_blocks': self.pending_blocks(), 'capacity_blocks': 0}
+
+def make_wav(seconds, rate=22050):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(rate)
+        wav_file.writeframes(b"\0\0" * int(seconds * rate))
+    return buffer.getvalue()
+
+def wav_duration(data):
+    with wave.open(io.BytesIO(data), 'rb') as wav_file:
+        return wav_file.getnframes() / wav_file.getframerate()
+
+class FakeTTSEngine:
+    """Stands in for PiperTTSEngine: sleeps like Piper and writes silent WAVs of speech length"""
+
+    def __init__(self, output_dir, latency=0.15, seconds_per_char=0.003,
+                 speech_chars_per_second=15.0):
+        self.model = os.path.join(output_dir, "fake-voice.onnx")
+        self.output_dir = output_dir
+        self.latency = latency
+        self.seconds_per_char = seconds_per_char
+        self.speech_chars_per_second = speech_chars_per_second
+        self.restarts = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        pass
+
+    def is_alive(self):
+        return True
+
+    def ensure_running(self):
+        return True
+
+    def restart(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+    def synthesize(self, text):
+        time.sleep(self.latency + self.seconds_per_char * len(text))
+        with self._lock:
+            self._count += 1
+            path = os.path.join(self.output_dir, f"segment_{self._count}.wav")
+        with open(path, 'wb') as f:
+            f.write(make_wav(len(text) / self.speech_chars_per_second))
+        return path
+
+def make_fake_playback(base_class, recorder, scale):
+    """PlaybackControl subclass that sleeps for the audio duration instead of playing it"""
+
+    class FakePlayback(base_class):
+        record = False  # Only the answer's player marks first_audio (not the Thinking cue)
+
+        def play(self, source, wait=True):
+            if self.interrupted.is_set():
+                return None
+            is_file = not isinstance(source, (bytes, bytearray))
+            if self.record:
+                recorder.mark('beep' if is_file and os.path.basename(source) == "beep.wav" else 'first_audio')
+            if is_file:
+                with open(source, 'rb') as f:
+                    source = f.read()
+            self.interrupted.wait(wav_duration(source) * scale)
+            return None if self.interrupted.is_set() else True
+
+    return FakePlayback
+
+def summarize(turns):
+    stages = {}
+    for name, start, end in STAGES:
+        values = [1000.0 * (turn[end] - turn[start]) for turn in turns
+                  if start in turn and end in turn]
+        stages[name] = {'count': len(values)}
+        for key, p in (('p50_ms', 50), ('p90_ms', 90), ('p95_ms', 95), ('max_ms', 100)):
+            value = percentile(values, p)
+            stages[name][key] = round(value, 1) if value is not None else None
+    return stages
+
+def turn_report(turn):
+    report = {'utterance': turn['utterance'], 'command_text': turn.get('command_text'),
+              'timed_out': turn.get('timed_out', False)}
+    for name, start, end in STAGES:
+        if start in turn and end in turn:
+            report[f"{name}_ms"] = round(1000.0 * (turn[end] - turn[start]), 1)
+    return report
+
+def compare_to_baseline(stages, baseline_path, tolerance):
+    """Return the stages whose p95 is worse than the baseline by more than tolerance"""
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f)['stages']
+    regressions = []
+    for name, stats in stages.items():
+        old = baseline.get(name, {}).get('p95_ms')
+        new = stats['p95_ms']
+        if old is not None and new is not None and new > old * (1.0 + tolerance):
+            regressions.append(f"{name}: p95 {new:.0f} ms vs {old:.0f} ms baseline")
+    return regressions
+
+def install_fakes(assistant, capture, recorder, server_url, tts_engine, playback_scale):
+    """Replace the hardware and network edges of main_assistant with the benchmark fakes"""
+    from audio_cache import AudioCache
+    from audio_output import AudioOutput, NullSink
+
+    class DummyPyAudio:
+        def terminate(self):
+            pass
+
+    assistant.pyaudio = types.SimpleNamespace(PyAudio=DummyPyAudio)
+    assistant.AudioCapture = lambda *args, **kwargs: capture
+    assistant.tts_engine = tts_engine
+
+    def open_speaker():
+        assistant.audio_output = AudioOutput(NullSink(realtime=False)).start()
+    assistant.open_speaker = open_speaker
+    assistant.audio_cache = AudioCache(tts_engine, cache_dir=os.path.join(tts_engine.output_dir, "cache"))
+
+    fake_playback = make_fake_playback(assistant.PlaybackControl, recorder, playback_scale)
+    assistant.PlaybackControl = fake_playback
+    assistant.playback = fake_playback()
+    assistant.playback.record = True
+
+    original_play_audio = assistant.play_audio
+
+    def play_audio(filename):
+        if filename == "beep.wav" and recorder.current is None:
+            capture.ready.set()  # Startup beep: main() is listening
+        original_play_audio(filename)
+    assistant.play_audio = play_audio
+
+    original_end_turn = assistant.tracer.end_turn
+
+    def end_turn(outcome):
+        original_end_turn(outcome)
+        recorder.end_turn()  # Every way a turn of main() ends goes through the tracer
+    assistant.tracer.end_turn = end_turn
+
+    original_intents = assistant.process_local_intents
+
+    def process_local_intents(text):
+        recorder.mark('command')
+        recorder.mark('command_text', text)
+        return original_intents(text)
+    assistant.process_local_intents = process_local_intents
+
+    class BenchmarkRKLLMClient(assistant.RKLLMClient):
+        def __init__(self, *args, **kwargs):
+            kwargs['url'] = server_url
+            super().__init__(*args, **kwargs)
+
+        def chat_events(self, *args, **kwargs):
+            for event in super().chat_events(*args, **kwargs):
+                if event.text:
+                    recorder.mark('first_token')
+                yield event
+    assistant.RKLLMClient = BenchmarkRKLLMClient
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end latency benchmark")
+    parser.add_argument("wavs", nargs="+", help="16 kHz mono WAV utterances")
+    parser.add_argument("--wake-wav", help="Wake word recording played before each command WAV")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the utterance list this many times")
+    parser.add_argument("--tokens-per-second", type=float, default=8.0)
+    parser.add_argument("--first-token-delay", type=float, default=0.4,
+                        help="Seconds the fake server waits before the first token (prefill)")
+    parser.add_argument("--reply", default=None, help="Text the fake LLM answers")
+    parser.add_argument("--tts-latency", type=float, default=0.15,
+                        help="Seconds of fixed cost per synthesized segment")
+    parser.add_argument("--tts-seconds-per-char", type=float, default=0.003)
+    parser.add_argument("--playback-scale", type=float, default=1.0,
+                        help="Fraction of the audio duration the fake player waits (0 = instant)")
+    parser.add_argument("--gap", type=float, default=2.5, help="Seconds of silence between turns")
+    parser.add_argument("--turn-timeout", type=float, default=30.0)
+    parser.add_argument("--vosk-model", help="Path of the Vosk model (default: main_assistant.VOSK_MODEL_PATH)")
+    parser.add_argument("--llm-cache", action="store_true", help="Keep the LLM response cache enabled")
+    parser.add_argument("--output", default="latency_results.json")
+    parser.add_argument("--baseline", help="Previous results; exit with status 1 if a stage p95 regressed")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed p95 increase over the baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    import main_assistant
+    from fake_rkllm_server import DEFAULT_REPLY, FakeRKLLMServer
+
+    utterances = load_utterances(args.wavs, args.wake_wav) * args.repeat
+    if not utterances:
+        print("No usable utterances.")
+        sys.exit(2)
+
+    server = FakeRKLLMServer(reply=args.reply or DEFAULT_REPLY, tokens_per_second=args.tokens_per_second,
+                             first_token_delay=args.first_token_delay)
+    server_url = server.start()
+    work_dir = tempfile.mkdtemp(prefix="assistant_bench_")
+    recorder = TurnRecorder()
+    capture = ReplayCapture(utterances, recorder, gap=args.gap, turn_timeout=args.turn_timeout)
+    tts_engine = FakeTTSEngine(work_dir, latency=args.tts_latency,
+                               seconds_per_char=args.tts_seconds_per_char)
+    install_fakes(main_assistant, capture, recorder, server_url, tts_engine, args.playback_scale)
+    main_assistant.LLM_CACHE_ENABLED = args.llm_cache
+    main_assistant.TURN_TRACE_ENABLED = False  # Keep benchmark turns out of the production metrics
+    if args.vosk_model:
+        main_assistant.VOSK_MODEL_PATH = args.vosk_model
+
+    try:
+        main_assistant.main()
+    finally:
+        capture.stop()
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    stages = summarize(recorder.turns)
+    results = {
+        'settings': {
+            'utterances': len(utterances),
+            'tokens_per_second': args.tokens_per_second,
+            'first_token_delay': args.first_token_delay,
+            'tts_latency': args.tts_latency,
+            'tts_seconds_per_char': args.tts_seconds_per_char,
+        },
+        'stages': stages,
+        'turns': [turn_report(turn) for turn in recorder.turns],
+        'timed_out': sum(1 for turn in recorder.turns if turn.get('timed_out')),
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\n{'stage':<28} {'n':>3} {'p50 ms':>8} {'p90 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for name, stats in stages.items():
+        cells = [f"{stats[key]:8.0f}" if stats[key] is not None else f"{'-':>8}"
+                 for key in ('p50_ms', 'p90_ms', 'p95_ms', 'max_ms')]
+        print(f"{name:<28} {stats['count']:>3} " + " ".join(cells))
+    print(f"{results['timed_out']} of {len(recorder.turns)} turns timed out. Results written to {args.output}")
+
+    if args.baseline:
+        regressions = compare_to_baseline(stages, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,26 @@
 import os
-import json
 import subprocess
 import sys
 import signal
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
 
+from config_reload import signal_assistant
+from config_store import load_config, save_config
+from device_inventory import DeviceInventory
+from turn_trace import read_turns, summarize
+
 app = Flask(__name__)
 app.secret_key = 'supersecretkey'  # Required for flash messages
-CONFIG_FILE = 'config.json'
 
 # Flag to request restart after saving config
 restart_requested = False
 
-def load_config():
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            pass
-    return {}
-
-def save_config(config):
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(config, f, indent=4)
+# Shown when a device probe fails and nothing better is known
+DEFAULT_INPUT_DEVICES = [{'index': 0, 'name': 'Default Device'}]
+DEFAULT_OUTPUT_CARDS = [{'card_id': '0', 'name': 'Default Card 0'}]
 
-def get_audio_inputs():
+def get_audio_inputs(strict=False):
+    """strict: raise when the probe fails instead of returning the default device"""
     inputs = []
     try:
         import pyaudio
@@ -38,11 +33,14 @@ def get_audio_inputs():
                 inputs.append({'index': i, 'name': name})
         p.terminate()
     except Exception as e:
+        if strict:
+            raise
         print(f"Error getting audio inputs: {e}")
-        inputs.append({'index': 0, 'name': 'Default Device'})
+        inputs.extend(dict(device) for device in DEFAULT_INPUT_DEVICES)
     return inputs
 
-def get_audio_outputs():
+def get_audio_outputs(strict=False):
+    """strict: raise when aplay fails instead of returning the default card"""
     outputs = []
     # Using aplay -l to list hardware cards
     try:
@@ -58,15 +56,20 @@ def get_audio_outputs():
                 full_name = f"Card {card_id}: {name}"
                 outputs.append({'card_id': card_id, 'name': full_name})
     except Exception as e:
+        if strict:
+            raise
         print(f"Error getting audio outputs: {e}")
-        outputs.append({'card_id': '0', 'name': 'Default Card 0'})
+        outputs.extend(dict(card) for card in DEFAULT_OUTPUT_CARDS)
     return outputs
 
-def get_wifi_interfaces():
+def get_wifi_interfaces(strict=False):
+    """strict: raise when nmcli fails instead of returning an empty list"""
     interfaces = []
     try:
         # Using nmcli to list devices
         result = subprocess.run(['nmcli', '-t', '-f', 'DEVICE,TYPE', 'device'], capture_output=True, text=True)
+        if strict and result.returncode != 0:
+            raise RuntimeError(f"nmcli exited with {result.returncode}: {result.stderr.strip()}")
         if result.returncode == 0:
             for line in result.stdout.split('\n'):
                 if line.strip():
@@ -74,6 +77,8 @@ def get_wifi_interfaces():
                     if len(parts) >= 2 and parts[1] == 'wifi':
                         interfaces.append(parts[0])
     except Exception as e:
+        if strict:
+            raise
         print(f"Error getting wifi interfaces: {e}")
     
     return interfaces
@@ -120,17 +125,29 @@ def connect_wifi(ssid, password):
     except Exception as e:
         return False, str(e)
 
+# Strict probes: a failed scan keeps the devices the last good one found
+DEVICE_PROBES = {
+    'input_devices': lambda: get_audio_inputs(strict=True),
+    'output_cards': lambda: get_audio_outputs(strict=True),
+    'wifi_interfaces': lambda: get_wifi_interfaces(strict=True),
+}
+DEVICE_FALLBACKS = {
+    'input_devices': DEFAULT_INPUT_DEVICES,
+    'output_cards': DEFAULT_OUTPUT_CARDS,
+}
+
+# Probed once and refreshed in the background, so pages are served from memory
+device_inventory = DeviceInventory(DEVICE_PROBES, fallbacks=DEVICE_FALLBACKS)
+
 @app.route('/')
 def index():
     config = load_config()
-    input_devices = get_audio_inputs()
-    output_cards = get_audio_outputs()
-    wifi_interfaces = get_wifi_interfaces()
+    devices = device_inventory.get()
     return render_template('index.html', 
                          config=config, 
-                         input_devices=input_devices,
-                         output_cards=output_cards,
-                         wifi_interfaces=wifi_interfaces)
+                         input_devices=devices['input_devices'],
+                         output_cards=devices['output_cards'],
+                         wifi_interfaces=devices['wifi_interfaces'])
 
 @app.route('/save', methods=['POST'])
 def save():
@@ -158,6 +175,9 @@ def save():
     config['openweathermap_key'] = request.form.get('openweathermap_key')
     config['location_city'] = request.form.get('location_city')
     config['language'] = request.form.get('language', 'es')
+    # Unchecked checkboxes are not submitted
+    config['inline_command_beep'] = request.form.get('inline_command_beep') == 'on'
+    config['wake_phrase'] = request.form.get('wake_phrase')
     
     save_config(config)
     
@@ -172,6 +192,11 @@ def save():
             flash(wifi_message, 'danger')
             return redirect(url_for('index'))
     
+    # A running assistant applies the new settings in place, without a restart
+    if signal_assistant():
+        flash('Configuration saved and applied to the running assistant.', 'success')
+        return redirect(url_for('index'))
+
     # Configuration saved successfully - request restart
     restart_requested = True
     flash('Configuration saved successfully. Restarting assistant...', 'success')
@@ -197,6 +222,24 @@ def scan_wifi():
     networks = scan_wifi_networks(interface)
     return jsonify({'networks': networks})
 
+@app.route('/devices')
+def devices():
+    return jsonify({'devices': device_inventory.get(), 'stats': device_inventory.stats()})
+
+@app.route('/rescan_devices', methods=['POST'])
+def rescan_devices():
+    # Explicit rescan, e.g. after plugging in a USB microphone
+    return jsonify({'devices': device_inventory.rescan(), 'stats': device_inventory.stats()})
+
+@app.route('/metrics')
+def metrics():
+    # Aggregated turn timings from the assistant's trace; ?last=N limits it to the latest turns
+    turns = read_turns()
+    last = request.args.get('last', type=int)
+    if last:
+        turns = turns[-last:]
+    return jsonify(summarize(turns))
+
 @app.route('/shutdown')
 def shutdown_page():
     return '''
@@ -0,0 +1,85 @@
+"""
+Live configuration reload for the running assistant.
+
+config.json is watched through the shared config store (a throttled stat of
+the file); SIGHUP makes the next check immediate. A change is applied by
+the handlers registered for the keys it touches, so only what depends on a
+changed setting is rebuilt. The assistant polls between turns, never while
+it is answering.
+
+The assistant writes its PID to ASSISTANT_PID_FILE, so config_app can send
+it SIGHUP after saving instead of restarting everything.
+"""
+import os
+import signal
+
+from config_store import get_config, invalidate_config
+
+# Written while the assistant runs, read by config_app
+ASSISTANT_PID_FILE = "assistant.pid"
+
+class ConfigReloader:
+    def __init__(self):
+        self._applied = get_config()
+        self._handlers = []  # (keys, handler, name)
+
+        # Counters
+        self.reloads = 0
+        self.failures = 0
+
+    def on(self, keys, handler, name=None):
+        """Call handler(config) when any of keys changed"""
+        self._handlers.append((tuple(keys), handler, name or keys[0]))
+
+    def install_signal(self, signum=signal.SIGHUP):
+        """Check the file right away when signum arrives (main thread only)"""
+        signal.signal(signum, lambda signum, frame: invalidate_config())
+
+    def poll(self):
+        """Apply the changes made since the last call; returns the changed keys"""
+        config = get_config()
+        if config is self._applied:
+            return []
+        previous, self._applied = self._applied, config
+        changed = sorted(key for key in set(config) | set(previous)
+                         if config.get(key) != previous.get(key))
+        if not changed:
+            return []
+        print(f"Configuration changed: {', '.join(changed)}")
+        for keys, handler, name in self._handlers:
+            if any(key in changed for key in keys):
+                try:
+                    handler(config)
+                except Exception as e:
+                    # Keep running with the old resource; the next change retries
+                    self.failures += 1
+                    print(f"[Could not apply the new {name} setting: {e}]")
+        self.reloads += 1
+        return changed
+
+def write_pid_file(path=ASSISTANT_PID_FILE):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(str(os.getpid()))
+
+def remove_pid_file(path=ASSISTANT_PID_FILE):
+    try:
+        with open(path, encoding='utf-8') as f:
+            if int(f.read().strip()) != os.getpid():
+                return  # Another assistant took over
+        os.remove(path)
+    except (OSError, ValueError):
+        pass
+
+def signal_assistant(path=ASSISTANT_PID_FILE, signum=signal.SIGHUP):
+    """Ask a running assistant to reload its config; False if none is running"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            pid = int(f.read().strip())
+        # A stale file may name another process, which SIGHUP would kill
+        with open(f"/proc/{pid}/cmdline", 'rb') as f:
+            if b"main_assistant" not in f.read():
+                return False
+        os.kill(pid, signum)
+    except (OSError, ValueError):
+        return False
+    return True
@@ -0,0 +1,206 @@
+"""
+Shared configuration layer for the assistant, the RKLLM client and the web UI.
+
+config.json is parsed once into an in-memory snapshot. The snapshot is
+re-read only when the file's mtime or size changes, and that check itself
+is throttled, so hot paths (every speak/play_audio/intent lookup) do no
+file I/O or JSON parsing.
+"""
+import json
+import os
+import threading
+import time
+
+CONFIG_FILE = "config.json"
+
+# Minimum seconds between two stat() calls on the config file
+CHECK_INTERVAL = 1.0
+
+DEFAULT_RKLLM_API_URL = "http://localhost:8080/"
+SUPPORTED_LANGUAGES = ('es', 'en')
+
+def _optional_str(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+def _device_id(value):
+    """Device ids are stored as ints, but ALSA card names are also accepted"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    value = str(value).strip()
+    if not value:
+        return None
+    return int(value) if value.isdigit() else value
+
+def _str_list(value):
+    if value is None:
+        return None
+    if not isinstance(value, list):
+        raise ValueError("expected a list of strings")
+    return [str(item).strip() for item in value if str(item).strip()]
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        return bool(value)
+    text = str(value).strip().lower()
+    if text in ('true', '1', 'yes', 'on'):
+        return True
+    if text in ('false', '0', 'no', 'off', ''):
+        return False
+    raise ValueError(f"expected true or false, got '{value}'")
+
+def _language(value):
+    value = str(value or 'es').strip().lower()
+    if value not in SUPPORTED_LANGUAGES:
+        raise ValueError(f"unsupported language '{value}'")
+    return value
+
+# key -> (normalizer, default). Keys not listed here are kept untouched.
+SCHEMA = {
+    'wifi_ssid': (_optional_str, None),
+    'audio_input': (_device_id, None),
+    'audio_output': (_device_id, None),
+    'openweathermap_key': (_optional_str, None),
+    'location_city': (_optional_str, None),
+    'language': (_language, 'es'),
+    'rkllm_api_url': (_optional_str, DEFAULT_RKLLM_API_URL),
+    'tts_prewarm_phrases': (_str_list, None),
+    # Beep after the wake word even when the command came in the same utterance
+    'inline_command_beep': (_bool, True),
+    # Overrides WAKE_WORD_PHRASE in main_assistant.py
+    'wake_phrase': (_optional_str, None),
+}
+
+def validate_config(raw):
+    """
+    Normalize a raw config dict against SCHEMA.
+    Returns (config, errors); invalid values are replaced by their default
+    and keys without a value are left out.
+    """
+    errors = []
+    if not isinstance(raw, dict):
+        errors.append("config root is not an object")
+        raw = {}
+
+    config = dict(raw)
+    for key, (normalize, default) in SCHEMA.items():
+        try:
+            value = normalize(raw.get(key, default))
+        except (TypeError, ValueError) as e:
+            errors.append(f"{key}: {e}")
+            value = default
+        if value is None:
+            value = default
+        if value is None:
+            config.pop(key, None)
+        else:
+            config[key] = value
+    return config, errors
+
+class ConfigStore:
+    def __init__(self, path=CONFIG_FILE, check_interval=CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot, _ = validate_config({})
+        self._signature = None
+        self._last_check = None
+        self._lock = threading.Lock()
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _reload(self, signature):
+        raw = {}
+        if signature is not None:
+            try:
+                with open(self.path, 'r') as f:
+                    raw = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[Warning: could not read {self.path}: {e}]")
+                # Keep serving the last good snapshot
+                return
+        config, errors = validate_config(raw)
+        for error in errors:
+            print(f"[Warning: invalid config value, using default. {error}]")
+        self._snapshot = config
+        self._signature = signature
+
+    def snapshot(self):
+        """Return the current config dict. It is shared: do not modify it."""
+        now = time.monotonic()
+        if self._last_check is not None and now - self._last_check < self.check_interval:
+            return self._snapshot
+        with self._lock:
+            self._last_check = now
+            signature = self._file_signature()
+            if signature != self._signature:
+                self._reload(signature)
+        return self._snapshot
+
+    def load(self):
+        """Return a private copy of the config that the caller may modify"""
+        return dict(self.snapshot())
+
+    def save(self, config):
+        """Write the config atomically and refresh the snapshot"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(config, f, indent=4)
+        os.replace(tmp_path, self.path)
+        with self._lock:
+            self._last_check = time.monotonic()
+            self._reload(self._file_signature())
+
+    def invalidate(self):
+        """Force the next access to check the file again"""
+        self._last_check = None
+
+_store = ConfigStore()
+
+def load_config():
+    return _store.load()
+
+def save_config(config):
+    _store.save(config)
+
+def get_config():
+    return _store.snapshot()
+
+def invalidate_config():
+    _store.invalidate()
+
+def get_language():
+    return get_config()['language']
+
+def get_audio_input_index():
+    value = get_config().get('audio_input')
+    return value if isinstance(value, int) else None
+
+def get_audio_output_card():
+    return get_config().get('audio_output')
+
+def get_rkllm_api_url():
+    return get_config()['rkllm_api_url']
+
+def get_inline_command_beep():
+    return get_config()['inline_command_beep']
+
+def get_wake_phrase():
+    """The configured wake phrase, or None for the built-in one"""
+    phrase = get_config().get('wake_phrase')
+    return phrase.lower() if phrase else None
+
+def get_weather_settings():
+    """Return (api_key, city); either may be None"""
+    config = get_config()
+    return config.get('openweathermap_key'), config.get('location_city')
@@ -0,0 +1,138 @@
+"""
+Bounded conversation history for the RKLLM client.
+
+Only a sliding window of recent exchanges that fits a token budget is sent
+with each request, so prefill time on the server stays flat in sessions
+that run for days. Turns that fall out of the window can optionally be
+compacted into a short summary, and the history resets itself after a
+period of inactivity.
+"""
+import time
+
+# Approximate token budget for the history sent with each request
+HISTORY_MAX_TOKENS = 1024
+# Seconds of inactivity after which the conversation starts over (None disables)
+HISTORY_IDLE_RESET = 600.0
+# Characters kept from each turn in the compacted summary
+SUMMARY_CHARS_PER_TURN = 80
+# Maximum characters of the compacted summary
+SUMMARY_MAX_CHARS = 600
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token for Spanish and English)"""
+    return len(text) // 4 + 1
+
+def content_to_string(content):
+    """Flatten the Gradio message content formats into a plain string"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        # If it's the complex format [{'text': '...', 'type': 'text'}]
+        if len(content) > 0 and isinstance(content[0], dict) and 'text' in content[0]:
+            return content[0]['text']
+        return " ".join([str(c) for c in content])
+    return str(content)
+
+def simple_summary(messages, previous_summary=""):
+    """Compact old turns by keeping the start of each one"""
+    parts = previous_summary.split(" | ") if previous_summary else []
+    for message in messages:
+        text = " ".join(message['content'].replace("|", "/").split())
+        if len(text) > SUMMARY_CHARS_PER_TURN:
+            text = text[:SUMMARY_CHARS_PER_TURN].rsplit(" ", 1)[0] + "..."
+        parts.append(f"{message['role']}: {text}")
+    # Keep the most recent turns when the summary grows too long
+    while len(parts) > 1 and len(" | ".join(parts)) > SUMMARY_MAX_CHARS:
+        parts.pop(0)
+    return " | ".join(parts)[-SUMMARY_MAX_CHARS:]
+
+class ConversationHistory:
+    def __init__(self, max_tokens=HISTORY_MAX_TOKENS, idle_reset=HISTORY_IDLE_RESET,
+                 summarizer=None):
+        """
+        summarizer, if given, is called as summarizer(dropped_messages, previous_summary)
+        and returns the new summary text (see simple_summary).
+        """
+        self.max_tokens = max_tokens
+        self.idle_reset = idle_reset
+        self.summarizer = summarizer
+        self.messages = []  # [{'role': ..., 'content': str}], oldest first
+        self.summary = ""
+        self.last_activity = time.monotonic()
+
+    def clear(self):
+        self.messages = []
+        self.summary = ""
+
+    def _tokens(self, message):
+        return estimate_tokens(message['content']) + 4  # Role and formatting overhead
+
+    def check_idle(self):
+        """Start over if the conversation has been idle for too long. Returns True if it was reset."""
+        now = time.monotonic()
+        idle = now - self.last_activity
+        self.last_activity = now
+        if self.idle_reset is not None and idle > self.idle_reset and (self.messages or self.summary):
+            self.clear()
+            return True
+        return False
+
+    def add(self, role, content):
+        self.messages.append({"role": role, "content": content_to_string(content)})
+        self.last_activity = time.monotonic()
+
+    def add_exchange(self, user_message, answer):
+        self.add("user", user_message)
+        self.add("assistant", answer)
+        self._enforce_budget()
+
+    def remove_last_exchange(self, user_message):
+        """Take back the latest exchange if it answered user_message (an answer never used)"""
+        if (len(self.messages) >= 2 and self.messages[-1]['role'] == 'assistant'
+                and self.messages[-2] == {"role": "user", "content": user_message}):
+            del self.messages[-2:]
+            return True
+        return False
+
+    def _enforce_budget(self):
+        """Drop (and optionally compact) the oldest turns that exceed the budget"""
+        total = sum(self._tokens(m) for m in self.messages)
+        dropped = []
+        # Always keep the latest exchange
+        while total > self.max_tokens and len(self.messages) > 2:
+            message = self.messages.pop(0)
+            total -= self._tokens(message)
+            dropped.append(message)
+        # Do not leave an assistant reply without the question that started it
+        while self.messages and self.messages[0]['role'] == 'assistant' and len(self.messages) > 2:
+            dropped.append(self.messages.pop(0))
+        if dropped and self.summarizer:
+            self.summary = self.summarizer(dropped, self.summary)
+
+    def window(self, reserve_tokens=0):
+        """
+        Return the messages to send, newest last, fitting the budget minus
+        reserve_tokens (system prompt and the new user message).
+        """
+        budget = self.max_tokens - reserve_tokens
+        selected = []
+        used = 0
+        if self.summary:
+            summary_message = {"role": "system",
+                               "content": f"Summary of the earlier conversation: {self.summary}"}
+            used += self._tokens(summary_message)
+        for message in reversed(self.messages):
+            cost = self._tokens(message)
+            if used + cost > budget:
+                break
+            selected.append(dict(message))
+            used += cost
+        selected.reverse()
+        if selected and selected[0]['role'] == 'assistant':
+            selected.pop(0)
+        if self.summary:
+            selected.insert(0, summary_message)
+        return selected
+
+    def __len__(self):
+        return len(self.messages)
@@ -0,0 +1,130 @@
+"""
+Cached inventory of the audio devices and WiFi interfaces for the config UI.
+
+Probing is slow (PyAudio enumerates every ALSA device, aplay and nmcli are
+subprocesses) and can get in the way of the running assistant's audio, so
+it is done once and the pages are served from memory. A background thread
+scans again when a device node appears or disappears, and every
+DEVICE_REFRESH_INTERVAL seconds in case something changed unnoticed.
+rescan() probes on demand.
+"""
+import os
+import threading
+import time
+
+# Seconds between full scans when no hotplug is seen
+DEVICE_REFRESH_INTERVAL = 600.0
+# Seconds between the cheap checks of the directories below
+DEVICE_HOTPLUG_POLL = 2.0
+# Entries appear and disappear here when a sound card or network interface is plugged
+DEVICE_HOTPLUG_PATHS = ('/dev/snd', '/sys/class/net')
+
+class DeviceInventory:
+    def __init__(self, probes, fallbacks=None, refresh_interval=DEVICE_REFRESH_INTERVAL,
+                 hotplug_poll=DEVICE_HOTPLUG_POLL, hotplug_paths=DEVICE_HOTPLUG_PATHS):
+        """
+        probes: dict of name -> function returning that part of the inventory,
+        e.g. {'output_cards': get_audio_outputs}. A probe must raise when it
+        fails, so a transient failure does not replace a good result.
+        fallbacks: dict of name -> value served while that probe has never succeeded
+        (default []).
+        """
+        self.probes = probes
+        self.fallbacks = fallbacks or {}
+        self.refresh_interval = refresh_interval
+        self.hotplug_poll = hotplug_poll
+        self.hotplug_paths = hotplug_paths
+        self._devices = None
+        self._scanned_at = None
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()  # One scan at a time
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Counters
+        self.scans = 0
+        self.hotplug_scans = 0
+        self.served = 0
+        self.probe_ms = {}  # Probe name -> duration of its latest run
+        self.probe_failures = 0
+
+    def _fingerprint(self):
+        entries = []
+        for path in self.hotplug_paths:
+            try:
+                entries.append(tuple(sorted(os.listdir(path))))
+            except OSError:
+                entries.append(None)
+        return tuple(entries)
+
+    def rescan(self):
+        """Probe everything now and return the new inventory"""
+        with self._scan_lock:
+            with self._lock:
+                devices = dict(self._devices or {})
+            for name, probe in self.probes.items():
+                start = time.monotonic()
+                try:
+                    devices[name] = probe()
+                except Exception as e:
+                    # Keep what the previous scan found
+                    print(f"[Device probe {name} failed: {e}]")
+                    self.probe_failures += 1
+                    if name not in devices:
+                        devices[name] = list(self.fallbacks.get(name, []))
+                self.probe_ms[name] = round((time.monotonic() - start) * 1000)
+            with self._lock:
+                self._devices = devices
+                self._scanned_at = time.time()
+                self.scans += 1
+            return dict(devices)
+
+    def get(self):
+        """The cached inventory; the first call scans and starts the background refresh"""
+        self.start()
+        with self._lock:
+            devices = self._devices
+        if devices is None:
+            return self.rescan()
+        with self._lock:
+            self.served += 1
+        return dict(devices)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="device-inventory", daemon=True)
+        self._thread.start()
+
+    def _watch(self):
+        fingerprint = self._fingerprint()
+        last_scan = time.monotonic()
+        while not self._stop.wait(self.hotplug_poll):
+            current = self._fingerprint()
+            if current != fingerprint:
+                fingerprint = current
+                print("Device change detected, rescanning...")
+                self.hotplug_scans += 1
+            elif time.monotonic() - last_scan < self.refresh_interval:
+                continue
+            self.rescan()
+            last_scan = time.monotonic()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def stats(self):
+        with self._lock:
+            scanned_at = self._scanned_at
+        return {
+            'scans': self.scans,
+            'hotplug_scans': self.hotplug_scans,
+            'served': self.served,
+            'scanned_at': scanned_at,
+            'probe_ms': dict(self.probe_ms),
+            'probe_failures': self.probe_failures,
+        }
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the RKLLM Gradio server.
+
+Serves a scripted /get_RKLLM_output endpoint that streams the chat history
+back with a growing assistant message, at a configurable token rate, so the
+clients, tests and benchmarks can run without an NPU board.
+
+Usage:
+    python3 fake_rkllm_server.py --port 8080 --tokens-per-second 8 --first-token-delay 0.5
+"""
+import argparse
+import socket
+import threading
+import time
+
+import gradio as gr
+
+DEFAULT_REPLY = "Hola, soy Kubic, un asistente de IA. Esta es una respuesta de prueba del servidor falso."
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class FakeRKLLMServer:
+    def __init__(self, reply=DEFAULT_REPLY, tokens_per_second=20.0, first_token_delay=0.2,
+                 chars_per_token=4, concurrency_limit=1):
+        """
+        reply is a string or a callable(history) returning the answer text.
+        All settings can be changed while the server runs.
+        """
+        self.reply = reply
+        self.tokens_per_second = tokens_per_second
+        self.first_token_delay = first_token_delay
+        self.chars_per_token = chars_per_token
+        self.concurrency_limit = concurrency_limit
+        self.demo = None
+        self.url = None
+        self._lock = threading.Lock()
+
+        # Counters
+        self.requests = 0
+        self.completed = 0
+        self.tokens = 0     # Updates streamed, over all requests
+        self.active = 0
+        self.max_active = 0
+        self.last_history = None
+
+    def _answer_for(self, history):
+        return self.reply(history) if callable(self.reply) else self.reply
+
+    def get_RKLLM_output(self, history):
+        # Gradio stops pulling from the generator when a job is cancelled, so a
+        # cancelled request shows up as `tokens` no longer growing.
+        with self._lock:
+            self.requests += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.last_history = history
+        try:
+            answer = self._answer_for(history)
+            history = list(history) + [{"role": "assistant", "content": []}]
+            time.sleep(self.first_token_delay)
+            for end in range(self.chars_per_token, len(answer) + self.chars_per_token, self.chars_per_token):
+                history[-1] = {"role": "assistant",
+                               "content": [{"text": answer[:end], "type": "text"}]}
+                with self._lock:
+                    self.tokens += 1
+                yield history
+                time.sleep(1.0 / self.tokens_per_second)
+            with self._lock:
+                self.completed += 1
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def start(self, port=None, host="127.0.0.1"):
+        """Launch the server in the background and return its URL"""
+        port = port or free_port()
+        with gr.Blocks() as demo:
+            chat_history = gr.JSON()
+            trigger = gr.Button(visible=False)
+            trigger.click(self.get_RKLLM_output, inputs=chat_history, outputs=chat_history,
+                          api_name="get_RKLLM_output", concurrency_limit=self.concurrency_limit)
+        demo.queue().launch(server_name=host, server_port=port, prevent_thread_lock=True,
+                            quiet=True, show_error=True)
+        self.demo = demo
+        self.url = f"http://{host}:{port}/"
+        return self.url
+
+    def stop(self):
+        if self.demo is not None:
+            self.demo.close()
+            self.demo = None
+
+class SharedFakeServer:
+    """
+    One FakeRKLLMServer for all the tests of a module (launching Gradio is slow),
+    started on first use with the given FakeRKLLMServer options
+    """
+
+    def __init__(self, **options):
+        self.options = options
+        self.server = None
+
+    def get(self, tokens_per_second=200.0, first_token_delay=0.05):
+        """The running server, with its token rate and first-token delay reset for a new test"""
+        if self.server is None:
+            self.server = FakeRKLLMServer(**self.options)
+            self.server.start()
+        self.server.tokens_per_second = tokens_per_second
+        self.server.first_token_delay = first_token_delay
+        return self.server
+
+    def stop(self):
+        if self.server is not None:
+            self.server.stop()
+            self.server = None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake RKLLM Gradio server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--tokens-per-second", type=float, default=10.0)
+    parser.add_argument("--first-token-delay", type=float, default=0.5)
+    parser.add_argument("--reply", default=DEFAULT_REPLY)
+    args = parser.parse_args()
+
+    server = FakeRKLLMServer(reply=args.reply, tokens_per_second=args.tokens_per_second,
+                             first_token_delay=args.first_token_delay)
+    print(f"Fake RKLLM server at {server.start(port=args.port, host=args.host)}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,314 @@
+"""
+Offline intent router for commands that do not need the LLM.
+
+Intents are registered with phrase templates per language. Templates are
+compiled once into word-boundary regular expressions, so "hora" never fires
+inside "ahora". Template syntax:
+    word          a whole word
+    a|b           one of several words
+    [words]       optional words ([a|b], [en {city}])
+    {slot}        a typed slot (number, duration, city, or a choice of words)
+
+An intent can also have reject templates: when one of them is found in the
+command the intent does not match ("tiempo ... mañana" is a forecast, not
+the current weather), and the command goes to the LLM.
+
+A match is only accepted when it covers enough of what was said (filler
+words like "dime" or "please" do not count), so a keyword buried in a long
+question still goes to the LLM.
+
+Run this file directly to see how some sample commands are routed.
+"""
+import re
+import unicodedata
+from collections import namedtuple
+
+# Fraction of the content words a template must cover to accept the intent
+MIN_CONFIDENCE = 0.6
+
+# Words ignored when measuring how much of the command a template covers
+FILLER_WORDS = {
+    'es': {"oye", "hola", "kubic", "por", "favor", "dime", "me", "puedes", "podrias", "decir",
+           "sabes", "el", "la", "los", "las", "de", "del", "que", "a", "en", "y", "es", "un", "una"},
+    'en': {"hey", "hello", "kubic", "please", "tell", "me", "can", "could", "you", "do", "know",
+           "the", "a", "an", "of", "what", "is", "it", "in", "and", "s"},
+}
+
+NUMBER_WORDS = {
+    'es': {"cero": 0, "uno": 1, "un": 1, "una": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5,
+           "seis": 6, "siete": 7, "ocho": 8, "nueve": 9, "diez": 10, "once": 11, "doce": 12,
+           "trece": 13, "catorce": 14, "quince": 15, "dieciseis": 16, "diecisiete": 17,
+           "dieciocho": 18, "diecinueve": 19, "veinte": 20, "veintiuno": 21, "veintiun": 21,
+           "veintidos": 22, "veintitres": 23, "veinticuatro": 24, "veinticinco": 25,
+           "veintiseis": 26, "veintisiete": 27, "veintiocho": 28, "veintinueve": 29,
+           "treinta": 30, "cuarenta": 40, "cincuenta": 50, "sesenta": 60, "setenta": 70,
+           "ochenta": 80, "noventa": 90, "cien": 100, "ciento": 100, "mil": 1000},
+    'en': {"zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+           "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13,
+           "fourteen": 14, "fifteen": 15, "sixteen": 16, "seventeen": 17, "eighteen": 18,
+           "nineteen": 19, "twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60,
+           "seventy": 70, "eighty": 80, "ninety": 90, "hundred": 100, "thousand": 1000},
+}
+NUMBER_JOINERS = {'es': "y", 'en': "and"}
+
+DURATION_UNITS = {
+    'es': {"segundo": 1, "segundos": 1, "minuto": 60, "minutos": 60, "hora": 3600, "horas": 3600},
+    'en': {"second": 1, "seconds": 1, "minute": 60, "minutes": 60, "hour": 3600, "hours": 3600},
+}
+# "media hora", "half an hour", and the article used as "one" ("una hora", "a minute")
+DURATION_HALF = {'es': ["medio", "media"], 'en': ["half a", "half an"]}
+DURATION_ONE = {'es': ["un", "una"], 'en': ["a", "an"]}
+
+# Words that end a city name ("el tiempo en madrid hoy")
+CITY_STOP_WORDS = {"hoy", "ahora", "today", "now", "please"}
+
+IntentMatch = namedtuple('IntentMatch', ['intent', 'confidence', 'slots'])
+
+def normalize(text):
+    """Lowercase, drop accents and punctuation (but not decimal points: "2.5"), collapse spaces"""
+    text = unicodedata.normalize('NFD', text.lower())
+    text = "".join(c for c in text if unicodedata.category(c) != 'Mn')
+    return " ".join(re.sub(r"(?!(?<=\d)[.,]\d)[^\w\s]", " ", text).split())
+
+def _alternatives(words):
+    # Longest first so "dividido entre" wins over "dividido"
+    return "|".join(re.escape(w).replace(r"\ ", r"\s+") for w in sorted(words, key=len, reverse=True))
+
+def parse_number(text, language):
+    """Parse digits or number words ("veinticinco", "treinta y cinco", "one hundred") to a number"""
+    text = text.strip()
+    if re.fullmatch(r"\d+([.,]\d+)?", text):
+        return float(text.replace(",", ".")) if re.search(r"[.,]", text) else int(text)
+    words = NUMBER_WORDS.get(language, {})
+    total = 0
+    current = 0
+    for word in text.split():
+        if word == NUMBER_JOINERS.get(language):
+            continue
+        value = words.get(word)
+        if value is None:
+            return None
+        if value == 1000:
+            total += max(current, 1) * 1000
+            current = 0
+        elif value == 100:
+            current = max(current, 1) * 100
+        else:
+            current += value
+    return total + current
+
+class SlotType:
+    """A slot: a regex per language and a parser from the matched text to a value"""
+
+    def __init__(self, name, patterns, parse=None, free_text=False):
+        """
+        free_text slots (like a city name) match almost anything, so the words
+        they capture are left out of the confidence instead of counting as covered.
+        """
+        self.name = name
+        self.patterns = patterns  # language -> regex (no capturing groups)
+        self.parse = parse or (lambda text, language: text)
+        self.free_text = free_text
+
+    def pattern(self, language):
+        return self.patterns[language]
+
+def _number_pattern(language):
+    words = _alternatives(NUMBER_WORDS[language])
+    joiner = NUMBER_JOINERS[language]
+    return rf"(?:\d+(?:[.,]\d+)?|(?:{words})(?:\s+(?:{joiner}\s+)?(?:{words}))*)"
+
+def _duration_pattern(language):
+    amount = rf"(?:{_number_pattern(language)}|{_alternatives(DURATION_ONE[language] + DURATION_HALF[language])})"
+    unit = _alternatives(DURATION_UNITS[language])
+    joiner = NUMBER_JOINERS[language]
+    half = r"(?:\s+y\s+media|\s+y\s+medio)?" if language == 'es' else r"(?:\s+and\s+a\s+half)?"
+    part = rf"{amount}\s+(?:{unit}){half}"
+    return rf"{part}(?:\s+(?:{joiner}\s+)?{part})*"
+
+def parse_duration(text, language):
+    """Parse "una hora y diez minutos" / "half an hour" to seconds"""
+    units = DURATION_UNITS[language]
+    half_words = DURATION_HALF[language]
+    one_words = DURATION_ONE[language]
+    total = 0.0
+    part = re.compile(rf"(.+?)\s+({_alternatives(units)})(\s+(?:y|and)\s+(?:a\s+)?(?:media|medio|half))?(?!\w)")
+    for match in part.finditer(text):
+        amount_text = match.group(1).strip()
+        # Drop a joiner left over from the previous part ("... y diez minutos")
+        amount_text = re.sub(rf"^(?:{NUMBER_JOINERS[language]})\s+", "", amount_text)
+        if amount_text in half_words:
+            amount = 0.5
+        elif amount_text in one_words:
+            amount = 1
+        else:
+            amount = parse_number(amount_text, language)
+            if amount is None:
+                return None
+        if match.group(3):
+            amount += 0.5
+        total += amount * units[match.group(2)]
+    return int(total) if total else None
+
+def parse_city(text, language):
+    words = []
+    for word in text.split():
+        if word in CITY_STOP_WORDS:
+            break
+        words.append(word)
+    return " ".join(words).title() or None
+
+NUMBER = SlotType('number', {lang: _number_pattern(lang) for lang in NUMBER_WORDS}, parse_number)
+DURATION = SlotType('duration', {lang: _duration_pattern(lang) for lang in DURATION_UNITS}, parse_duration)
+# Up to three words; trailing words like "hoy" are trimmed by the parser
+CITY = SlotType('city', {lang: r"[a-z]+(?:\s+[a-z]+){0,3}" for lang in FILLER_WORDS}, parse_city,
+                free_text=True)
+
+def choice_slot(name, choices):
+    """Slot matching one of a fixed set of phrases per language: {'es': {'mas': '+'}, ...}"""
+    patterns = {lang: rf"(?:{_alternatives(words)})" for lang, words in choices.items()}
+
+    def parse(text, language):
+        return choices[language].get(" ".join(text.split()))
+    return SlotType(name, patterns, parse)
+
+class Intent:
+    def __init__(self, name, handler, templates, slots, min_confidence, reject=None):
+        self.name = name
+        self.handler = handler
+        self.slots = slots
+        self.min_confidence = min_confidence
+        self.patterns = {language: [self._compile(t, language) for t in language_templates]
+                         for language, language_templates in templates.items()}
+        self.rejects = {language: [self._compile(t, language) for t in language_templates]
+                        for language, language_templates in (reject or {}).items()}
+
+    def rejected(self, text, language):
+        return any(pattern.search(text) for pattern in self.rejects.get(language, []))
+
+    def _compile(self, template, language):
+        return re.compile(rf"(?<!\w){self._sequence(template, language)}(?!\w)")
+
+    def _sequence(self, template, language):
+        pieces = []
+        for token in re.findall(r"\[[^\]]*\]|\S+", template):
+            if token.startswith('[') and token.endswith(']'):
+                pieces.append((self._sequence(token[1:-1], language), True))
+            elif token.startswith('{') and token.endswith('}'):
+                name = token[1:-1]
+                pieces.append((f"(?P<{name}>{self.slots[name].pattern(language)})", False))
+            else:
+                pieces.append((f"(?:{'|'.join(re.escape(word) for word in token.split('|'))})", False))
+
+        # Separators only go between words that are actually present
+        regex = ""
+        seen_required = False
+        for piece, optional in pieces:
+            if not seen_required:
+                regex += rf"(?:{piece}\s+)?" if optional else piece
+                seen_required = not optional
+            else:
+                regex += rf"(?:\s+{piece})?" if optional else rf"\s+{piece}"
+        return regex
+
+class IntentRouter:
+    def __init__(self, min_confidence=MIN_CONFIDENCE):
+        self.min_confidence = min_confidence
+        self.intents = []
+
+    def register(self, name, handler, templates, slots=None, min_confidence=None, reject=None):
+        """
+        Register an intent. templates maps a language to a list of phrase templates.
+        slots maps slot names used in the templates to SlotTypes.
+        reject maps a language to templates that, found anywhere in the command, stop it matching.
+        handler(slots) returns the spoken answer, or None to let the LLM answer instead.
+        """
+        self.intents.append(Intent(name, handler, templates, slots or {},
+                                   self.min_confidence if min_confidence is None else min_confidence,
+                                   reject))
+
+    def intent(self, name, templates, slots=None, min_confidence=None, reject=None):
+        """Decorator form of register()"""
+        def decorator(handler):
+            self.register(name, handler, templates, slots, min_confidence, reject)
+            return handler
+        return decorator
+
+    @staticmethod
+    def _confidence(text, match, language, free_spans):
+        """Fraction of the content words that fall inside the match"""
+        filler = FILLER_WORDS.get(language, set())
+        covered = 0
+        total = 0
+        for word in re.finditer(r"\w+", text):
+            if any(start <= word.start() and word.end() <= end for start, end in free_spans):
+                continue
+            inside = match.start() <= word.start() and word.end() <= match.end()
+            if inside:
+                covered += 1
+                total += 1
+            elif word.group() not in filler:
+                total += 1
+        return covered / total if total else 0.0
+
+    def _match_language(self, text, language):
+        best = None
+        for intent in self.intents:
+            if intent.rejected(text, language):
+                continue
+            for pattern in intent.patterns.get(language, []):
+                for match in pattern.finditer(text):
+                    free_spans = [match.span(name) for name, slot_type in intent.slots.items()
+                                  if slot_type.free_text and match.group(name)]
+                    confidence = self._confidence(text, match, language, free_spans)
+                    if confidence < intent.min_confidence:
+                        continue
+                    if best is not None and confidence <= best[1]:
+                        continue
+                    slots = {}
+                    for name, slot_type in intent.slots.items():
+                        value = match.groupdict().get(name)
+                        slots[name] = slot_type.parse(value, language) if value else None
+                    best = (intent, confidence, slots)
+        return best
+
+    def match(self, text, language='es'):
+        """Return the best IntentMatch for the command, or None. Other languages are tried last."""
+        text = normalize(text)
+        if not text:
+            return None
+        languages = [language] + sorted({lang for i in self.intents for lang in i.patterns} - {language})
+        for candidate in languages:
+            best = self._match_language(text, candidate)
+            if best is not None:
+                intent, confidence, slots = best
+                return IntentMatch(intent, round(confidence, 2), slots)
+        return None
+
+    def handle(self, text, language='es'):
+        """Answer the command locally. Returns (intent name, response) or (None, None)."""
+        match = self.match(text, language)
+        if match is None:
+            return None, None
+        response = match.intent.handler(match.slots)
+        if response is None:
+            return None, None
+        return match.intent.name, response
+
+if __name__ == "__main__":
+    router = IntentRouter()
+    router.register('time', lambda slots: "time", {'es': ["[que] hora [es]"], 'en': ["[what] time [is it]"]})
+    router.register('weather', lambda slots: f"weather {slots}",
+                    {'es': ["tiempo|clima [en {city}]", "que tiempo hace [en {city}]"],
+                     'en': ["weather [in {city}]"]}, {'city': CITY})
+    router.register('timer', lambda slots: f"timer {slots}",
+                    {'es': ["[pon] [un] temporizador [de] {duration}"], 'en': ["[set] [a] timer for {duration}"]},
+                    {'duration': DURATION})
+    for command in ["qué hora es", "dime la hora", "ahora cuéntame un chiste", "llegué a tiempo a la reunión",
+                    "qué tiempo hace en san sebastián hoy", "pon un temporizador de una hora y diez minutos",
+                    "temporizador de veinticinco segundos", "set a timer for half an hour", "what time is it"]:
+        match = router.match(command, 'es')
+        if match:
+            print(f"{command!r:50} -> {match.intent.name} ({match.confidence}) {match.slots}")
+        else:
+            print(f"{command!r:50} -> LLM")
@@ -1,22 +1,41 @@
+import argparse
 import os
 import struct
 import sys
 import wave
 import math
 import json
-import requests
-import subprocess
+import queue
+import threading
 import time
 from datetime import datetime
 
 # Import the client created earlier
+from audio_cache import AudioCache
+from audio_capture import AudioCapture
+from audio_output import CUE, SPEECH, AudioOutput, NullSink, PyAudioSink
+from config_reload import ConfigReloader, remove_pid_file, write_pid_file
+from config_store import (get_audio_input_index, get_audio_output_card, get_config,
+                          get_inline_command_beep, get_language, get_wake_phrase,
+                          get_weather_settings)
+from conversation_history import ConversationHistory, simple_summary
+from intent_router import CITY, DURATION, NUMBER, IntentRouter, choice_slot
+from response_cache import ResponseCache
 from rkllm_client import RKLLMClient
+from speculative import SpeculativeDispatcher
+from startup import Startup
+from text_segmenter import segment_stream
+from tts_engine import PiperTTSEngine
+from turn_trace import tracer
+from vad import Endpointer, VoiceActivityDetector
+from wake_word import BargeInMonitor, IdleCpuMonitor, WakeWordDetector, command_after_wake
+from weather import WeatherError, WeatherProvider
 
 # Audio Configuration
 # On Orange Pi, ensure to install: sudo apt install portaudio19-dev
 # pip install pyaudio vosk
+# (vosk is imported when the model is loaded, on its own startup thread)
 import pyaudio
-from vosk import Model as VoskModel, KaldiRecognizer
 
 # Piper TTS Configuration
 # Assuming you have the 'piper' binary and an .onnx model downloaded
@@ -24,40 +43,89 @@ from vosk import Model as VoskModel, KaldiRecognizer
 PIPER_BINARY = "./piper/piper" 
 PIPER_MODEL = "./piper/es_ES-sharvard-medium.onnx"
 
+# Long-lived Piper process: the voice model is loaded once in main()
+tts_engine = PiperTTSEngine(PIPER_BINARY, PIPER_MODEL)
+
+# Synthesized speech cache (memory + disk) in front of the engine
+audio_cache = AudioCache(tts_engine)
+
+# Output engine (AudioOutput) holding the card open, created by open_speaker() in main()
+audio_output = None
+
+# Fixed phrases, prewarmed at startup so they play without waiting for Piper
+THINKING_MESSAGE = "Thinking..."
+WEATHER_NOT_CONFIGURED_MESSAGE = "I need the API key and city configured to check the weather."
+WEATHER_ERROR_MESSAGE = "I couldn't get the weather information right now."
+TIMER_DONE_MESSAGE = "Your timer is done."
+# More phrases can be listed in config.json under "tts_prewarm_phrases"
+TTS_PREWARM_PHRASES = [THINKING_MESSAGE, WEATHER_NOT_CONFIGURED_MESSAGE, WEATHER_ERROR_MESSAGE,
+                       TIMER_DONE_MESSAGE]
+
+# Cached weather lookups over a keep-alive session, refreshed in the background
+weather_provider = WeatherProvider()
+
 # Wake Word Configuration using Vosk
 # Vosk-based wake word detection works perfectly on ARM devices like Orange Pi
 # You can use any Spanish phrase as wake word
 WAKE_WORD_PHRASE = "hola"  # Change to: "oye asistente", "hola ordenador", "hey kubic", etc.
+# (the wake_phrase setting of config.json overrides it)
 # Cooldown period after wake word detection (seconds)
 WAKE_WORD_COOLDOWN = 2.0
+# Restrict the wake word recognizer to the phrase plus an [unk] garbage class.
+# Set to False if your Vosk model does not support runtime grammars.
+WAKE_WORD_USE_GRAMMAR = True
+# Take the command from the wake word utterance itself ("hola, qué hora es"): the
+# utterance is transcribed again with the full model and the words after the
+# phrase are the command. Set "inline_command_beep": false in config.json to
+# skip the beep in that case.
+WAKE_WORD_INLINE_COMMAND = True
+
+# Barge-in: saying the wake word while the assistant answers cuts the answer
+# (audio and LLM generation) and goes straight to listening for a new command
+BARGE_IN_ENABLED = True
+# Stricter voice gate while the speaker is playing, so the assistant's own voice
+# does not trigger it. Raise these if it interrupts itself, lower them if it
+# does not hear you over loud answers.
+BARGE_IN_MIN_RMS = 800.0
+BARGE_IN_SPEECH_RATIO = 4.0
+# Minimum Vosk confidence (0-1) for each word of the wake phrase during playback
+BARGE_IN_MIN_CONFIDENCE = 0.8
 
 # VOSK Configuration (STT)
 # Download a lightweight Spanish model: https://alphacephei.com/vosk/models
 # Example: vosk-model-small-es-0.42
 VOSK_MODEL_PATH = "vosk-model-small-es-0.42"
 
-# Command Listening Timeout (seconds)
-# If no command is detected after wake word, return to wake word detection
-COMMAND_TIMEOUT = 5.0
+# LLM Response Cache
+# Repeated questions ("quién eres", "cuéntame un chiste") are answered from memory.
+# Set LLM_CACHE_FILE to a path (e.g. "llm_cache.json") to keep answers across restarts.
+LLM_CACHE_ENABLED = True
+LLM_CACHE_FILE = None
 
-CONFIG_FILE = "config.json"
+# Conversation History
+# Approximate token budget for the history sent with each LLM request
+HISTORY_MAX_TOKENS = 1024
+# Start a new conversation after this many idle seconds
+HISTORY_IDLE_RESET = 600.0
+# Compact turns that fall out of the budget into a short summary
+HISTORY_COMPACT = True
 
-def load_config():
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            pass
-    return {}
-
-def get_audio_output_flag():
-    config = load_config()
-    card_id = config.get('audio_output')
-    if card_id is not None:
-        # Use plughw for better compatibility and add buffer parameters
-        return f"-D plughw:{card_id},0 -B 500000"
-    return "-B 500000"
+# Per-turn stage timings, appended to logs/turns.jsonl (see turn_trace.py and /metrics)
+TURN_TRACE_ENABLED = True
+
+# Command Endpointing (seconds)
+# If nobody starts speaking after the wake word, return to wake word detection
+COMMAND_NO_SPEECH_TIMEOUT = 5.0
+# Trailing silence that ends a command once speech has started
+COMMAND_END_SILENCE = 0.4
+# Commands longer than this are cut and dispatched
+COMMAND_MAX_DURATION = 12.0
+
+# Send the question to the LLM before the command is over, once the Vosk partial result
+# has not changed for SPECULATIVE_LLM_STABLE_SECONDS; the request is cancelled and sent
+# again if the final transcript differs. Off by default: misses keep the NPU busy.
+SPECULATIVE_LLM = False
+SPECULATIVE_LLM_STABLE_SECONDS = 0.3
 
 def create_beep_wav(filename="beep.wav"):
     if not os.path.exists(filename):
@@ -82,293 +150,711 @@ def create_beep_wav(filename="beep.wav"):
         except Exception as e:
             print(f"Error creating beep file: {e}")
 
-def speak(text):
-    """Generate audio with Piper TTS and play it (blocking)"""
+def speak(text, on_audio_ready=None):
+    """
+    Play cached audio for the text, or synthesize it with Piper first (blocking).
+    on_audio_ready, if given, is called right before playback starts.
+    """
+    tracer.mark('tts_first_request')
+    wav_data = audio_cache.synthesize(text)
+    tracer.mark('tts_first_segment')
+    if on_audio_ready:
+        on_audio_ready()
     print(f"Assistant: {text}")
-    # Clean text
-    clean_text = text.replace('"', '').replace("'", "").replace('\n', ' ').replace('`', '')
-    
-    output_flag = get_audio_output_flag()
-    
-    # Command to generate streaming audio (piping stdout to aplay)
-    # -output_file - sends audio to stdout
-    cmd = f'echo "{clean_text}" | {PIPER_BINARY} --model {PIPER_MODEL} --output_file - | aplay -r 22050 -f S16_LE -t raw {output_flag} - 2>/dev/null'
-    
-    result = os.system(cmd)
-    if result != 0:
-        print(f"[Warning: Audio playback failed with code {result >> 8}]")
-    
-    # Small delay to ensure audio device is released
-    time.sleep(0.2)
+    if wav_data:
+        tracer.mark('first_audio')
+        play_wav_data(wav_data)
+    else:
+        tracer.error('tts', "synthesis failed")
+
+class PlaybackControl:
+    """
+    Track the sounds queued on the output engine for the answer, so barge-in
+    can cut them and make speak()/speak_stream() drop the rest of the answer.
+    """
+
+    def __init__(self, channel=SPEECH):
+        self.channel = channel
+        self.interrupted = threading.Event()
+        self._sounds = []
+        self._lock = threading.Lock()
+
+    def reset(self):
+        self.interrupted.clear()
+
+    def play(self, source, wait=True):
+        """
+        Queue WAV data (bytes) or a WAV file on the output engine; with wait,
+        block until it has played. Returns True when played (or queued), False
+        if it could not be played, or None if playback was interrupted.
+        """
+        with self._lock:
+            if self.interrupted.is_set():
+                return None
+            try:
+                if isinstance(source, (bytes, bytearray)):
+                    sound = audio_output.play_wav(source, channel=self.channel)
+                else:
+                    sound = audio_output.play_file(source, channel=self.channel)
+            except (OSError, EOFError, ValueError, wave.Error) as e:
+                print(f"[Warning: could not play audio: {e}]")
+                return False
+            self._sounds = [queued for queued in self._sounds if not queued.done.is_set()]
+            self._sounds.append(sound)
+        if not wait:
+            return True
+        return True if sound.wait() else None
+
+    def wait(self):
+        """Wait until everything queued so far has played or was cut"""
+        with self._lock:
+            sounds = list(self._sounds)
+        for sound in sounds:
+            sound.wait()
+
+    def interrupt(self):
+        """Cut the audio playing now and skip everything queued until reset()"""
+        with self._lock:
+            self.interrupted.set()
+            sounds, self._sounds = self._sounds, []
+        for sound in sounds:
+            audio_output.cancel(sound)
+
+playback = PlaybackControl()
+
+class BackgroundCue:
+    """
+    Speak a short acknowledgement on a background thread.
+    stop() cuts it as soon as the real response audio is ready.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        # Its own player on the cue channel, so stopping the cue never touches the answer
+        self._player = PlaybackControl(channel=CUE)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        wav_data = audio_cache.synthesize(self.text)
+        if not wav_data or self._player.interrupted.is_set():
+            return
+        print(f"Assistant: {self.text}")
+        self._player.play(wav_data)
+
+    def stop(self):
+        """Cancel the cue, or cut it if it is already playing. Safe to call more than once."""
+        self._player.interrupt()
+
+def play_and_remove(wav_path, wait=True):
+    """Play a synthesized segment and delete the temporary file"""
+    try:
+        with open(wav_path, 'rb') as f:
+            wav_data = f.read()
+        os.remove(wav_path)
+    except OSError as e:
+        print(f"[Warning: could not read {wav_path}: {e}]")
+        return
+    playback.play(wav_data, wait=wait)
+
+def _playback_worker(playback_queue, on_first_audio=None):
+    """
+    Queue synthesized segments on the output engine until a None sentinel
+    arrives, then wait for them to play. The engine plays them back to back.
+    """
+    while True:
+        wav_path = playback_queue.get()
+        if wav_path is None:
+            break
+        if on_first_audio:
+            on_first_audio()
+            on_first_audio = None
+        tracer.mark('first_audio')
+        play_and_remove(wav_path, wait=False)
+    playback.wait()
 
-def speak_stream(text_iterator):
-    """Generate audio with Piper TTS from a text stream and play it via streaming"""
+def _queue_segment(text, playback_queue):
+    tracer.mark('tts_first_request')
+    wav_path = tts_engine.synthesize(text)
+    if wav_path:
+        tracer.mark('tts_first_segment')
+        playback_queue.put(wav_path)
+    else:
+        tracer.error('tts', "synthesis failed")
+
+def speak_stream(text_iterator, on_first_audio=None):
+    """
+    Generate audio with the Piper TTS engine from a text stream and play it.
+    The stream is cut into sentences; each one is synthesized while the
+    previous one is still playing.
+    on_first_audio, if given, is called right before the first segment plays.
+    """
     print("Assistant (streaming): ", end="")
-    
-    output_flag = get_audio_output_flag()
-    
-    # Construct the pipeline: Piper -> Aplay with stderr suppression
-    piper_cmd = f'{PIPER_BINARY} --model {PIPER_MODEL} --output_file - 2>/dev/null | aplay -r 22050 -f S16_LE -t raw {output_flag} - 2>/dev/null'
-    
-    process = None
-    pipe_broken = False
-    
+
+    language = get_language()
+    playback_queue = queue.Queue()
+    player = threading.Thread(target=_playback_worker, args=(playback_queue, on_first_audio),
+                              daemon=True)
+    player.start()
+
     try:
-        # Start the process with stdin pipe
-        process = subprocess.Popen(piper_cmd, shell=True, stdin=subprocess.PIPE, 
-                                   stderr=subprocess.DEVNULL, bufsize=0)
-        
-        for chunk in text_iterator:
-            if chunk and not pipe_broken:
-                # Print chunk to console as it arrives
-                print(chunk, end="", flush=True)
-                
-                # Clean chunk for TTS
-                clean_chunk = chunk.replace('"', '').replace("'", "").replace('`', '')
-                
-                # Write to Piper
-                try:
-                    if process.poll() is None:  # Check if process is still running
-                        process.stdin.write(clean_chunk.encode('utf-8'))
-                        process.stdin.flush()
-                    else:
-                        pipe_broken = True
-                except (BrokenPipeError, OSError):
-                    pipe_broken = True
-                    break
-        
+        # Print each chunk to the console as it arrives
+        segments = segment_stream(text_iterator, language=language,
+                                  on_delta=lambda chunk: print(chunk, end="", flush=True))
+        for segment in segments:
+            if playback.interrupted.is_set():
+                break  # Barge-in: the rest of the answer is not wanted
+            _queue_segment(segment, playback_queue)
+
         print("")  # Newline after streaming
-        
-        # Close stdin to signal EOF to Piper
-        if process.stdin and not pipe_broken:
-            try:
-                process.stdin.close()
-            except:
-                pass
-        
-        # Wait for audio to finish playing
-        try:
-            return_code = process.wait(timeout=30)
-            if return_code != 0 and not pipe_broken:
-                print(f"[Warning: Audio process exited with code {return_code}]")
-        except subprocess.TimeoutExpired:
-            process.kill()
-            print("[Warning: Audio process timeout]")
-        
-        # Delay to ensure audio device is released
-        time.sleep(0.3)
-        
+
     except Exception as e:
         print(f"\n[Error in speak_stream: {e}]")
     finally:
-        # Ensure process is properly terminated
-        if process and process.poll() is None:
-            try:
-                process.terminate()
-                process.wait(timeout=1.0)
-            except subprocess.TimeoutExpired:
-                process.kill()
-            except:
-                pass
+        # Wait for the queued audio to finish playing
+        playback_queue.put(None)
+        player.join()
+
+def play_wav_data(wav_data):
+    """Play in-memory WAV data and wait for it to finish (returns early on barge-in)"""
+    if playback.play(wav_data) is False:
+        print("[Warning: Audio playback failed]")
 
 def play_audio(filename):
     if os.path.exists(filename):
-        output_flag = get_audio_output_flag()
-        result = os.system(f'aplay {output_flag} {filename} 2>/dev/null')
-        if result != 0:
+        if playback.play(filename) is False:
             print(f"[Warning: Could not play {filename}]")
-        time.sleep(0.1)  # Brief delay to ensure audio device is released
 
-def get_weather_info(config):
+def get_weather_info(config, city=None):
     api_key = config.get('openweathermap_key')
-    city = config.get('location_city')
+    city = city or config.get('location_city')
     
     if not api_key or not city:
-        return "I need the API key and city configured to check the weather."
-    
-    url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}&units=metric&lang=es"
+        return WEATHER_NOT_CONFIGURED_MESSAGE
     
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            temp = data['main']['temp']
-            desc = data['weather'][0]['description']
-            return f"The weather in {city} is {desc} with a temperature of {temp} degrees Celsius."
-        else:
-            return "I couldn't get the weather information right now."
-    except Exception as e:
+        weather = weather_provider.get(city, api_key, lang=config.get('language', 'es'))
+        return f"The weather in {city} is {weather['description']} with a temperature of {weather['temp']} degrees Celsius."
+    except WeatherError as e:
         print(f"Error getting weather: {e}")
-        return "An error occurred while checking the weather."
+        tracer.error('weather', e)
+        return WEATHER_ERROR_MESSAGE
+
+def get_weather_settings_for_refresh():
+    api_key, city = get_weather_settings()
+    return api_key, city, get_language()
 
 def get_current_time():
     now = datetime.now()
     return f"It is {now.strftime('%H:%M')}."
 
+def get_current_date():
+    now = datetime.now()
+    return f"Today is {now.strftime('%A, %B')} {now.day}."
+
+def format_duration(seconds):
+    parts = []
+    for unit, size in (("hour", 3600), ("minute", 60), ("second", 1)):
+        count, seconds = divmod(seconds, size)
+        if count:
+            parts.append(f"{count} {unit}{'s' if count != 1 else ''}")
+    return " and ".join(parts)
+
+def announce_timer_done():
+    BackgroundCue(TIMER_DONE_MESSAGE)
+
+def start_timer(seconds, on_done=announce_timer_done):
+    timer = threading.Timer(seconds, on_done)
+    timer.daemon = True
+    timer.start()
+    return f"Timer set for {format_duration(seconds)}."
+
+OPERATOR_NAMES = {'+': "plus", '-': "minus", '*': "times", '/': "divided by"}
+OPERATOR = choice_slot('operator', {
+    'es': {"mas": '+', "menos": '-', "por": '*', "entre": '/', "dividido entre": '/',
+           "dividido por": '/'},
+    'en': {"plus": '+', "minus": '-', "times": '*', "multiplied by": '*', "divided by": '/',
+           "over": '/'},
+})
+
+def calculate(a, operator, b):
+    if a is None or b is None or operator is None:
+        return None  # Not understood: let the LLM try
+    if operator == '/' and b == 0:
+        return "I can't divide by zero."
+    result = {'+': a + b, '-': a - b, '*': a * b, '/': a / b}[operator]
+    if isinstance(result, float):
+        result = round(result, 2)
+        if result.is_integer():
+            result = int(result)
+    return f"{a} {OPERATOR_NAMES[operator]} {b} is {result}."
+
+def build_intent_router(on_timer_done=announce_timer_done):
+    """
+    Commands answered locally in milliseconds instead of going to the LLM.
+    on_timer_done is called when a timer fires (the hub routes it to the satellite).
+    """
+    router = IntentRouter()
+    router.register('time', lambda slots: get_current_time(), {
+        'es': ["[que] hora [es]", "que hora tienes"],
+        'en': ["[what] time [is it]", "what is the time"],
+    }, reject={
+        # The time somewhere else: only the local time is known here
+        'es': ["hora [es] en"],
+        'en': ["time [is it] in"],
+    })
+    router.register('date', lambda slots: get_current_date(), {
+        'es': ["[que] dia es [hoy]", "[que] fecha es [hoy]", "fecha [de hoy]"],
+        'en': ["what day is [it] [today]", "what is [the] date [today]", "date [today]"],
+    })
+    router.register('weather', lambda slots: get_weather_info(get_config(), slots['city']), {
+        'es': ["tiempo|clima [en {city}]", "que tiempo|clima hace [en {city}]",
+               "hace [buen|mal] tiempo [en {city}]", "va a llover [en {city}]"],
+        'en': ["weather [in {city}]", "[what is the] weather like [in {city}]",
+               "is it going to rain [in {city}]"],
+    }, slots={'city': CITY}, reject={
+        # A forecast, which get_weather_info does not give
+        'es': ["manana|pasado|semana|finde|lunes|martes|miercoles|jueves|viernes|sabado|domingo"],
+        'en': ["tomorrow|tonight|week|weekend|monday|tuesday|wednesday|thursday|friday|saturday|sunday"],
+    })
+    def set_timer(slots):
+        return start_timer(slots['duration'], on_timer_done) if slots['duration'] else None
+    router.register('timer', set_timer, {
+        'es': ["[pon|ponme] [un] temporizador [de] {duration}", "avisame en|dentro [de] {duration}",
+               "cuenta {duration}"],
+        'en': ["[set] [a] timer for {duration}", "{duration} timer", "remind me in {duration}"],
+    }, slots={'duration': DURATION})
+    router.register('calculate', lambda slots: calculate(slots['a'], slots['operator'], slots['b']), {
+        'es': ["[cuanto|cuantos] [es|son] {a} {operator} {b}"],
+        'en': ["[what|how] [much] [is|s] {a} {operator} {b}"],
+    }, slots={'a': NUMBER, 'operator': OPERATOR, 'b': NUMBER})
+    return router
+
+intent_router = build_intent_router()
+
 def process_local_intents(text):
     """
-    Check if the text matches local intents (time, weather).
+    Route the command to a local intent (time, date, weather, timer, arithmetic).
     Returns the response string if matched, else None.
     """
-    text_lower = text.lower()
-    config = load_config()
-    
-    # Simple keyword matching for intents
-    # Time
-    if "hora" in text_lower or "time" in text_lower:
-        return get_current_time()
-    
-    # Weather
-    if "tiempo" in text_lower or "weather" in text_lower or "clima" in text_lower:
-        return get_weather_info(config)
-        
-    return None
+    intent, response = intent_router.handle(text, get_language())
+    if intent:
+        tracer.set('local_intent', intent)
+    return response
 
-def get_system_prompt():
+def get_system_prompt(language=None):
     """
-    Get the system prompt based on configured language.
+    Get the system prompt based on configured language (or the given one).
     This is sent only once at the start of the conversation.
     """
-    config = load_config()
-    language = config.get('language', 'es')
+    language = language or get_language()
     
     if language == 'en':
         return "Always respond in English. Keep responses brief and concise. Use plain text only, no formatting, no lists, no markdown. If asked who you are, you are Kubic, an AI assistant."
     else:  # Spanish is default
         return "Siempre responde en español. Respuestas breves y concisas. Solo texto plano, sin formato, sin listas, sin markdown. Si te pregunto quien eres, eres Kubic, un asistente de IA."
 
+def wake_phrase():
+    return get_wake_phrase() or WAKE_WORD_PHRASE
+
+def load_stt_model():
+    """Load the Vosk model; the slowest step of the boot"""
+    if not os.path.exists(VOSK_MODEL_PATH):
+        print(f"Error: Could not find Vosk model at {VOSK_MODEL_PATH}")
+        print("Download it from https://alphacephei.com/vosk/models and unzip it here.")
+        sys.exit(1)
+
+    from vosk import Model as VoskModel  # Loads libvosk; deferred so it overlaps the other steps
+    print("Loading STT model (Vosk)...")
+    return VoskModel(VOSK_MODEL_PATH)
+
+def start_output(sink):
+    """Start the output engine on an open sink"""
+    global audio_output
+    audio_output = AudioOutput(sink).start()
+    print(f"Audio output: {sink.name} at {sink.rate} Hz")
+
+def open_speaker():
+    """Open the output card once; every sound of the session is played through it"""
+    try:
+        sink = PyAudioSink(card=get_audio_output_card())
+    except (IOError, OSError) as e:
+        print(f"[Warning: could not open the audio output, sound is disabled: {e}]")
+        sink = NullSink()
+    start_output(sink)
+
+def open_microphone():
+    """Open the input device and start draining it; returns (pyaudio instance, capture)"""
+    p = pyaudio.PyAudio()
+
+    input_device_index = get_audio_input_index()
+    if input_device_index is not None:
+        print(f"Using input device index: {input_device_index}")
+
+    # Microphone is drained on its own thread into a ring buffer,
+    # so frames are kept while we speak or wait for the LLM
+    capture = AudioCapture(p, rate=16000, frames_per_buffer=2048,
+                           input_device_index=input_device_index)
+    try:
+        capture.start()
+    except Exception:
+        p.terminate()
+        raise
+    return p, capture
+
+def reopen_microphone(p, capture):
+    """
+    Switch to the input device in the config; returns the new (pyaudio instance, capture).
+    The new device is opened first: if that fails the old one keeps running and the error is raised.
+    """
+    new_p, new_capture = open_microphone()
+    capture.stop()
+    p.terminate()
+    return new_p, new_capture
+
+def transcribe_inline_command(rec, audio, phrase=None):
+    """Decode the wake word utterance with the full recognizer; return the words after the phrase"""
+    if not audio:
+        return ""
+    rec.Reset()
+    rec.AcceptWaveform(audio)
+    text = json.loads(rec.FinalResult()).get("text", "").strip()
+    return command_after_wake(text, phrase or wake_phrase())
+
+def prewarm_tts():
+    """Synthesize the fixed phrases so they play without waiting for Piper"""
+    prewarm_phrases = TTS_PREWARM_PHRASES + get_config().get('tts_prewarm_phrases', [])
+    audio_cache.prewarm(prewarm_phrases)
+
+def add_tts_startup(startup):
+    """Load the Piper voice once (speak() reuses the running process), then prewarm the cache"""
+    startup.add('tts_engine', tts_engine.start)
+    startup.add('tts_prewarm', prewarm_tts, after=['tts_engine'])
+
 def main():
-    config = load_config()
-    
+    # Independent startup steps run concurrently; see the boot timeline printed when ready
+    startup = Startup()
+    startup.add('vosk_model', load_stt_model)
+    startup.add('microphone', open_microphone)
+    startup.add('speaker', open_speaker)
+    add_tts_startup(startup)
+
     # Initialize LLM client with system prompt
     system_prompt = get_system_prompt()
-    llm_client = RKLLMClient(system_prompt=system_prompt)
+    response_cache = None
+    if LLM_CACHE_ENABLED:
+        response_cache = ResponseCache(persist_path=LLM_CACHE_FILE)
+    history = ConversationHistory(max_tokens=HISTORY_MAX_TOKENS, idle_reset=HISTORY_IDLE_RESET,
+                                  summarizer=simple_summary if HISTORY_COMPACT else None)
+    llm_client = RKLLMClient(system_prompt=system_prompt, response_cache=response_cache,
+                             language=get_language(), history=history, connect=False)
+    # Not waited for: the first question retries the connection if this fails
+    startup.add('llm_connect', llm_client.connect)
 
     # Ensure beep sound exists
     create_beep_wav("beep.wav")
 
-    print(f"Wake word detector ready. Listening for: '{WAKE_WORD_PHRASE}'")
+    # Fetch the configured city now so the first weather question is answered from memory
+    weather_provider.start_background_refresh(get_weather_settings_for_refresh)
 
-    # Initialize Vosk (STT)
-    if not os.path.exists(VOSK_MODEL_PATH):
-        print(f"Error: Could not find Vosk model at {VOSK_MODEL_PATH}")
-        print("Download it from https://alphacephei.com/vosk/models and unzip it here.")
-        sys.exit(1)
-        
-    print("Loading STT model (Vosk)...")
-    vosk_model = VoskModel(VOSK_MODEL_PATH)
+    vosk_model = startup.result('vosk_model')
+    from vosk import KaldiRecognizer
     rec = KaldiRecognizer(vosk_model, 16000)
+    p, capture = startup.result('microphone')
+    startup.result('speaker')
+    startup.result('tts_engine')
+    phrase = wake_phrase()
+    print(f"Wake word detector ready. Listening for: '{phrase}'")
 
-    # Initialize Microphone for Vosk (STT)
-    p = pyaudio.PyAudio()
-    
-    input_device_index = None
-    if config.get('audio_input'):
-        try:
-            input_device_index = int(config.get('audio_input'))
-            print(f"Using input device index: {input_device_index}")
-        except ValueError:
-            pass
-
-    # Stream for command recognition (Vosk)
-    stream = p.open(format=pyaudio.paInt16,
-                    channels=1,
-                    rate=16000,
-                    input=True,
-                    input_device_index=input_device_index,
-                    frames_per_buffer=2048)
-
-    print(f"Listening... Say '{WAKE_WORD_PHRASE}' to activate.")
+    # Drop what the microphone captured while the rest was loading
+    capture.skip_to_latest()
+    startup.mark_ready()
+    startup.print_timeline()
+
+    print(f"Listening... Say '{phrase}' to activate.")
     
     # Play beep sound to indicate the assistant is ready
     play_audio("beep.wav")
 
+    tracer.enabled = TURN_TRACE_ENABLED
+
     # State machine: 'idle', 'listening_command', 'processing'
     state = 'idle'
-    command_start_time = 0
+    last_partial = ""
     last_wake_word_time = 0  # Track last wake word detection
-    wake_word_rec = KaldiRecognizer(vosk_model, 16000)
-    wake_word_rec.SetWords(True)
+    output_underruns = 0  # Output engine underruns already reported
+    # Energy-gated, grammar-restricted recognizer: Kaldi only runs when someone speaks
+    wake_detector = WakeWordDetector(vosk_model, phrase, rate=16000,
+                                     use_grammar=WAKE_WORD_USE_GRAMMAR)
+    idle_cpu = IdleCpuMonitor()
+    # Decides when the command is over from voice activity and trailing silence
+    endpointer = Endpointer(2048 / 16000,
+                            no_speech_timeout=COMMAND_NO_SPEECH_TIMEOUT,
+                            end_silence=COMMAND_END_SILENCE,
+                            max_utterance=COMMAND_MAX_DURATION)
+    # Early LLM requests on stable partial results (commands a local intent answers are skipped)
+    speculator = None
+    if SPECULATIVE_LLM:
+        speculator = SpeculativeDispatcher(
+            llm_client, 2048 / 16000, stable_seconds=SPECULATIVE_LLM_STABLE_SECONDS,
+            skip=lambda partial: intent_router.match(partial, get_language()) is not None)
+    # Second wake word detector for barge-in, with the stricter playback gate
+    def build_barge_in_detector():
+        if not BARGE_IN_ENABLED:
+            return None
+        return WakeWordDetector(
+            vosk_model, phrase, rate=16000, use_grammar=WAKE_WORD_USE_GRAMMAR,
+            vad=VoiceActivityDetector(min_rms=BARGE_IN_MIN_RMS, ratio=BARGE_IN_SPEECH_RATIO),
+            min_confidence=BARGE_IN_MIN_CONFIDENCE)
+    barge_in_detector = build_barge_in_detector()
+
+    # Settings saved while running are applied between turns; only what depends
+    # on a changed setting is rebuilt (the Vosk model and Piper are kept)
+    def apply_output_card(config):
+        nonlocal output_underruns
+        # Open the new card first: if it fails, the reloader reports it and the old one keeps playing
+        sink = PyAudioSink(card=get_audio_output_card())
+        audio_output.stop()
+        start_output(sink)
+        output_underruns = 0  # The new engine counts from zero
+
+    def apply_input_device(config):
+        nonlocal p, capture
+        p, capture = reopen_microphone(p, capture)
+
+    def apply_language(config):
+        # A new system prompt; the old conversation was in the other language
+        llm_client.language = config['language']
+        llm_client.system_prompt = get_system_prompt(config['language'])
+        llm_client.clear_history()
+
+    def apply_llm_url(config):
+        llm_client.url = config['rkllm_api_url']
+        llm_client.client = None
+        threading.Thread(target=llm_client.connect, daemon=True).start()
+
+    def apply_wake_phrase(config):
+        nonlocal phrase, wake_detector, barge_in_detector
+        phrase = wake_phrase()
+        wake_detector = WakeWordDetector(vosk_model, phrase, rate=16000,
+                                         use_grammar=WAKE_WORD_USE_GRAMMAR)
+        barge_in_detector = build_barge_in_detector()
+        print(f"Listening for: '{phrase}'")
+
+    # Weather settings and inline_command_beep are read when used, nothing to rebuild
+    reloader = ConfigReloader()
+    reloader.on(['audio_output'], apply_output_card, "output card")
+    reloader.on(['audio_input'], apply_input_device, "input device")
+    reloader.on(['language'], apply_language)
+    reloader.on(['rkllm_api_url'], apply_llm_url, "LLM server")
+    reloader.on(['wake_phrase'], apply_wake_phrase, "wake phrase")
+    reloader.on(['tts_prewarm_phrases'],
+                lambda config: threading.Thread(target=prewarm_tts, daemon=True).start(),
+                "prewarm phrases")
+    # config_app sends SIGHUP after saving
+    reloader.install_signal()
+    write_pid_file()
     
     try:
         while True:
-            # Read audio from mic
-            data = stream.read(2048, exception_on_overflow=False)
+            # Next block from the capture ring buffer
+            data = capture.read(timeout=1.0)
+            if data is None:
+                continue
             
+            text = None
             # State: IDLE - Detect Wake Word
             if state == 'idle':
+                if reloader.poll():
+                    idle_cpu.reset()
+                    continue
+                idle_cpu.tick(wake_detector)
                 # Use Vosk to detect wake word
-                if wake_word_rec.AcceptWaveform(data):
-                    result = json.loads(wake_word_rec.Result())
-                    text = result.get("text", "").lower().strip()
-                    
+                if wake_detector.process(data):
                     # Check cooldown period to avoid immediate re-triggering
                     time_since_last_wake = time.time() - last_wake_word_time
                     
-                    # Check if wake word phrase is in the recognized text
-                    if WAKE_WORD_PHRASE.lower() in text and time_since_last_wake >= WAKE_WORD_COOLDOWN:
-                        print(f"Wake Word '{WAKE_WORD_PHRASE}' detected!")
+                    if time_since_last_wake >= WAKE_WORD_COOLDOWN:
+                        print(f"Wake Word '{phrase}' detected!")
+                        tracer.start_turn()
+                        tracer.mark('wake')
                         last_wake_word_time = time.time()
-                        play_audio("beep.wav") 
-                        state = 'listening_command'
-                        command_start_time = time.time()
+                        if WAKE_WORD_INLINE_COMMAND:
+                            # "hola, qué hora es": the command came in the same utterance
+                            text = transcribe_inline_command(rec, wake_detector.utterance_audio(), phrase)
                         rec.Reset()  # Reset STT recognizer
-                        wake_word_rec.Reset()  # Reset wake word recognizer
-                        print("Listening for your command...")
+                        wake_detector.reset()  # Reset wake word recognizer
+                        if not text or get_inline_command_beep():
+                            play_audio("beep.wav") 
+                        tracer.mark('listening')
+                        if text:
+                            tracer.mark('speech_end')
+                        else:
+                            state = 'listening_command'
+                            endpointer.reset()
+                            last_partial = ""
+                            print("Listening for your command...")
+                if not text:
+                    continue
             
             # State: LISTENING_COMMAND - Capture speech to text
             elif state == 'listening_command':
-                # Check for timeout
-                elapsed = time.time() - command_start_time
-                if elapsed > COMMAND_TIMEOUT:
-                    print("Command timeout. Returning to wake word detection.")
-                    state = 'idle'
-                    continue
-                
+                text = None
+                speech = wake_detector.vad.is_speech(data)
                 if rec.AcceptWaveform(data):
-                    result = rec.Result()
-                    result_json = json.loads(result)
-                    text = result_json.get("text", "").strip()
-                    
+                    text = json.loads(rec.Result()).get("text", "").strip()
                     if text:
-                        print(f"Command received: {text}")
-                        state = 'processing'
-                        
-                        # Process the command
-                        speak("Thinking...")
-                        
-                        # Check for local intents first
-                        local_response = process_local_intents(text)
-                        
-                        if local_response:
-                            # If local intent matched, speak response directly
-                            speak(local_response)
-                        else:
-                            # Process with LLM (streaming)
-                            # System prompt is already set in the client, just send the user's text
-                            response_generator = llm_client.chat_stream(text)
-                            speak_stream(response_generator)
-                        
-                        # Return to idle state after processing
-                        print(f"\nWaiting for '{WAKE_WORD_PHRASE}'...")
-                        wake_word_rec.Reset()  # Reset wake word recognizer
-                        state = 'idle'
+                        tracer.mark('speech_end')  # Vosk found the endpoint itself
                 else:
-                    # Vosk is processing partial results
-                    # Check partial to give user feedback
-                    partial = rec.PartialResult()
-                    partial_json = json.loads(partial)
-                    partial_text = partial_json.get("partial", "")
-                    if partial_text:
-                        # User is speaking, reset timeout
-                        command_start_time = time.time()
+                    # A changing partial result also means the user is still speaking
+                    partial_text = json.loads(rec.PartialResult()).get("partial", "")
+                    if partial_text != last_partial:
+                        speech = True
+                        last_partial = partial_text
+                    if speculator is not None:
+                        speculator.observe(partial_text)
+                endpoint = endpointer.process(speech)
+
+                if not text and endpoint == Endpointer.SPEECH_ENDED:
+                    # Speech is over: force the final result instead of waiting for Vosk
+                    tracer.mark('speech_end')
+                    text = json.loads(rec.FinalResult()).get("text", "").strip()
+                    if not text:
+                        # It was only noise, keep waiting for the command
+                        endpointer.resume()
 
+                if not text:
+                    if endpoint == Endpointer.NO_SPEECH:
+                        print("Command timeout. Returning to wake word detection.")
+                        if speculator is not None:
+                            speculator.reset()
+                        tracer.end_turn('no_speech')
+                        idle_cpu.reset()
+                        state = 'idle'
+                    continue
+
+
+            print(f"Command received: {text}")
+            tracer.mark('command')
+            tracer.set('command_chars', len(text))
+            state = 'processing'
+            
+            # Acknowledge while we look up intents and wait for the first token;
+            # the cue is cut as soon as the real answer is ready to play
+            cue = BackgroundCue(THINKING_MESSAGE)
+
+            # Keep listening for the wake word while we answer
+            turn_cancel = threading.Event()
+            barge_in = None
+            if barge_in_detector is not None:
+                def interrupt_turn():
+                    print(f"\n[Barge-in: '{phrase}' heard, stopping the answer]")
+                    turn_cancel.set()
+                    llm_client.cancel()
+                    playback.interrupt()
+                    cue.stop()
+                barge_in = BargeInMonitor(capture, barge_in_detector, interrupt_turn)
+                barge_in.start()
+            
+            # Check for local intents first
+            local_response = process_local_intents(text)
+            tracer.mark('intent_done')
+            tracer.set('intent', 'local' if local_response else 'llm')
+            
+            if local_response:
+                if speculator is not None:
+                    speculator.reset()  # An early request is not needed
+                # If local intent matched, speak response directly
+                speak(local_response, on_audio_ready=cue.stop)
+            else:
+                # Process with LLM (streaming)
+                # The answer may already be on its way if the question was sent early
+                response_generator = None
+                if speculator is not None:
+                    response_generator = speculator.take(text, cancel_event=turn_cancel)
+                if response_generator is None:
+                    # System prompt is already set in the client, just send the user's text
+                    response_generator = llm_client.chat_stream(text, cancel_event=turn_cancel)
+                speak_stream(response_generator, on_first_audio=cue.stop)
+            cue.stop()
+            barged_in = barge_in is not None and barge_in.stop()
+            playback.reset()
+            
+            wake_detector.reset()  # Reset wake word recognizer
+            idle_cpu.reset()  # Only measure time spent idle
+            tts_engine.ensure_running()  # Respawn Piper now rather than on the next turn
+            stats = capture.stats()
+            if stats['input_overflows'] or stats['dropped_blocks']:
+                print(f"[Audio capture: {stats['input_overflows']} overflows, "
+                      f"{stats['dropped_blocks']} dropped blocks]")
+            if audio_output.underruns != output_underruns:
+                print(f"[Audio output: {audio_output.underruns - output_underruns} underruns]")
+                tracer.set('output_underruns', audio_output.underruns - output_underruns)
+                output_underruns = audio_output.underruns
+
+            tracer.end_turn('barge_in' if barged_in else 'answered')
+            if barged_in:
+                # The wake word was said over the answer: take the new command now.
+                # The audio after the wake word is still in the capture buffer.
+                tracer.start_turn()
+                tracer.mark('wake')
+                last_wake_word_time = time.time()
+                play_audio("beep.wav")
+                tracer.mark('listening')
+                state = 'listening_command'
+                endpointer.reset()
+                last_partial = ""
+                rec.Reset()
+                print("Listening for your command...")
+            else:
+                # Return to idle state after processing
+                print(f"\nWaiting for '{phrase}'...")
+                # Drop the audio captured while we were talking (our own voice)
+                capture.skip_to_latest()
+                state = 'idle'
+
+    except KeyboardInterrupt:
+        print("\nExiting...")
+    finally:
+        tracer.end_turn('exit')
+        remove_pid_file()
+        capture.stop()
+        p.terminate()
+        tts_engine.shutdown()
+        audio_output.stop()
+        print(audio_cache.format_stats())
+        if speculator is not None:
+            print(speculator.format_stats())
+        weather_provider.stop()
+
+def run_satellite(hub_address, name=None):
+    """Satellite mode: stream the microphone to a hub and play its answers"""
+    from satellite import Satellite
+    from satellite_protocol import DEFAULT_PORT
+    host, _, port = hub_address.partition(':')
+    create_beep_wav("beep.wav")
+    p, capture = open_microphone()
+    open_speaker()
+    satellite = Satellite(capture, audio_output, host, int(port) if port else DEFAULT_PORT,
+                          name=name, language=get_language())
+    try:
+        satellite.run()
     except KeyboardInterrupt:
         print("\nExiting...")
     finally:
-        stream.stop_stream()
-        stream.close()
+        satellite.stop()
+        capture.stop()
         p.terminate()
+        audio_output.stop()
+        print(f"Satellite stats: {satellite.stats()}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Voice assistant")
+    parser.add_argument("--satellite", metavar="HUB_HOST[:PORT]",
+                        help="only capture and play audio; a hub (assistant_hub.py) does the rest")
+    parser.add_argument("--name", help="satellite name, e.g. the room (default: the hostname)")
+    args = parser.parse_args()
+    if args.satellite:
+        run_satellite(args.satellite, args.name)
+    else:
+        main()
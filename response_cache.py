@@ -0,0 +1,117 @@
+"""
+Cache of LLM answers for repeated questions ("quién eres", "cuéntame un chiste").
+
+Keys are built from the normalized user text, the language and the system
+prompt. Entries are evicted by LRU order and by age, and can optionally be
+persisted to a JSON file so they survive restarts.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# Maximum number of cached answers
+RESPONSE_CACHE_SIZE = 128
+# Seconds a cached answer stays valid
+RESPONSE_CACHE_TTL = 7 * 24 * 3600.0
+
+# Queries that depend on the conversation or on the current moment are never cached
+UNCACHEABLE_PATTERNS = [
+    r"\b(eso|esto|antes|anterior|otra vez|de nuevo|lo que (dije|dijiste)|repite|repitelo)\b",
+    r"\b(hoy|ahora|manana|ayer|esta semana|noticias|ultim[oa]s?)\b",
+    r"\b(that|this|it|before|previous|again|repeat|what i said)\b",
+    r"\b(today|now|tomorrow|yesterday|this week|news|latest)\b",
+    # Follow-ups only make sense after the previous answer ("otro", "y en Madrid?", "why?")
+    r"\b(otr[oa]s?|un[oa] mas|algo mas|por que|porque)\b",
+    r"^(y|pero|mas|entonces)\b",
+    r"\b(another|one more|something else|why)\b",
+    r"^(and|but|more|so|what about|how about)\b",
+]
+_UNCACHEABLE_RE = re.compile("|".join(UNCACHEABLE_PATTERNS))
+
+def normalize_text(text):
+    """Lowercase, strip accents and punctuation, collapse whitespace"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+def is_cacheable(text):
+    normalized = normalize_text(text)
+    return bool(normalized) and not _UNCACHEABLE_RE.search(normalized)
+
+class ResponseCache:
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, persist_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self._entries = OrderedDict()  # key -> (stored_at, answer), oldest first
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+
+        if persist_path:
+            self._load()
+
+    @staticmethod
+    def make_key(user_message, language, system_prompt):
+        raw = json.dumps([normalize_text(user_message), language, system_prompt or ""],
+                         ensure_ascii=False)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] >= self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, answer):
+        with self._lock:
+            self._entries[key] = (time.time(), answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if self.persist_path:
+                self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self.persist_path:
+                self._save()
+
+    def _load(self):
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, 'r') as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[Warning: could not read response cache {self.persist_path}: {e}]")
+            return
+        now = time.time()
+        for key, stored_at, answer in stored[-self.max_entries:]:
+            if now - stored_at < self.ttl:
+                self._entries[key] = (stored_at, answer)
+
+    def _save(self):
+        tmp_path = f"{self.persist_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump([[key, stored_at, answer] for key, (stored_at, answer) in self._entries.items()],
+                          f, ensure_ascii=False)
+            os.replace(tmp_path, self.persist_path)
+        except OSError as e:
+            print(f"[Warning: could not write response cache {self.persist_path}: {e}]")
@@ -0,0 +1,179 @@
+"""
+Asyncio client for the RKLLM Gradio server.
+
+gradio_client jobs are blocking iterators, so each job is consumed on an
+executor thread and its decoded events are handed to the event loop through
+an asyncio.Queue. The async side enforces a connect deadline, a first-token
+deadline and a total deadline, and cancellation (cancel(), a deadline, or
+the consuming task being cancelled) also cancels the job on the server so
+it stops generating tokens.
+"""
+import asyncio
+import threading
+
+from rkllm_client import RKLLMClient
+from stream_decoder import DELTA, DONE, ERROR, StreamDecoder, StreamEvent
+
+# Seconds to create the Gradio client (fetches the API schema) and submit a job
+CONNECT_TIMEOUT = 10.0
+# Seconds from submitting a request until the first piece of text arrives
+FIRST_TOKEN_TIMEOUT = 20.0
+# Seconds for the whole answer
+TOTAL_TIMEOUT = 120.0
+
+class RKLLMTimeoutError(Exception):
+    pass
+
+_END = object()
+
+class AsyncRKLLMClient(RKLLMClient):
+    def __init__(self, url=None, system_prompt=None, response_cache=None, language=None,
+                 history=None, connect_timeout=CONNECT_TIMEOUT,
+                 first_token_timeout=FIRST_TOKEN_TIMEOUT, total_timeout=TOTAL_TIMEOUT):
+        super().__init__(url=url, system_prompt=system_prompt, response_cache=response_cache,
+                         language=language, history=history, connect=False)
+        self.connect_timeout = connect_timeout
+        self.first_token_timeout = first_token_timeout
+        self.total_timeout = total_timeout
+        self._streams = set()  # cancel_event of each stream in progress, under _jobs_lock
+
+    async def open(self):
+        """Connect to the server. Raises RKLLMTimeoutError after connect_timeout."""
+        if self.client is not None:
+            return
+        print(f"Connecting to RKLLM API at: {self.url}")
+        from gradio_client import Client  # Slow import, deferred until the first connection
+        loop = asyncio.get_running_loop()
+        try:
+            self.client = await asyncio.wait_for(
+                loop.run_in_executor(None, lambda: Client(self.url, verbose=False)),
+                self.connect_timeout)
+        except asyncio.TimeoutError:
+            raise RKLLMTimeoutError(f"could not connect to {self.url} in {self.connect_timeout}s")
+
+    def cancel(self, cancel_event=None):
+        """
+        Cancel requests in flight, here and on the server: the stream given by its
+        cancel_event, otherwise all of them. Safe to call from any thread.
+        The cancelled streams then end without a DONE event.
+        """
+        with self._jobs_lock:
+            events = [cancel_event] if cancel_event is not None else list(self._streams)
+        for event in events:
+            event.set()
+        super().cancel(cancel_event)
+
+    def _pump(self, job, loop, events, cancelled):
+        """Executor thread: iterate the blocking job and forward decoded events"""
+        decoder = StreamDecoder()
+        try:
+            for update in job:
+                if cancelled.is_set():
+                    break
+                event = decoder.feed(update)
+                if event is not None:
+                    loop.call_soon_threadsafe(events.put_nowait, event)
+            if not cancelled.is_set():
+                loop.call_soon_threadsafe(events.put_nowait, decoder.finish())
+        except Exception as e:
+            loop.call_soon_threadsafe(events.put_nowait,
+                                      StreamDecoder.error(f" [Streaming interrupted: {e}]"))
+        finally:
+            loop.call_soon_threadsafe(events.put_nowait, _END)
+
+    async def stream(self, user_message, cacheable=None, cancel_event=None):
+        """
+        Async iterator of StreamEvents (DELTA..., then DONE or ERROR).
+        Deadlines produce an ERROR event and cancel the server-side job.
+        cancel_event, a threading.Event, abandons this stream only when set;
+        one is created if not given.
+        """
+        cache_key = self._cache_key(user_message, cacheable)
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                self.history.add_exchange(user_message, cached)
+                yield StreamEvent(DELTA, cached)
+                yield StreamEvent(DONE, cached)
+                return
+
+        cancelled = cancel_event if cancel_event is not None else threading.Event()
+        with self._jobs_lock:
+            self._streams.add(cancelled)
+        try:
+            try:
+                await self.open()
+            except RKLLMTimeoutError as e:
+                yield StreamDecoder.error(f"Error: {e}")
+                return
+
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            messages_history = self._build_messages(user_message)
+            try:
+                job = await asyncio.wait_for(
+                    loop.run_in_executor(None, lambda: self.client.submit(
+                        history=messages_history, api_name="/get_RKLLM_output")),
+                    self.connect_timeout)
+            except asyncio.TimeoutError:
+                yield StreamDecoder.error(f"Error submitting request: no answer in {self.connect_timeout}s")
+                return
+            except Exception as e:
+                yield StreamDecoder.error(f"Error submitting request: {e}")
+                return
+
+            self._track_job(job, cancelled)
+            if cancelled.is_set():
+                # Cancelled while it was being submitted: cancel() did not see the job yet
+                if self._untrack_job(job):
+                    loop.run_in_executor(None, self._cancel_job, job)
+                return
+            events = asyncio.Queue()
+            loop.run_in_executor(None, self._pump, job, loop, events, cancelled)
+            first_token_deadline = start + self.first_token_timeout
+            total_deadline = start + self.total_timeout
+            got_first_token = False
+            finished = False
+            try:
+                while True:
+                    deadline = total_deadline if got_first_token else min(first_token_deadline, total_deadline)
+                    try:
+                        event = await asyncio.wait_for(events.get(), max(0.0, deadline - loop.time()))
+                    except asyncio.TimeoutError:
+                        which = "total" if got_first_token else "first token"
+                        yield StreamDecoder.error(f" [RKLLM {which} timeout]")
+                        return
+                    if event is _END:
+                        return  # Cancelled: the finally below cancels the job if cancel() did not
+                    if event.kind == DELTA:
+                        got_first_token = True
+                    elif event.kind == DONE:
+                        finished = True
+                        self._untrack_job(job)
+                        self.history.add_exchange(user_message, event.text)
+                        self._store_answer(cache_key, event.text)
+                    elif event.kind == ERROR:
+                        finished = True
+                    yield event
+            finally:
+                if not finished:
+                    # Timeout, consumer stopped early or task cancelled: stop the server too.
+                    # job.cancel() makes an HTTP request, so keep it off the event loop.
+                    cancelled.set()
+                    if self._untrack_job(job):
+                        loop.run_in_executor(None, self._cancel_job, job)
+        finally:
+            with self._jobs_lock:
+                self._streams.discard(cancelled)
+
+    async def ask(self, user_message, cacheable=None):
+        """Return the full answer as a string (errors are returned as text)"""
+        parts = []
+        async for event in self.stream(user_message, cacheable):
+            if event.kind == DELTA:
+                parts.append(event.text)
+            elif event.kind == DONE:
+                return event.text
+            elif event.kind == ERROR:
+                return "".join(parts) + event.text
+        return "".join(parts)
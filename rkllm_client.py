@@ -1,94 +1,178 @@
-from gradio_client import Client
+import heapq
 import sys
+import threading
+import time
 import traceback
-import json
-import os
+from collections import deque
 
-# API Configuration
-CONFIG_FILE = "config.json"
+from config_store import get_rkllm_api_url
+from conversation_history import ConversationHistory, estimate_tokens
+from response_cache import is_cacheable
+from stream_decoder import DELTA, DONE, StreamDecoder, StreamEvent, last_message_text
+from turn_trace import percentile, tracer
 
-def load_config():
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            pass
-    return {}
+# Requests LLMScheduler lets through to the server at once (the NPU generates one answer well)
+SCHEDULER_MAX_CONCURRENT = 1
+# Questions of at most this many estimated tokens are short and are served first
+SHORT_REQUEST_TOKENS = 12
+# Recent queue waits kept for the wait-time stats
+SCHEDULER_WAIT_SAMPLES = 200
+
+# Seconds a job cancelled before it started is watched, to cancel it on the server too
+CANCEL_EVENT_ID_WAIT = 5.0
+
+# Request priorities, lowest served first
+PRIORITY_SHORT = 0
+PRIORITY_NORMAL = 1
 
 class RKLLMClient:
-    def __init__(self, url=None, system_prompt=None):
+    def __init__(self, url=None, system_prompt=None, response_cache=None, language=None,
+                 history=None, connect=True, scheduler=None, session_id=None):
         if url is None:
-            config = load_config()
-            # Default to localhost if not specified, as we run the server locally
-            url = config.get('rkllm_api_url', "http://localhost:8080/")
-            
-        print(f"Connecting to RKLLM API at: {url}")
-        self.client = Client(url)
-        self.history = []
-        self.system_prompt_sent = False
+            # Defaults to localhost if not configured, as we run the server locally
+            url = get_rkllm_api_url()
+        self.url = url
+        self.client = None
+        # Bounded ConversationHistory; only a window that fits its budget is sent
+        self.history = history if history is not None else ConversationHistory()
         self.system_prompt = system_prompt
+        # Optional ResponseCache for repeated questions
+        self.response_cache = response_cache
+        self.language = language
+        self._jobs = {}  # Gradio job of each answer being streamed -> its cancel_event
+        self._jobs_lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        # LLMScheduler this client is a session of: it shares the connection and queues requests
+        self.scheduler = scheduler
+        self.session_id = session_id  # Its key in the scheduler
+        if connect:
+            self.connect()
+
+    def connect(self):
+        """
+        Create the Gradio client (fetches the API schema from the server).
+        Does nothing if already connected; a call made while another thread is
+        connecting waits for it, so main() can connect in the background.
+        """
+        if self.scheduler is not None:
+            self.scheduler.connect()
+            self.client = self.scheduler.client
+            return
+        from gradio_client import Client  # Slow import, deferred to the connecting thread
+        with self._connect_lock:
+            if self.client is None:
+                print(f"Connecting to RKLLM API at: {self.url}")
+                self.client = Client(self.url)
+
+    @staticmethod
+    def _cancel_job(job):
+        if job is None:
+            return
+        communicator = getattr(job, 'communicator', None)
+        if communicator is not None and communicator.event_id is None:
+            # The server has not given the job an event id yet. Cancelling now would
+            # only drop it locally (and stop the id from arriving) while the server
+            # still runs it, so cancel once the id is known.
+            threading.Thread(target=RKLLMClient._cancel_when_started, args=(job,),
+                             daemon=True).start()
+            return
+        try:
+            job.cancel()
+        except Exception as e:
+            print(f"[Warning: could not cancel RKLLM job: {e}]")
+
+    @staticmethod
+    def _cancel_when_started(job):
+        deadline = time.monotonic() + CANCEL_EVENT_ID_WAIT
+        while job.communicator.event_id is None and not job.done():
+            if time.monotonic() > deadline:
+                break
+            time.sleep(0.02)
+        try:
+            job.cancel()
+        except Exception as e:
+            print(f"[Warning: could not cancel RKLLM job: {e}]")
+
+    def _track_job(self, job, cancel_event):
+        """Register a job being streamed so cancel() can reach it"""
+        with self._jobs_lock:
+            self._jobs[job] = cancel_event
 
-    def _ensure_content_string(self, content):
+    def _untrack_job(self, job):
+        """Forget this job only: another request may be streaming on this client"""
+        with self._jobs_lock:
+            return self._jobs.pop(job, None) is not None
+
+    def cancel(self, cancel_event=None):
         """
-        Ensure content is a string.
+        Cancel the requests being streamed on the server right away, so they stop
+        generating tokens: only the one streamed with cancel_event if given,
+        otherwise all of them. Safe to call from any thread; chat_events callers
+        pass a cancel_event as well so the stream ends without a DONE event.
         """
-        if isinstance(content, str):
-            return content
-        if isinstance(content, list):
-            # If it's the complex format [{'text': '...', 'type': 'text'}]
-            if len(content) > 0 and isinstance(content[0], dict) and 'text' in content[0]:
-                return content[0]['text']
-            return " ".join([str(c) for c in content])
-        return str(content)
+        with self._jobs_lock:
+            jobs = [job for job, event in self._jobs.items()
+                    if cancel_event is None or event is cancel_event]
+            for job in jobs:
+                del self._jobs[job]
+        for job in jobs:
+            self._cancel_job(job)
 
-    def _format_history_for_api(self):
+    def _build_messages(self, user_message):
         """
-        Convert internal history to the message format expected by the API.
+        Build the message list for a request: the system prompt, the recent
+        history that fits the token budget and the new user message.
         Each message must be: {'role': 'user', 'content': 'string'}
         """
-        messages = []
-        for item in self.history:
-            # If already in dict format with role and content
-            if isinstance(item, dict) and 'role' in item and 'content' in item:
-                messages.append({
-                    "role": item['role'],
-                    "content": self._ensure_content_string(item['content'])
-                })
-            # If in tuple format [user_msg, bot_msg], convert to message dicts
-            elif isinstance(item, (list, tuple)) and len(item) >= 2:
-                messages.append({
-                    "role": "user",
-                    "content": str(item[0])
-                })
-                messages.append({
-                    "role": "assistant",
-                    "content": str(item[1])
-                })
-        return messages
-
-    def chat(self, user_message):
+        if self.history.check_idle():
+            print("[Conversation idle for too long, starting a new one]")
+
+        reserve = estimate_tokens(user_message)
+        if self.system_prompt:
+            reserve += estimate_tokens(self.system_prompt)
+        messages_history = self.history.window(reserve_tokens=reserve)
+
+        # The system prompt always stays at the start, whatever is trimmed
+        if self.system_prompt:
+            messages_history.insert(0, {
+                "role": "system",
+                "content": self.system_prompt
+            })
+
+        # Add user message
+        messages_history.append({
+            "role": "user",
+            "content": user_message
+        })
+        return messages_history
+
+    def _cache_key(self, user_message, cacheable):
+        """
+        Return the cache key for this message, or None if it must not be cached.
+        cacheable=None decides from the text; True/False overrides it.
+        """
+        if self.response_cache is None or cacheable is False:
+            return None
+        if cacheable is None and not is_cacheable(user_message):
+            return None
+        return self.response_cache.make_key(user_message, self.language, self.system_prompt)
+
+    def chat(self, user_message, cacheable=None, priority=None):
         """
         Sends a message to the Gradio API and returns the full response.
         Maintains conversation history in the instance.
+        priority (PRIORITY_*) orders the request in the scheduler's queue, if any.
         """
+        cache_key = self._cache_key(user_message, cacheable)
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                self.history.add_exchange(user_message, cached)
+                return cached
+
         try:
             # Format message properly for chat API
-            messages_history = self._format_history_for_api()
-            
-            # Add system prompt if needed
-            if self.system_prompt and not self.system_prompt_sent:
-                messages_history.insert(0, {
-                    "role": "system",
-                    "content": self.system_prompt
-                })
-                self.system_prompt_sent = True
-            
-            # Add user message
-            messages_history.append({
-                "role": "user",
-                "content": user_message
-            })
+            messages_history = self._build_messages(user_message)
             
             # Step 1: Send user input (/get_user_input)
             # We bypass this as it seems to be a UI helper that crashes with API usage
@@ -96,65 +180,85 @@ class RKLLMClient:
             
             # Step 2: Get model response (/get_RKLLM_output)
             # Returns: history_with_response
-            result_step2 = self.client.predict(
-                history=history_with_user,
-                api_name="/get_RKLLM_output"
-            )
-            
-            # Update our local history
-            self.history = result_step2
+            self.connect()  # In case the connection at startup failed
+            if self.scheduler is not None:
+                self.scheduler.acquire(self.scheduler.priority_for(user_message, priority))
+            try:
+                result_step2 = self.client.predict(
+                    history=history_with_user,
+                    api_name="/get_RKLLM_output"
+                )
+            finally:
+                if self.scheduler is not None:
+                    self.scheduler.release()
             
-            # Extract the last assistant message
-            if self.history:
-                last_interaction = self.history[-1]
-                # Check if it's in message dict format
-                if isinstance(last_interaction, dict) and 'content' in last_interaction:
-                    content = last_interaction['content']
-                    # If content is a list of objects, extract text
-                    if isinstance(content, list) and len(content) > 0:
-                        if isinstance(content[0], dict) and 'text' in content[0]:
-                            return content[0]['text']
-                    # If content is a string (shouldn't happen with new format)
-                    elif isinstance(content, str):
-                        return content
-                # Check if it's in tuple format
-                elif isinstance(last_interaction, (list, tuple)) and len(last_interaction) > 1:
-                    bot_response = last_interaction[1]
-                    return bot_response
+            answer = last_message_text(result_step2)
+            if answer is not None:
+                # Update our local history
+                self.history.add_exchange(user_message, answer)
+                return self._store_answer(cache_key, answer)
                 
             return "Error: Could not retrieve response from history."
 
         except Exception as e:
             return f"Error connecting to Gradio: {str(e)}"
 
-    def chat_stream(self, user_message):
+    def _store_answer(self, cache_key, answer):
+        if cache_key is not None and isinstance(answer, str) and answer.strip():
+            self.response_cache.put(cache_key, answer)
+        return answer
+
+    def chat_events(self, user_message, cacheable=None, cancel_event=None, priority=None):
         """
-        Sends a message to the Gradio API and yields the response incrementally.
+        Sends a message to the Gradio API and yields StreamEvents:
+        DELTA for each piece of new text, then DONE with the full answer,
+        or ERROR with a message if the request failed.
+        Cached answers are yielded as a single DELTA followed by DONE.
+        cancel_event, a threading.Event, abandons the answer when set: the server
+        job is cancelled and the stream ends without DONE (nothing is stored).
+        priority (PRIORITY_*) orders the request in the scheduler's queue, if any.
         """
+        if cancel_event is None:
+            cancel_event = threading.Event()
+        cache_key = self._cache_key(user_message, cacheable)
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                tracer.set('llm_cache', 'hit')
+                self.history.add_exchange(user_message, cached)
+                yield StreamEvent(DELTA, cached)
+                yield StreamEvent(DONE, cached)
+                return
+
+        if self.scheduler is None:
+            yield from self._stream_answer(user_message, cache_key, cancel_event)
+            return
+        # Wait for our turn on the server; a request cancelled while queued is dropped quietly
+        if not self.scheduler.acquire(self.scheduler.priority_for(user_message, priority), cancel_event):
+            return
+        try:
+            yield from self._stream_answer(user_message, cache_key, cancel_event)
+        finally:
+            self.scheduler.release()
+
+    def _stream_answer(self, user_message, cache_key, cancel_event):
+        """Submit the request and yield its events (chat_events past the cache)"""
         try:
             # Format message properly for chat API
-            messages_history = self._format_history_for_api()
-            
-            # Add system prompt if needed
-            if self.system_prompt and not self.system_prompt_sent:
-                messages_history.insert(0, {
-                    "role": "system",
-                    "content": self.system_prompt
-                })
-                self.system_prompt_sent = True
-            
-            # Add user message
-            messages_history.append({
-                "role": "user",
-                "content": user_message
-            })
+            messages_history = self._build_messages(user_message)
             
             # Step 1: Send user input
             # We bypass this as it seems to be a UI helper that crashes with API usage
             history_with_user = messages_history
             
             # Step 2: Request stream
+            if cancel_event.is_set():
+                return
+            tracer.mark('llm_submit')
             try:
+                self.connect()  # In case the connection at startup failed
+                if cancel_event.is_set():
+                    return  # Cancelled while connecting
                 job = self.client.submit(
                     history=history_with_user,
                     api_name="/get_RKLLM_output"
@@ -162,71 +266,195 @@ class RKLLMClient:
             except Exception as e:
                 print(f"[ERROR] Failed to submit job to /get_RKLLM_output: {str(e)}")
                 traceback.print_exc()
-                yield f"Error submitting request: {str(e)}"
+                tracer.error('llm', e)
+                yield StreamDecoder.error(f"Error submitting request: {str(e)}")
                 return
             
-            current_full_text = ""
-            intermediate_output = None
-            error_occurred = False
-            
+            self._track_job(job, cancel_event)
+            if cancel_event.is_set():
+                # Cancelled while it was being submitted: cancel() did not see the job yet
+                self.cancel(cancel_event)
+            decoder = StreamDecoder()
             try:
+                # Each update is the full history; the decoder only extracts the new text
                 for intermediate_output in job:
-                    # Debug: trace what we get
-                    print(f" DEBUG: Received update type {type(intermediate_output)}")
-                    if intermediate_output:
-                        print(f" DEBUG: Last interaction: {intermediate_output[-1]}")
-                    
-                    # intermediate_output is the full history at that point
-                    if intermediate_output:
-                        last_interaction = intermediate_output[-1]
-                        # print(f" DEBUG: Last interaction: {last_interaction}")
-                        
-                    # Handle dict format (messages with role/content)
-                    if isinstance(last_interaction, dict) and 'content' in last_interaction:
-                        content = last_interaction['content']
-                        # Content is a list of objects with 'text' field
-                        if isinstance(content, list) and len(content) > 0:
-                            if isinstance(content[0], dict) and 'text' in content[0]:
-                                full_text = content[0]['text']
-                            else:
-                                continue
-                        # Fallback for string content (shouldn't happen)
-                        elif isinstance(content, str):
-                            full_text = content
-                        else:
-                            continue
-                    # Handle tuple format (legacy)
-                    elif isinstance(last_interaction, (list, tuple)) and len(last_interaction) > 1:
-                        full_text = last_interaction[1]
-                    else:
-                        continue
-                        
-                    if full_text is None:
-                        continue 
-                    
-                    # Calculate new chunk
-                    if len(full_text) > len(current_full_text):
-                        chunk = full_text[len(current_full_text):]
-                        current_full_text = full_text
-                        yield chunk
+                    if cancel_event.is_set():
+                        break
+                    event = decoder.feed(intermediate_output)
+                    if event is not None:
+                        tracer.mark('llm_first_token')
+                        yield event
             except Exception as e:
-                print(f"[ERROR] Error during streaming: {str(e)}")
-                traceback.print_exc()
-                error_occurred = True
-                yield f" [Streaming interrupted: {str(e)}]"
-                            
+                if not cancel_event.is_set():
+                    print(f"[ERROR] Error during streaming: {str(e)}")
+                    traceback.print_exc()
+                    tracer.error('llm', e)
+                    yield StreamDecoder.error(f" [Streaming interrupted: {str(e)}]")
+                    return
+            finally:
+                self._untrack_job(job)
+
+            if cancel_event.is_set():
+                # Stop the server too (a no-op if cancel() already did)
+                self._cancel_job(job)
+                print("\n[LLM answer cancelled]")
+                tracer.set('llm_cancelled', True)
+                return
+
             # Update history at the end (only if no error)
-            if not error_occurred and intermediate_output is not None:
-                self.history = intermediate_output
+            if decoder.last_update is not None:
+                self.history.add_exchange(user_message, decoder.text)
+                self._store_answer(cache_key, decoder.text)
+            tracer.mark('llm_done')
+            tracer.set('llm_answer_chars', len(decoder.text))
+            yield decoder.finish()
             
         except Exception as e:
             print(f"[ERROR] Unexpected error in chat_stream: {str(e)}")
             traceback.print_exc()
-            yield f"Error: {str(e)}"
+            tracer.error('llm', e)
+            yield StreamDecoder.error(f"Error: {str(e)}")
+
+    def chat_stream(self, user_message, cacheable=None, cancel_event=None, priority=None):
+        """
+        Sends a message to the Gradio API and yields the response incrementally.
+        Errors are yielded as text so they are spoken to the user.
+        """
+        for event in self.chat_events(user_message, cacheable, cancel_event, priority):
+            if event.kind != DONE:
+                yield event.text
 
     def clear_history(self):
-        self.history = []
-        self.system_prompt_sent = False
+        self.history.clear()
+
+class LLMScheduler:
+    """
+    Shares one RKLLM server between several conversations (rooms, users).
+
+    session(session_id) returns an RKLLMClient with its own history and system
+    prompt, over one connection shared by all sessions. Requests that reach
+    the server wait in a priority queue (short questions first, then in
+    arrival order) and at most max_concurrent are generated at a time.
+    """
+
+    def __init__(self, url=None, response_cache=None, max_concurrent=SCHEDULER_MAX_CONCURRENT,
+                 history_factory=ConversationHistory):
+        """history_factory() creates the ConversationHistory of each new session"""
+        if url is None:
+            url = get_rkllm_api_url()
+        self.url = url
+        self.response_cache = response_cache
+        self.max_concurrent = max_concurrent
+        self.history_factory = history_factory
+        self.client = None
+        self.sessions = {}
+        self._connect_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._queue = []     # Heap of (priority, sequence) tickets
+        self._sequence = 0
+        self._running = 0
+        self._waits = deque(maxlen=SCHEDULER_WAIT_SAMPLES)  # (priority, seconds queued)
+
+        # Counters
+        self.requests = 0
+        self.cancelled = 0   # Cancelled while still queued
+        self.max_queue_depth = 0
+
+    def connect(self):
+        """Create the Gradio client shared by the sessions (once)"""
+        from gradio_client import Client
+        with self._connect_lock:
+            if self.client is None:
+                print(f"Connecting to RKLLM API at: {self.url}")
+                self.client = Client(self.url)
+
+    def session(self, session_id, system_prompt=None, language=None):
+        """
+        The client of a session, created on first use. Its history lives as long
+        as the scheduler; a system prompt or language given later replaces the old one.
+        """
+        with self._cond:
+            client = self.sessions.get(session_id)
+            if client is None:
+                client = RKLLMClient(url=self.url, system_prompt=system_prompt,
+                                     response_cache=self.response_cache, language=language,
+                                     history=self.history_factory(), connect=False, scheduler=self,
+                                     session_id=session_id)
+                self.sessions[session_id] = client
+            else:
+                if system_prompt is not None:
+                    client.system_prompt = system_prompt
+                if language is not None:
+                    client.language = language
+            return client
+
+    def end_session(self, session_id):
+        """Forget a session and its history, cancelling its answer in progress"""
+        with self._cond:
+            client = self.sessions.pop(session_id, None)
+        if client is not None:
+            client.cancel()
+
+    def priority_for(self, user_message, priority=None):
+        if priority is not None:
+            return priority
+        return PRIORITY_SHORT if estimate_tokens(user_message) <= SHORT_REQUEST_TOKENS else PRIORITY_NORMAL
+
+    def acquire(self, priority=PRIORITY_NORMAL, cancel_event=None):
+        """
+        Wait for a free slot on the server and take it. Returns False, without a
+        slot, if cancel_event is set while waiting. Every True must be release()d.
+        """
+        with self._cond:
+            self._sequence += 1
+            ticket = (priority, self._sequence)
+            heapq.heappush(self._queue, ticket)
+            self.requests += 1
+            self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+            queued_at = time.monotonic()
+            while self._running >= self.max_concurrent or self._queue[0] != ticket:
+                if cancel_event is not None and cancel_event.is_set():
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                    self.cancelled += 1
+                    self._cond.notify_all()
+                    return False
+                # Polled only to notice cancel_event; slots are handed over by notify
+                self._cond.wait(0.1 if cancel_event is not None else None)
+            heapq.heappop(self._queue)
+            self._running += 1
+            waited = time.monotonic() - queued_at
+            self._waits.append((priority, waited))
+            self._cond.notify_all()  # The next ticket may fit in another free slot
+        tracer.set('llm_queue_ms', round(1000.0 * waited, 1))
+        return True
+
+    def release(self):
+        with self._cond:
+            self._running -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            waits = list(self._waits)
+            stats = {
+                'sessions': len(self.sessions),
+                'queue_depth': len(self._queue),
+                'running': self._running,
+                'max_queue_depth': self.max_queue_depth,
+                'requests': self.requests,
+                'cancelled': self.cancelled,
+            }
+        for name, priority in (('short', PRIORITY_SHORT), ('normal', PRIORITY_NORMAL), ('all', None)):
+            samples = [1000.0 * w for p, w in waits if priority is None or p == priority]
+            p95 = percentile(samples, 95)
+            stats[f'wait_ms_{name}'] = {
+                'count': len(samples),
+                'avg': round(sum(samples) / len(samples), 1) if samples else None,
+                'p95': round(p95, 1) if p95 is not None else None,
+                'max': round(max(samples), 1) if samples else None,
+            }
+        return stats
 
 def chat_with_rkllm(prompt):
     """
@@ -50,7 +50,15 @@ if [ ! -d ".venv" ]; then
     python3 -m venv .venv
 fi
 source .venv/bin/activate
-pip install -r requirements.txt
+# Only reinstall when requirements.txt changed since the last successful install;
+# running pip on every start added seconds to each (config-triggered) restart
+REQUIREMENTS_STAMP=".venv/.requirements.sha256"
+REQUIREMENTS_HASH=$(sha256sum requirements.txt | awk '{print $1}')
+if [ ! -f "$REQUIREMENTS_STAMP" ] || [ "$(cat "$REQUIREMENTS_STAMP")" != "$REQUIREMENTS_HASH" ]; then
+    if pip install -r requirements.txt; then
+        echo "$REQUIREMENTS_HASH" > "$REQUIREMENTS_STAMP"
+    fi
+fi
 # Function to check if config.json exists and has minimal content
 check_config() {
     if [ ! -f "$CONFIG_FILE" ]; then
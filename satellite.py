@@ -0,0 +1,242 @@
+"""
+Satellite mode: a room device that only captures and plays audio.
+
+The microphone is gated locally by the voice activity detector, the same
+cheap gate that sits in front of the wake word recognizer, so only speech
+(with a little pre-roll) goes to the hub. The hub (assistant_hub.py) runs
+the wake word, STT, intents, LLM and TTS. It tells the satellite to beep
+and stream every block once the wake word is heard, and sends the answer
+back as WAV to play.
+
+Started with:
+    python3 main_assistant.py --satellite HUB_HOST[:PORT] [--name kitchen]
+"""
+import socket
+import threading
+from collections import deque
+
+from satellite_protocol import (AUDIO, BEEP, BYE, CREDIT, DEFAULT_PORT, HELLO, IDLE, LISTEN, PLAY,
+                                PROTOCOL_VERSION, REJECT, WELCOME, Connection, ProtocolError,
+                                decode_json)
+from vad import VoiceActivityDetector
+
+# Blocks sent before speech onset, so the start of the wake word is not clipped
+GATE_PREROLL_BLOCKS = 3
+# Blocks still sent after the last speech block (the hub needs the trailing silence)
+GATE_HANGOVER_BLOCKS = 4
+# Blocks kept while the hub grants no credit; the oldest are dropped
+BACKLOG_BLOCKS = 64
+# Answer segments waiting to play before the satellite stops reading from the hub
+MAX_QUEUED_SOUNDS = 3
+# Seconds between reconnection attempts (doubled up to the maximum)
+RECONNECT_DELAY = 1.0
+RECONNECT_MAX_DELAY = 30.0
+
+class SpeechGate:
+    """Pass speech blocks through, with pre-roll before the onset and a hangover after it"""
+
+    def __init__(self, vad=None, preroll_blocks=GATE_PREROLL_BLOCKS,
+                 hangover_blocks=GATE_HANGOVER_BLOCKS):
+        self.vad = vad if vad is not None else VoiceActivityDetector()
+        self.hangover_blocks = hangover_blocks
+        self._preroll = deque(maxlen=preroll_blocks)
+        self._hangover = 0
+
+    def reset(self):
+        self._preroll.clear()
+        self._hangover = 0
+
+    def process(self, data):
+        """Return the blocks to send for this one (none while the room is quiet)"""
+        if self.vad.is_speech(data):
+            self._hangover = self.hangover_blocks
+        elif self._hangover > 0:
+            self._hangover -= 1
+        else:
+            self._preroll.append(data)
+            return []
+        blocks = list(self._preroll) + [data]
+        self._preroll.clear()
+        return blocks
+
+class Satellite:
+    def __init__(self, capture, output, host, port=DEFAULT_PORT, name=None, beep_path="beep.wav",
+                 language=None, gate=None):
+        """
+        capture: AudioCapture (or anything with read(timeout)), 16 kHz mono blocks.
+        output: AudioOutput the answers and the beep are played on.
+        """
+        self.capture = capture
+        self.output = output
+        self.host = host
+        self.port = port
+        self.name = name or socket.gethostname()
+        self.beep_path = beep_path
+        self.language = language
+        self.gate = gate if gate is not None else SpeechGate()
+        self.session = None
+        self.listening = False  # The hub wants every block (a command is being spoken)
+        self._conn = None
+        self._credits = 0
+        self._backlog = deque(maxlen=BACKLOG_BLOCKS)
+        self._sounds = deque()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._lost = threading.Event()
+
+        # Counters
+        self.blocks_sent = 0
+        self.blocks_dropped = 0  # Backlog overflow while the hub granted no credit
+        self.answers_played = 0
+        self.connections = 0
+
+    def connect(self):
+        """Open a session with the hub. Raises ConnectionRefusedError if the hub rejects us."""
+        conn = Connection.connect(self.host, self.port)
+        hello = {'name': self.name, 'version': PROTOCOL_VERSION, 'rate': 16000}
+        if self.language:
+            hello['language'] = self.language
+        conn.send_json(HELLO, hello)
+        kind, payload = conn.recv()
+        message = decode_json(payload)
+        if kind == REJECT:
+            conn.close()
+            raise ConnectionRefusedError(f"hub rejected {self.name}: {message.get('reason')}")
+        if kind != WELCOME:
+            conn.close()
+            raise ProtocolError(f"expected WELCOME, got {kind!r}")
+        with self._lock:
+            self._conn = conn
+            self._credits = int(message.get('credits', 0))
+            self._backlog.clear()
+        self.session = message.get('session')
+        self.listening = False
+        self.gate.reset()
+        self._lost.clear()
+        self.connections += 1
+        threading.Thread(target=self._read_loop, args=(conn,), daemon=True).start()
+        print(f"Satellite '{self.name}' connected to {self.host}:{self.port} (session {self.session})")
+
+    def run(self):
+        """Stream to the hub until stop(), reconnecting when the connection drops"""
+        delay = RECONNECT_DELAY
+        while not self._stop.is_set():
+            try:
+                self.connect()
+                delay = RECONNECT_DELAY
+                self._stream()
+            except (OSError, EOFError, ProtocolError) as e:
+                if self._stop.is_set():
+                    break
+                print(f"[Satellite: {e}; reconnecting in {delay:.0f}s]")
+                self._stop.wait(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+            finally:
+                self._close()
+
+    def stop(self):
+        self._stop.set()
+        conn = self._conn
+        if conn is not None:
+            try:
+                conn.send(BYE)
+            except OSError:
+                pass
+        self._close()
+
+    def _close(self):
+        with self._lock:
+            conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.close()
+
+    def _playing(self):
+        """Drop finished sounds (capture and receive threads both call this); True if any is left"""
+        with self._lock:
+            while self._sounds and self._sounds[0].done.is_set():
+                self._sounds.popleft()
+            return bool(self._sounds)
+
+    def _oldest_if_full(self):
+        with self._lock:
+            if len(self._sounds) >= MAX_QUEUED_SOUNDS:
+                return self._sounds[0]
+            return None
+
+    def _stream(self):
+        while not self._stop.is_set() and not self._lost.is_set():
+            data = self.capture.read(timeout=0.5)
+            if data is None:
+                continue
+            if self.listening:
+                blocks = [data]
+            elif self._playing():
+                self.gate.reset()  # Our own voice
+                continue
+            else:
+                blocks = self.gate.process(data)
+            for block in blocks:
+                self._send_audio(block)
+        if self._lost.is_set() and not self._stop.is_set():
+            raise EOFError("hub closed the connection")
+
+    def _send_audio(self, block):
+        with self._lock:
+            if self._credits > 0 and not self._backlog:
+                self._credits -= 1
+                self.blocks_sent += 1
+                self._conn.send(AUDIO, block)
+                return
+            if len(self._backlog) == self._backlog.maxlen:
+                self.blocks_dropped += 1
+            self._backlog.append(block)
+        self._flush_backlog()
+
+    def _flush_backlog(self):
+        with self._lock:
+            while self._credits > 0 and self._backlog:
+                self._credits -= 1
+                self.blocks_sent += 1
+                self._conn.send(AUDIO, self._backlog.popleft())
+
+    def _read_loop(self, conn):
+        try:
+            while True:
+                kind, payload = conn.recv()
+                if kind == CREDIT:
+                    with self._lock:
+                        self._credits += int(decode_json(payload).get('blocks', 0))
+                    self._flush_backlog()
+                elif kind == BEEP:
+                    self.output.play_file(self.beep_path).wait()
+                elif kind == LISTEN:
+                    self.listening = True
+                elif kind == IDLE:
+                    self.listening = False
+                    self.gate.reset()
+                elif kind == PLAY:
+                    # Not reading while enough audio is queued pushes back on the hub's TTS
+                    oldest = self._oldest_if_full()
+                    while oldest is not None:
+                        oldest.done.wait(0.5)
+                        self._playing()
+                        oldest = self._oldest_if_full()
+                    sound = self.output.play_wav(payload)
+                    with self._lock:
+                        self._sounds.append(sound)
+                    self.answers_played += 1
+                elif kind == BYE:
+                    break
+        except (OSError, EOFError, ProtocolError):
+            pass
+        finally:
+            self._lost.set()
+
+    def stats(self):
+        return {
+            'session': self.session,
+            'blocks_sent': self.blocks_sent,
+            'blocks_dropped': self.blocks_dropped,
+            'answers_played': self.answers_played,
+            'connections': self.connections,
+        }
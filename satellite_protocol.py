@@ -0,0 +1,92 @@
+"""
+Wire protocol between satellites and the hub.
+
+One TCP connection per satellite. Every frame is a 1-byte type, a 4-byte
+big-endian payload length and the payload. Control frames carry JSON,
+AUDIO frames carry one block of 16 kHz mono 16-bit PCM and PLAY frames a
+WAV file.
+
+Flow control is credit based: the hub grants a number of AUDIO blocks in
+WELCOME and grants more (CREDIT) as it consumes them, so its per-session
+queue is bounded. A satellite without credit keeps its newest blocks in a
+small backlog and drops the oldest.
+"""
+import json
+import socket
+import struct
+import threading
+
+PROTOCOL_VERSION = 1
+DEFAULT_PORT = 8765
+# Larger frames are a protocol error (a long answer segment is well under this)
+MAX_FRAME_BYTES = 8 * 1024 * 1024
+
+HELLO = b'H'    # satellite -> hub: {"name", "version", "rate", "language"?}
+WELCOME = b'W'  # hub -> satellite: {"session", "credits"}
+REJECT = b'R'   # hub -> satellite: {"reason"}, then the hub closes the connection
+AUDIO = b'A'    # satellite -> hub: PCM block
+CREDIT = b'C'   # hub -> satellite: {"blocks"} more AUDIO blocks may be sent
+BEEP = b'E'     # hub -> satellite: play the local beep (wake word heard)
+LISTEN = b'L'   # hub -> satellite: stream every block until IDLE
+IDLE = b'I'     # hub -> satellite: command received, back to gated streaming
+PLAY = b'P'     # hub -> satellite: WAV data to play
+BYE = b'B'      # either side: closing
+
+_HEADER = struct.Struct(">cI")
+
+class ProtocolError(Exception):
+    pass
+
+class Connection:
+    """A framed connection; send() may be called from several threads"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._send_lock = threading.Lock()
+        self.closed = False
+
+    @classmethod
+    def connect(cls, host, port, timeout=5.0):
+        sock = socket.create_connection((host, port), timeout=timeout)
+        sock.settimeout(None)
+        return cls(sock)
+
+    def send(self, kind, payload=b""):
+        with self._send_lock:
+            self.sock.sendall(_HEADER.pack(kind, len(payload)) + payload)
+
+    def send_json(self, kind, message):
+        self.send(kind, json.dumps(message).encode('utf-8'))
+
+    def _read_exact(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise EOFError("connection closed")
+            data.extend(chunk)
+        return bytes(data)
+
+    def recv(self):
+        """Return the next (kind, payload). Raises EOFError when the peer has gone."""
+        kind, size = _HEADER.unpack(self._read_exact(_HEADER.size))
+        if size > MAX_FRAME_BYTES:
+            raise ProtocolError(f"frame of {size} bytes")
+        return kind, self._read_exact(size) if size else b""
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+def decode_json(payload):
+    try:
+        return json.loads(payload.decode('utf-8')) if payload else {}
+    except ValueError as e:
+        raise ProtocolError(f"bad control frame: {e}")
@@ -0,0 +1,209 @@
+"""
+Speculative LLM dispatch on stable partial transcripts.
+
+While the user finishes a command, the Vosk partial result often already
+holds the final words. Once it has not changed for a while, the question is
+sent to the LLM early, so prefill overlaps the end-of-speech silence and
+the final decode. The answer is buffered. If the final transcript is the
+same question, the buffer is replayed and the stream continues live;
+otherwise the request is cancelled and the real one is sent.
+"""
+import threading
+
+from conversation_history import estimate_tokens
+from response_cache import normalize_text
+from stream_decoder import DELTA, DONE
+from turn_trace import tracer
+
+# Seconds of audio the partial result must stay unchanged before the LLM is asked
+SPECULATIVE_STABLE_SECONDS = 0.3
+# Partial results shorter than this (in words) are not worth a request
+SPECULATIVE_MIN_WORDS = 2
+class Speculation:
+    """One early request, streamed into a buffer on its own thread"""
+
+    def __init__(self, client, text):
+        self.client = client
+        self.text = text
+        self.key = normalize_text(text)
+        self.cancel_event = threading.Event()
+        self._events = []
+        self._finished = False
+        self._rolled_back = False
+        self._used = False  # Taken as the answer: never rolled back
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="llm-speculation", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            for event in self.client.chat_events(self.text, cancel_event=self.cancel_event):
+                with self._cond:
+                    self._events.append(event)
+                    self._cond.notify_all()
+        finally:
+            with self._cond:
+                self._finished = True
+                self._cond.notify_all()
+            if self.cancel_event.is_set() and not self._used:
+                # Completed just as it was cancelled
+                self._roll_back()
+
+    def _roll_back(self):
+        """Take an answer that completed but is not used back out of the conversation history"""
+        with self._cond:
+            if self._rolled_back or not any(event.kind == DONE for event in self._events):
+                return
+            self._rolled_back = True
+        self.client.history.remove_last_exchange(self.text)
+
+    def generated_text(self):
+        with self._cond:
+            return "".join(event.text for event in self._events if event.kind == DELTA)
+
+    def cancel(self):
+        """
+        Stop the request without waiting for it (this runs on the audio loop).
+        An answer that already completed is taken back out of the conversation
+        history now, one completing meanwhile by its own thread.
+        """
+        self.cancel_event.set()
+        # Only this request's server job; cancelling it is a round-trip to the server
+        threading.Thread(target=self.client.cancel, args=(self.cancel_event,), daemon=True).start()
+        self._roll_back()
+
+    def link(self, cancel_event):
+        """
+        The answer is used. From now on, setting cancel_event (the turn's, if
+        given) cancels this request too.
+        """
+        self._used = True
+        if cancel_event is None:
+            return
+        def watch():
+            while not self._finished:
+                if cancel_event.wait(0.1):
+                    self.cancel_event.set()
+                    self.client.cancel(self.cancel_event)
+                    return
+        threading.Thread(target=watch, daemon=True).start()
+
+    def events(self):
+        """Replay the buffered events, then follow the live stream"""
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self._events) and not self._finished:
+                    self._cond.wait()
+                pending = self._events[index:]
+                finished = self._finished
+            for event in pending:
+                yield event
+            index += len(pending)
+            if finished:
+                return
+
+class SpeculativeDispatcher:
+    def __init__(self, client, block_seconds, stable_seconds=SPECULATIVE_STABLE_SECONDS,
+                 min_words=SPECULATIVE_MIN_WORDS, skip=None):
+        """
+        client: RKLLMClient the requests are sent with.
+        skip, if given, is called with the partial text and returns True when it
+        must not be sent (e.g. a local intent will answer it).
+        """
+        self.client = client
+        self.block_seconds = block_seconds
+        self.stable_seconds = stable_seconds
+        self.min_words = min_words
+        self.skip = skip
+        self.speculation = None
+        self._partial = ""
+        self._stable_time = 0.0
+        self._command_wasted = 0  # Wasted tokens of the command being spoken
+
+        # Counters
+        self.started = 0
+        self.hits = 0
+        self.misses = 0          # Final transcript differed from the speculated one
+        self.abandoned = 0       # Partial result changed (or no command) while in flight
+        self.wasted_tokens = 0   # Estimated tokens generated for discarded requests
+
+    def _discard(self, outcome):
+        speculation, self.speculation = self.speculation, None
+        if speculation is None:
+            return
+        speculation.cancel()
+        generated = speculation.generated_text()
+        wasted = estimate_tokens(generated) if generated else 0
+        self.wasted_tokens += wasted
+        self._command_wasted += wasted
+        if outcome == 'miss':
+            self.misses += 1
+        else:
+            self.abandoned += 1
+        # Its marks would otherwise be taken for the real request's
+        tracer.discard('llm_submit', 'llm_first_token', 'llm_done')
+        tracer.set('speculative', outcome)
+        tracer.set('speculative_wasted_tokens', self._command_wasted)
+
+    def _end_command(self):
+        self._partial = ""
+        self._stable_time = 0.0
+        self._command_wasted = 0
+
+    def reset(self):
+        """The command was answered without the LLM or never came: abandon any request in flight"""
+        self._discard('abandoned')
+        self._end_command()
+
+    def observe(self, partial):
+        """Feed the partial result of one audio block"""
+        partial = partial.strip()
+        if normalize_text(partial) != normalize_text(self._partial):
+            self._partial = partial
+            self._stable_time = 0.0
+            if self.speculation is not None and self.speculation.key != normalize_text(partial):
+                self._discard('abandoned')
+            return
+        self._stable_time += self.block_seconds
+        if (self.speculation is not None or self._stable_time < self.stable_seconds
+                or len(partial.split()) < self.min_words):
+            return
+        if self.skip is not None and self.skip(partial):
+            return
+        self.started += 1
+        tracer.set('speculative', 'started')
+        self.speculation = Speculation(self.client, partial)
+
+    def take(self, text, cancel_event=None):
+        """
+        The final transcript is known. Returns a text stream of the speculated
+        answer if it was the same question, otherwise None (the request is
+        cancelled and the caller sends its own).
+        """
+        speculation = self.speculation
+        if speculation is None or speculation.key != normalize_text(text):
+            self._discard('miss')
+            self._end_command()
+            return None
+        self.speculation = None
+        self._end_command()
+        self.hits += 1
+        tracer.set('speculative', 'hit')
+        speculation.link(cancel_event)
+        return (event.text for event in speculation.events() if event.kind != DONE)
+
+    def stats(self):
+        return {
+            'started': self.started,
+            'hits': self.hits,
+            'misses': self.misses,
+            'abandoned': self.abandoned,
+            'hit_rate': round(self.hits / self.started, 2) if self.started else None,
+            'wasted_tokens': self.wasted_tokens,
+        }
+
+    def format_stats(self):
+        hit_rate = 100.0 * self.hits / self.started if self.started else 0.0
+        return (f"Speculative LLM: {self.hits}/{self.started} hits ({hit_rate:.0f}%), "
+                f"{self.misses} misses, {self.abandoned} abandoned, {self.wasted_tokens} wasted tokens")
@@ -0,0 +1,110 @@
+"""
+Parallel startup with a boot timeline.
+
+main() registers its startup steps (Vosk model, LLM connection, audio
+devices, TTS prewarm...) as named tasks. Every task runs on its own thread
+as soon as the tasks it requires have finished, so independent steps
+overlap, and each one is timed. print_timeline() shows where the time to
+ready went, which is what a config-triggered restart makes the user wait.
+"""
+import threading
+import time
+
+class StartupTask:
+    def __init__(self, name, fn, requires=(), after=()):
+        self.name = name
+        self.fn = fn
+        self.requires = tuple(requires)
+        self.after = tuple(after)
+        self.result = None
+        self.error = None
+        self.started = None   # Seconds since the start of the boot
+        self.finished = None
+        self.done = threading.Event()
+
+class Startup:
+    def __init__(self):
+        self.start = time.monotonic()
+        self.tasks = {}
+        self.ready_at = None
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    def add(self, name, fn, requires=(), after=()):
+        """
+        Start fn on its own thread once the named required tasks have finished.
+        fn receives their results as arguments, in the order they are listed.
+        Tasks listed in after are waited for too, but fn gets nothing from them.
+        """
+        for required in tuple(requires) + tuple(after):
+            if required not in self.tasks:
+                raise ValueError(f"startup task '{name}' requires unknown task '{required}'")
+        task = StartupTask(name, fn, requires, after)
+        self.tasks[name] = task
+        threading.Thread(target=self._run, args=(task,), name=f"startup-{name}", daemon=True).start()
+        return task
+
+    def _run(self, task):
+        try:
+            args = [self.result(required) for required in task.requires]
+            for required in task.after:
+                self.result(required)
+            task.started = self.elapsed()
+            task.result = task.fn(*args)
+        except BaseException as e:
+            task.error = e
+        finally:
+            if task.started is None:
+                task.started = self.elapsed()
+            task.finished = self.elapsed()
+            task.done.set()
+            if self.ready_at is not None:
+                # Background task that outlived the boot (e.g. the LLM connection)
+                outcome = f"failed: {task.error}" if task.error is not None else "done"
+                print(f"[Startup: {task.name} {outcome} at {task.finished:.2f}s]")
+
+    def result(self, name, timeout=None):
+        """Wait for a task and return its result; re-raises the exception it failed with"""
+        task = self.tasks[name]
+        if not task.done.wait(timeout):
+            raise TimeoutError(f"startup task '{name}' did not finish in {timeout}s")
+        if task.error is not None:
+            raise task.error
+        return task.result
+
+    def mark_ready(self):
+        """The assistant is listening: this is the time to ready"""
+        self.ready_at = self.elapsed()
+
+    def timeline(self):
+        rows = []
+        for task in sorted(self.tasks.values(), key=lambda t: (t.started is None, t.started or 0.0)):
+            if task.done.is_set():
+                status = f"failed: {task.error}" if task.error is not None else 'ok'
+            else:
+                status = 'running'
+            rows.append({
+                'task': task.name,
+                'start': task.started,
+                'end': task.finished,
+                'status': status,
+            })
+        return rows
+
+    def print_timeline(self, width=30):
+        """Print one bar per task over the boot, then the time to ready"""
+        rows = self.timeline()
+        total = max([self.ready_at or 0.0] + [row['end'] or self.elapsed() for row in rows]) or 1e-9
+        name_width = max([len(row['task']) for row in rows] + [4])
+        print("Boot timeline:")
+        for row in rows:
+            start = row['start'] if row['start'] is not None else self.elapsed()
+            end = row['end'] if row['end'] is not None else self.elapsed()
+            first = int(width * start / total)
+            length = max(1, int(round(width * (end - start) / total)))
+            bar = " " * first + "#" * min(length, width - first)
+            print(f"  {row['task']:<{name_width}} |{bar:<{width}}| "
+                  f"{start:6.2f}s +{end - start:5.2f}s {row['status'] if row['status'] != 'ok' else ''}".rstrip())
+        if self.ready_at is not None:
+            print(f"  Ready in {self.ready_at:.2f}s")
@@ -0,0 +1,102 @@
+"""
+Incremental decoder for the /get_RKLLM_output stream.
+
+Every update from the Gradio job is the full chat history. The decoder only
+looks at the last message, keeps the offset of the text already emitted and
+slices out the new characters, so the cost per update depends on the size
+of the delta rather than on the length of the answer.
+
+Run this file directly for a microbenchmark of the per-token cost.
+"""
+import logging
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# kind is one of DELTA, DONE or ERROR. text is the new text (DELTA), the full
+# answer (DONE) or the error message (ERROR).
+StreamEvent = namedtuple('StreamEvent', ['kind', 'text'])
+DELTA = 'delta'
+DONE = 'done'
+ERROR = 'error'
+
+# Characters compared to check that a new update extends the text already emitted
+CONTINUITY_CHECK_CHARS = 16
+
+def last_message_text(update):
+    """Return the text of the last message in a Gradio history update, or None"""
+    if not update:
+        return None
+    last_interaction = update[-1]
+    # Handle dict format (messages with role/content)
+    if isinstance(last_interaction, dict) and 'content' in last_interaction:
+        content = last_interaction['content']
+        # Content is a list of objects with 'text' field
+        if isinstance(content, list) and len(content) > 0:
+            if isinstance(content[0], dict) and 'text' in content[0]:
+                return content[0]['text']
+            return None
+        # Fallback for string content
+        if isinstance(content, str):
+            return content
+        return None
+    # Handle tuple format (legacy)
+    if isinstance(last_interaction, (list, tuple)) and len(last_interaction) > 1:
+        return last_interaction[1]
+    return None
+
+class StreamDecoder:
+    def __init__(self):
+        self.text = ""      # Latest full answer (a reference, never rebuilt)
+        self.offset = 0     # Characters already emitted
+        self.updates = 0
+        self.last_update = None
+
+    def feed(self, update):
+        """Process one stream update. Returns a DELTA event or None."""
+        self.updates += 1
+        self.last_update = update
+        full_text = last_message_text(update)
+        if not isinstance(full_text, str) or len(full_text) <= self.offset:
+            return None
+
+        check_start = max(0, self.offset - CONTINUITY_CHECK_CHARS)
+        if full_text[check_start:self.offset] != self.text[check_start:self.offset]:
+            # The server rewrote text we already emitted; only new characters can still be spoken
+            logger.debug("Stream text changed before offset %d", self.offset)
+
+        delta = full_text[self.offset:]
+        self.offset = len(full_text)
+        self.text = full_text
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Update %d: +%d chars (total %d)", self.updates, len(delta), self.offset)
+        return StreamEvent(DELTA, delta)
+
+    def finish(self):
+        return StreamEvent(DONE, self.text)
+
+    @staticmethod
+    def error(message):
+        return StreamEvent(ERROR, message)
+
+def _benchmark(answer_chars, chars_per_token=4):
+    """Feed a simulated stream of answer_chars characters; return microseconds per token"""
+    answer = "x" * answer_chars
+    updates = []
+    for end in range(chars_per_token, answer_chars + 1, chars_per_token):
+        updates.append([
+            {'role': 'user', 'content': [{'text': "pregunta", 'type': 'text'}]},
+            {'role': 'assistant', 'content': [{'text': answer[:end], 'type': 'text'}]},
+        ])
+    decoder = StreamDecoder()
+    start = time.perf_counter()
+    for update in updates:
+        decoder.feed(update)
+    decoder.finish()
+    return 1e6 * (time.perf_counter() - start) / len(updates)
+
+if __name__ == "__main__":
+    print("Stream decoder cost per token (updates are prebuilt, only decoding is timed)")
+    for length in (400, 4000, 40000):
+        print(f"  {length:>6} chars: {_benchmark(length):.2f} us/token")
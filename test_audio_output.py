@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Test the in-process audio output engine with the null and WAV file sinks
+"""
+
+import io
+import math
+import os
+import sys
+import tempfile
+import time
+import types
+import wave
+from array import array
+from unittest import mock
+
+from audio_output import (CUE, CUE_DUCK_GAIN, SPEECH, AudioOutput, NullSink, PyAudioSink, WavFileSink,
+                          mix, resample)
+
+RATE = 22050
+
+def tone(seconds, frequency=440.0, rate=RATE, volume=0.3):
+    count = int(seconds * rate)
+    return array('h', (int(volume * 32767 * math.sin(2 * math.pi * frequency * i / rate))
+                       for i in range(count))).tobytes()
+
+def wav_bytes(pcm, rate=RATE, channels=1):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(rate)
+        wav_file.writeframes(pcm)
+    return buffer.getvalue()
+
+def record(play, realtime=False):
+    """Run play(output) against a WAV file sink and return the PCM that reached it"""
+    path = tempfile.mktemp(suffix=".wav")
+    output = AudioOutput(WavFileSink(path, rate=RATE, realtime=realtime)).start()
+    try:
+        play(output)
+    finally:
+        output.stop()
+    with wave.open(path, 'rb') as wav_file:
+        pcm = wav_file.readframes(wav_file.getnframes())
+    os.remove(path)
+    return pcm, output
+
+def test_plays_wav_data_unchanged():
+    pcm = tone(0.3)
+    played, output = record(lambda out: out.play_wav(wav_bytes(pcm)).wait(5))
+    assert played == pcm
+    assert output.stats()['sounds_played'] == 1
+
+def test_back_to_back_sounds_are_gapless():
+    first, second = tone(0.2, 440.0), tone(0.25, 660.0)
+
+    def play(out):
+        out.play_pcm(first, RATE)
+        assert out.play_pcm(second, RATE).wait(5)
+
+    played, _ = record(play)
+    assert played == first + second, "sounds on one channel must follow each other without silence"
+
+def test_cancel_stops_a_playing_sound():
+    pcm = tone(2.0)
+    start = time.monotonic()
+
+    def play(out):
+        sound = out.play_pcm(pcm, RATE)
+        time.sleep(0.2)
+        out.cancel(sound)
+        assert sound.wait(1) is False
+
+    played, output = record(play, realtime=True)
+    assert time.monotonic() - start < 1.0, "cancel did not stop playback"
+    assert len(played) < len(pcm) // 2
+    assert output.stats()['sounds_cancelled'] == 1
+
+def test_cue_is_mixed_under_speech():
+    speech, cue = tone(0.2, 440.0), tone(0.2, 880.0)
+
+    def play(out):
+        # Holding the engine lock, so both sounds start in the same period
+        with out._cond:
+            out.play_pcm(speech, RATE, channel=SPEECH)
+            cue_sound = out.play_pcm(cue, RATE, channel=CUE)
+        cue_sound.wait(5)
+
+    played, _ = record(play)
+    assert played == mix(speech, cue, CUE_DUCK_GAIN)
+
+def test_wav_is_converted_to_the_output_rate():
+    pcm = tone(0.4, rate=44100)
+    stereo = array('h')
+    for sample in array('h', pcm):
+        stereo.extend((sample, sample))
+    played, _ = record(lambda out: out.play_wav(wav_bytes(stereo.tobytes(), 44100, 2)).wait(5))
+    assert abs(len(played) - len(resample(pcm, 44100, RATE))) <= 2
+
+def test_underruns_are_counted():
+    class UnderrunSink(NullSink):
+        def write(self, pcm):
+            super().write(pcm)
+            return True
+
+    output = AudioOutput(UnderrunSink(rate=RATE, realtime=False)).start()
+    try:
+        output.play_pcm(tone(0.2), RATE).wait(5)
+    finally:
+        output.stop()
+    assert output.stats()['underruns'] > 0
+
+def test_sink_error_drops_the_sounds_without_hanging():
+    class FailingSink(NullSink):
+        failures = 1
+
+        def write(self, pcm):
+            if self.failures:
+                self.failures -= 1
+                raise OSError("device unplugged")
+            return super().write(pcm)
+
+    output = AudioOutput(FailingSink(rate=RATE, realtime=False)).start()
+    try:
+        playing = output.play_pcm(tone(0.2), RATE)
+        queued = output.play_pcm(tone(0.2), RATE, channel=CUE)
+        assert playing.done.wait(2) and queued.done.wait(2), "waiters must not hang on a sink error"
+        assert not playing.wait() and not queued.wait(), "dropped sounds count as cancelled"
+        assert output.play_pcm(tone(0.1), RATE).wait(2), "the player thread must keep running"
+        assert output.stats()['sink_errors'] == 1
+    finally:
+        output.stop()
+
+class FakeStream:
+    """Like PyAudio 0.2.14: an underflow closes the stream before the error is raised"""
+
+    def __init__(self, underflow=False):
+        self.underflow = underflow
+        self.closed = False
+        self.written = 0
+
+    def _check(self):
+        if self.closed:
+            raise OSError("Stream closed")
+
+    def is_stopped(self):
+        self._check()
+        return False
+
+    def write(self, pcm, exception_on_underflow=False):
+        self._check()
+        self.written += len(pcm)
+        if self.underflow and exception_on_underflow:
+            self.closed = True
+            raise IOError(FakePyAudioModule.paOutputUnderflowed, "Output underflowed")
+
+class FakePyAudioModule:
+    paInt16 = 8
+    paOutputUnderflowed = -9980
+
+    def __init__(self):
+        self.streams = []
+
+    def PyAudio(self):
+        return types.SimpleNamespace(open=self._open, terminate=lambda: None)
+
+    def _open(self, **kwargs):
+        self.streams.append(FakeStream(underflow=not self.streams))  # Only the first one underflows
+        return self.streams[-1]
+
+def test_underflow_reopens_the_pyaudio_stream():
+    fake = FakePyAudioModule()
+    with mock.patch.dict(sys.modules, {'pyaudio': fake}):
+        sink = PyAudioSink()
+        assert sink.write(bytes(512)), "an underflow is reported as an underrun"
+        assert not sink.write(bytes(512)), "the next write goes to a new stream"
+    assert len(fake.streams) == 2 and fake.streams[1].written == 512
+
+def test_beep_file_is_decoded_once():
+    path = tempfile.mktemp(suffix=".wav")
+    with open(path, 'wb') as f:
+        f.write(wav_bytes(tone(0.1, rate=44100), rate=44100))
+    output = AudioOutput(NullSink(rate=RATE, realtime=False)).start()
+    try:
+        assert output.play_file(path).wait(5)
+        assert output.play_file(path).wait(5)
+        assert len(output._decoded) == 1
+    finally:
+        output.stop()
+        os.remove(path)
+
+if __name__ == "__main__":
+    tests = [test_plays_wav_data_unchanged, test_back_to_back_sounds_are_gapless,
+             test_cancel_stops_a_playing_sound, test_cue_is_mixed_under_speech,
+             test_wav_is_converted_to_the_output_rate, test_underruns_are_counted,
+             test_sink_error_drops_the_sounds_without_hanging, test_underflow_reopens_the_pyaudio_stream,
+             test_beep_file_is_decoded_once]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"✗ {test.__name__}: {e}")
+    sys.exit(1 if failed else 0)
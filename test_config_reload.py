@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Test live config reload: per-key handlers, SIGHUP and signalling the
+running assistant from config_app
+"""
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from contextlib import contextmanager
+from unittest import mock
+
+import config_store
+from config_reload import ConfigReloader, remove_pid_file, signal_assistant, write_pid_file
+from config_store import get_config, get_wake_phrase, invalidate_config
+
+def write_config(**values):
+    with open(config_store._store.path, 'w') as f:
+        json.dump(values, f)
+    # Same size and mtime granularity would hide a quick second write
+    os.utime(config_store._store.path, ns=(time.time_ns(), time.time_ns()))
+
+@contextmanager
+def temp_config():
+    """Point the shared config store at a new file for the duration of a test"""
+    path = config_store._store.path
+    config_store._store.path = os.path.join(tempfile.mkdtemp(), "config.json")
+    try:
+        write_config(language='es', location_city='Madrid', audio_output=2)
+        invalidate_config()
+        get_config()
+        yield
+    finally:
+        config_store._store.path = path
+        invalidate_config()
+
+def make_reloader():
+    calls = []
+    reloader = ConfigReloader()
+    reloader.on(['audio_output'], lambda config: calls.append(('card', config['audio_output'])))
+    reloader.on(['language'], lambda config: calls.append(('language', config['language'])))
+    reloader.on(['wake_phrase'], lambda config: calls.append(('wake', get_wake_phrase())))
+    return reloader, calls
+
+def test_only_changed_settings_are_applied():
+    with temp_config():
+        reloader, calls = make_reloader()
+        assert reloader.poll() == [], "nothing changed yet"
+        write_config(language='en', location_city='Madrid', audio_output=2, wake_phrase="Oye Kubic")
+        invalidate_config()
+        assert reloader.poll() == ['language', 'wake_phrase']
+        assert calls == [('language', 'en'), ('wake', "oye kubic")], calls
+        write_config(language='en', location_city='Sevilla', audio_output=2, wake_phrase="Oye Kubic")
+        invalidate_config()
+        assert reloader.poll() == ['location_city']
+        assert len(calls) == 2, "a setting read at use needs no handler"
+        assert reloader.reloads == 2
+
+def test_failed_handler_does_not_stop_the_others():
+    with temp_config():
+        reloader, calls = make_reloader()
+        reloader.on(['language'], lambda config: 1 / 0, "broken")
+        write_config(language='en', location_city='Madrid', audio_output='USB')
+        invalidate_config()
+        reloader.poll()
+        assert calls == [('card', 'USB'), ('language', 'en')], calls
+        assert reloader.failures == 1
+
+def test_sighup_makes_the_change_visible_right_away():
+    with temp_config():
+        reloader, calls = make_reloader()
+        reloader.install_signal()
+        try:
+            get_config()  # Starts the throttle window: without the signal, the file is not checked
+            write_config(language='en', location_city='Madrid', audio_output=2)
+            os.kill(os.getpid(), signal.SIGHUP)
+            assert reloader.poll() == ['language']
+            assert calls == [('language', 'en')], calls
+        finally:
+            signal.signal(signal.SIGHUP, signal.SIG_DFL)
+
+class FakeMicrophone:
+    """Stands in for the PyAudio instance and the AudioCapture of one input device"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.running = False
+        self.terminated = False
+
+    def start(self):
+        if self.fail:
+            raise OSError("Invalid input device (no default output device)")
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def terminate(self):
+        self.terminated = True
+
+def test_failed_input_device_keeps_the_old_microphone():
+    import main_assistant as assistant  # Needs pyaudio and vosk
+
+    old = FakeMicrophone()
+    old.start()
+    opened = []
+
+    def open_device(fail):
+        device = FakeMicrophone(fail)
+        opened.append(device)
+        return types.SimpleNamespace(PyAudio=lambda: device)
+
+    with mock.patch.object(assistant, 'AudioCapture', lambda device, **kwargs: device), \
+         mock.patch.object(assistant, 'get_audio_input_index', lambda: 3):
+        with mock.patch.object(assistant, 'pyaudio', open_device(fail=True)):
+            try:
+                assistant.reopen_microphone(old, old)
+                assert False, "the open error should reach the reloader"
+            except OSError:
+                pass
+        assert old.running and not old.terminated, "the old microphone must keep listening"
+        assert opened[0].terminated, "the failed device's PyAudio instance must be released"
+
+        with mock.patch.object(assistant, 'pyaudio', open_device(fail=False)):
+            p, capture = assistant.reopen_microphone(old, old)
+        assert capture is opened[1] and capture.running
+        assert not old.running and old.terminated
+
+def test_signal_assistant_only_signals_the_assistant():
+    pid_file = os.path.join(tempfile.mkdtemp(), "assistant.pid")
+    assert not signal_assistant(pid_file), "no assistant is running"
+    write_pid_file(pid_file)
+    assert not signal_assistant(pid_file), "a PID file naming another program is ignored"
+    remove_pid_file(pid_file)
+    assert not os.path.exists(pid_file)
+
+    code = ("import signal, sys, time\n"
+            "signal.signal(signal.SIGHUP, lambda *args: sys.exit(3))\n"
+            "print('ready', flush=True)\n"
+            "time.sleep(10)  # main_assistant stand-in\n")
+    child = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE)
+    try:
+        child.stdout.readline()
+        with open(pid_file, 'w') as f:
+            f.write(str(child.pid))
+        assert signal_assistant(pid_file)
+        assert child.wait(5) == 3, "the assistant should have received SIGHUP"
+    finally:
+        if child.poll() is None:
+            child.kill()
+
+if __name__ == "__main__":
+    tests = [test_only_changed_settings_are_applied, test_failed_handler_does_not_stop_the_others,
+             test_sighup_makes_the_change_visible_right_away,
+             test_failed_input_device_keeps_the_old_microphone,
+             test_signal_assistant_only_signals_the_assistant]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"✗ {test.__name__}: {e}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Test the cached device inventory with counting probes and a temporary
+directory standing in for /dev/snd
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from unittest import mock
+
+import config_app
+from device_inventory import DeviceInventory
+
+class CountingProbe:
+    def __init__(self, result, delay=0.0):
+        self.result = result
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return list(self.result)
+
+def make_inventory(hotplug_dir, **kwargs):
+    probes = {
+        'output_cards': CountingProbe([{'card_id': '0', 'name': 'Card 0: Codec'}], delay=0.05),
+        'wifi_interfaces': CountingProbe(['wlan0']),
+    }
+    return DeviceInventory(probes, hotplug_poll=0.05, hotplug_paths=(hotplug_dir,), **kwargs), probes
+
+def wait_for(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+def test_probes_once_and_serves_from_memory():
+    inventory, probes = make_inventory(tempfile.mkdtemp())
+    try:
+        first = inventory.get()
+        assert first['wifi_interfaces'] == ['wlan0']
+        start = time.monotonic()
+        for _ in range(20):
+            assert inventory.get() == first
+        assert time.monotonic() - start < 0.05, "cached pages must not wait for the probes"
+        assert probes['output_cards'].calls == 1 and probes['wifi_interfaces'].calls == 1
+        assert inventory.stats()['served'] == 20
+    finally:
+        inventory.stop()
+
+def test_hotplug_triggers_a_rescan():
+    hotplug_dir = tempfile.mkdtemp()
+    inventory, probes = make_inventory(hotplug_dir)
+    try:
+        inventory.get()
+        probes['output_cards'].result = [{'card_id': '0', 'name': 'Card 0: Codec'},
+                                         {'card_id': '1', 'name': 'Card 1: USB Audio'}]
+        time.sleep(0.2)
+        assert probes['output_cards'].calls == 1, "no change, no probe"
+        open(os.path.join(hotplug_dir, "pcmC1D0p"), 'w').close()
+        assert wait_for(lambda: len(inventory.get()['output_cards']) == 2, 5)
+        assert inventory.stats()['hotplug_scans'] == 1
+    finally:
+        inventory.stop()
+
+def test_periodic_refresh():
+    inventory, probes = make_inventory(tempfile.mkdtemp(), refresh_interval=0.2)
+    try:
+        inventory.get()
+        assert wait_for(lambda: inventory.stats()['scans'] >= 3, 5)
+        assert all(probe.calls >= 3 for probe in probes.values()), "every device list is probed again"
+    finally:
+        inventory.stop()
+
+def test_rescan_and_failed_probe_keeps_last_result():
+    inventory, probes = make_inventory(tempfile.mkdtemp())
+    try:
+        inventory.get()
+        probes['wifi_interfaces'].result = ['wlan0', 'wlan1']
+        assert inventory.rescan()['wifi_interfaces'] == ['wlan0', 'wlan1']
+        probes['wifi_interfaces'].result = RuntimeError("nmcli not found")
+        devices = inventory.rescan()
+        assert devices['wifi_interfaces'] == ['wlan0', 'wlan1']
+        assert inventory.stats()['scans'] == 3 and 'output_cards' in inventory.stats()['probe_ms']
+    finally:
+        inventory.stop()
+
+class FakePyAudio:
+    """One capture device on host API 0"""
+
+    def get_host_api_info_by_index(self, index):
+        return {'deviceCount': 1}
+
+    def get_device_info_by_host_api_device_index(self, host_api, index):
+        return {'maxInputChannels': 1, 'name': 'USB Mic'}
+
+    def terminate(self):
+        pass
+
+def fake_run(cmd, **kwargs):
+    if cmd[0] == 'aplay':
+        stdout = "card 1: Device [USB Audio Device], device 0: USB Audio [USB Audio]\n"
+    else:
+        stdout = "wlan0:wifi\neth0:ethernet\n"
+    return subprocess.CompletedProcess(cmd, 0, stdout=stdout, stderr="")
+
+def failing_pyaudio():
+    raise OSError("device busy")
+
+def test_failing_config_app_probes_keep_the_last_scan():
+    inventory = DeviceInventory(config_app.DEVICE_PROBES, fallbacks=config_app.DEVICE_FALLBACKS)
+    working = types.SimpleNamespace(PyAudio=FakePyAudio)
+    with mock.patch.dict(sys.modules, {'pyaudio': working}), \
+         mock.patch.object(config_app.subprocess, 'run', fake_run):
+        good = inventory.rescan()
+    assert good == {'input_devices': [{'index': 0, 'name': 'USB Mic'}],
+                    'output_cards': [{'card_id': '1', 'name': 'Card 1: Device [USB Audio Device], device 0'}],
+                    'wifi_interfaces': ['wlan0']}, good
+
+    failing = types.SimpleNamespace(PyAudio=failing_pyaudio)
+    with mock.patch.dict(sys.modules, {'pyaudio': failing}), \
+         mock.patch.object(config_app.subprocess, 'run', side_effect=FileNotFoundError("aplay")):
+        assert inventory.rescan() == good, "a failed scan must not replace a good one"
+        assert inventory.stats()['probe_failures'] == 3
+
+        # Nothing known yet: the defaults the pages always showed
+        fresh = DeviceInventory(config_app.DEVICE_PROBES, fallbacks=config_app.DEVICE_FALLBACKS)
+        devices = fresh.rescan()
+    assert devices['input_devices'] == config_app.DEFAULT_INPUT_DEVICES
+    assert devices['output_cards'] == config_app.DEFAULT_OUTPUT_CARDS
+    assert devices['wifi_interfaces'] == []
+
+    with mock.patch.object(config_app.subprocess, 'run', side_effect=FileNotFoundError("nmcli")):
+        assert config_app.get_wifi_interfaces() == [], "the non-strict probes still fall back"
+        assert config_app.get_audio_outputs() == config_app.DEFAULT_OUTPUT_CARDS
+
+if __name__ == "__main__":
+    tests = [test_probes_once_and_serves_from_memory, test_hotplug_triggers_a_rescan,
+             test_periodic_refresh, test_rescan_and_failed_probe_keeps_last_result,
+             test_failing_config_app_probes_keep_the_last_scan]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"✗ {test.__name__}: {e}")
+    sys.exit(1 if failed else 0)
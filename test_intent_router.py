@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Test the offline intent router: normalization, slots, the confidence
+threshold, reject templates and the assistant's own intents
+"""
+
+import sys
+
+from intent_router import (CITY, DURATION, MIN_CONFIDENCE, NUMBER, IntentRouter, normalize,
+                           parse_duration, parse_number)
+
+def sample_router(min_confidence=MIN_CONFIDENCE):
+    router = IntentRouter(min_confidence)
+    router.register('time', lambda slots: "time", {'es': ["[que] hora [es]"], 'en': ["[what] time [is it]"]},
+                    reject={'es': ["hora [es] en"], 'en': ["time [is it] in"]})
+    router.register('weather', lambda slots: f"weather {slots['city']}",
+                    {'es': ["tiempo|clima [en {city}]"], 'en': ["weather [in {city}]"]}, {'city': CITY},
+                    reject={'es': ["manana"], 'en': ["tomorrow"]})
+    router.register('timer', lambda slots: slots['duration'],
+                    {'es': ["[pon] [un] temporizador [de] {duration}"], 'en': ["[set] [a] timer for {duration}"]},
+                    {'duration': DURATION})
+    router.register('double', lambda slots: slots['n'] * 2, {'es': ["doble de {n}"], 'en': ["double {n}"]},
+                    {'n': NUMBER})
+    return router
+
+def assistant_router():
+    import main_assistant  # Needs pyaudio and vosk
+    return main_assistant.build_intent_router(on_timer_done=lambda: None)
+
+def test_normalize_keeps_decimal_points():
+    assert normalize("¿Qué HORA es?") == "que hora es"
+    assert normalize("What is 2.5 times 2?") == "what is 2.5 times 2"
+    assert normalize("Cuánto es 2,5 por 2.") == "cuanto es 2,5 por 2"
+    assert normalize("uno, dos. tres") == "uno dos tres", "punctuation after a digit is still dropped"
+
+def test_slots_are_parsed():
+    router = sample_router()
+    assert router.handle("pon un temporizador de una hora y diez minutos") == ('timer', 4200)
+    assert router.handle("set a timer for half an hour", 'en') == ('timer', 1800)
+    assert router.handle("el doble de 2,5") == ('double', 5.0)
+    assert router.handle("qué tiempo en san sebastián hoy") == ('weather', "weather San Sebastian")
+    assert parse_number("treinta y cinco", 'es') == 35 and parse_number("3.5", 'es') == 3.5
+    assert parse_duration("dos minutos y medio", 'es') == 150
+
+def test_keywords_inside_other_words_or_long_questions_fall_through():
+    router = sample_router()
+    assert router.match("ahora cuéntame un chiste") is None, "'hora' inside 'ahora'"
+    command = "llegué a tiempo a la reunión de trabajo"
+    assert router.match(command) is None, "a keyword buried in a long sentence goes to the LLM"
+    match = sample_router(min_confidence=0.0).match(command)
+    assert match.intent.name == 'weather' and match.confidence < MIN_CONFIDENCE, match
+
+def test_reject_templates_send_the_command_to_the_llm():
+    router = sample_router()
+    assert router.match("qué hora es") is not None
+    assert router.match("qué hora es en tokio") is None
+    assert router.match("what time is it in tokyo", 'en') is None
+    assert router.match("tiempo en madrid") is not None
+    assert router.match("tiempo en madrid mañana") is None, "a forecast must not get the current weather"
+    assert router.match("weather in london tomorrow", 'en') is None
+
+def test_assistant_intents_answer_right_or_not_at_all():
+    router = assistant_router()
+    assert router.handle("what is 2.5 times 2", 'en') == ('calculate', "2.5 times 2 is 5.")
+    assert router.handle("cuánto es 2,5 por 2") == ('calculate', "2.5 times 2 is 5.")
+    assert router.handle("cuánto es 7 entre 0") == ('calculate', "I can't divide by zero.")
+    for command, language in [("qué hora es en tokio", 'es'), ("what time is it in new york", 'en'),
+                              ("tiempo en madrid mañana", 'es'), ("qué tiempo hará el sábado", 'es'),
+                              ("qué tiempo hace mañana", 'es'), ("weather in paris tomorrow", 'en')]:
+        assert router.match(command, language) is None, f"{command!r} should go to the LLM"
+    assert router.match("qué tiempo hace en madrid hoy").slots == {'city': "Madrid"}
+    assert router.match("qué hora es").intent.name == 'time'
+
+if __name__ == "__main__":
+    tests = [test_normalize_keeps_decimal_points, test_slots_are_parsed,
+             test_keywords_inside_other_words_or_long_questions_fall_through,
+             test_reject_templates_send_the_command_to_the_llm,
+             test_assistant_intents_answer_right_or_not_at_all]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"✗ {test.__name__}: {e}")
+    sys.exit(1 if failed else 0)
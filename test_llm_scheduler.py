@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Test the session-aware LLM scheduler against the local fake Gradio server
+"""
+
+import sys
+import threading
+import time
+
+from fake_rkllm_server import SharedFakeServer
+from rkllm_client import PRIORITY_NORMAL, PRIORITY_SHORT, LLMScheduler
+from stream_decoder import DONE
+
+def last_user_message(history):
+    return [message for message in history if message.get('role') == 'user'][-1]['content']
+
+def reply(history):
+    turns = sum(1 for message in history if message.get('role') == 'user')
+    shared_server.server.order.append(last_user_message(history))
+    return f"{last_user_message(history)} #{turns}"
+
+# Answers "<question> #N", N counting the user messages it was sent, and allows
+# several requests at once so the scheduler is the only limit
+shared_server = SharedFakeServer(reply=reply, concurrency_limit=8)
+
+def get_server(tokens_per_second=200.0, first_token_delay=0.05):
+    """The shared server, with the order of the questions it saw reset"""
+    server = shared_server.get(tokens_per_second, first_token_delay)
+    server.order = []
+    server.max_active = 0
+    return server
+
+def ask(client, message, results=None, options=None):
+    events = list(client.chat_events(message, cacheable=False, **(options or {})))
+    answer = events[-1].text if events and events[-1].kind == DONE else None
+    if results is not None:
+        results[message] = answer
+    return answer
+
+def in_threads(*calls):
+    threads = [threading.Thread(target=fn, args=args) for fn, *args in calls]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)  # Queue them in this order
+    for thread in threads:
+        thread.join(30)
+
+def test_sessions_keep_separate_histories():
+    server = get_server()
+    scheduler = LLMScheduler(url=server.url)
+    kitchen = scheduler.session('kitchen', system_prompt="Responde en español.")
+    office = scheduler.session('office', system_prompt="Answer in English.")
+    assert ask(kitchen, "hola") == "hola #1"
+    assert ask(office, "hello") == "hello #1"
+    assert ask(kitchen, "que tal") == "que tal #2"
+    assert server.last_history[0]['content'] == "Responde en español."
+    assert "hello" not in str(server.last_history)
+    assert len(kitchen.history) == 4 and len(office.history) == 2
+    assert scheduler.session('kitchen') is kitchen, "a session is kept by its ID"
+    assert kitchen.client is office.client, "sessions share one connection"
+
+def test_concurrency_is_bounded():
+    server = get_server(tokens_per_second=20.0)
+    scheduler = LLMScheduler(url=server.url, max_concurrent=2)
+    results = {}
+    in_threads(*[(ask, scheduler.session(f"room{i}"), f"question number {i}", results) for i in range(5)])
+    assert all(results[f"question number {i}"] == f"question number {i} #1" for i in range(5)), results
+    assert server.max_active == 2, f"{server.max_active} requests ran at once"
+    stats = scheduler.stats()
+    assert stats['requests'] == 5 and stats['running'] == 0 and stats['queue_depth'] == 0
+    assert stats['max_queue_depth'] >= 3
+    assert stats['wait_ms_all']['count'] == 5 and stats['wait_ms_all']['max'] > 100
+
+def test_short_questions_go_first():
+    server = get_server(tokens_per_second=20.0)
+    scheduler = LLMScheduler(url=server.url, max_concurrent=1)
+    long_question = "explain in detail how the weather forecast models work and why they fail"
+    in_threads((ask, scheduler.session('a'), long_question + " one"),
+               (ask, scheduler.session('b'), long_question + " two"),
+               (ask, scheduler.session('c'), "quien eres"),
+               (ask, scheduler.session('d'), "hello", None, {'priority': PRIORITY_NORMAL}))
+    # The first request was already running; the short one jumps the queue
+    assert server.order == [long_question + " one", "quien eres", long_question + " two", "hello"], server.order
+    stats = scheduler.stats()
+    assert stats['wait_ms_short']['count'] == 1 and stats['wait_ms_normal']['count'] == 3
+
+def test_cancel_while_queued():
+    server = get_server(tokens_per_second=20.0)
+    scheduler = LLMScheduler(url=server.url, max_concurrent=1)
+    cancel = threading.Event()
+    results = {}
+    in_threads((ask, scheduler.session('a'), "a long answer is being generated here", results),
+               (ask, scheduler.session('b'), "never sent", results, {'cancel_event': cancel,
+                                                                     'priority': PRIORITY_SHORT}),
+               (cancel.set,))
+    assert results["never sent"] is None
+    assert "never sent" not in server.order
+    assert len(scheduler.session('b').history) == 0
+    assert scheduler.stats()['cancelled'] == 1
+
+if __name__ == "__main__":
+    tests = [test_sessions_keep_separate_histories, test_concurrency_is_bounded,
+             test_short_questions_go_first, test_cancel_while_queued]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"✗ {test.__name__}: {e}")
+    shared_server.stop()
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Test the LLM response cache: which questions are cached, and that a
+follow-up is never answered from another conversation's cached reply
+"""
+
+import sys
+
+from conversation_history import ConversationHistory
+from fake_rkllm_server import SharedFakeServer
+from response_cache import ResponseCache, is_cacheable
+from rkllm_client import RKLLMClient
+from stream_decoder import DONE
+
+def reply(history):
+    """Answers "<previous question> / <question>", so a reply shows the context it was given"""
+    questions = [message['content'] for message in history if message.get('role') == 'user']
+    return " / ".join(questions[-2:])
+
+shared_server = SharedFakeServer(reply=reply)
+get_server = shared_server.get
+
+def ask(client, message):
+    events = list(client.chat_events(message))
+    return events[-1].text if events and events[-1].kind == DONE else None
+
+def test_standalone_questions_are_cacheable():
+    for text in ["cuéntame un chiste", "tell me a joke", "quién eres", "cuál es el planeta más grande"]:
+        assert is_cacheable(text), text
+
+def test_context_dependent_questions_are_not():
+    for text in ["otro", "Otra, por favor", "cuéntame otro", "uno más", "más", "y en Madrid?",
+                 "¿Por qué?", "another one", "one more", "why?", "and in Paris?", "what about Rome",
+                 "repite eso", "qué hora es ahora", "tell me the news"]:
+        assert not is_cacheable(text), text
+
+def test_follow_up_is_not_served_from_the_cache():
+    server = get_server()
+    cache = ResponseCache()
+    jokes = RKLLMClient(url=server.url, history=ConversationHistory(), response_cache=cache)
+    assert ask(jokes, "cuéntame un chiste") == "cuéntame un chiste"
+    assert ask(jokes, "otro") == "cuéntame un chiste / otro"
+
+    numbers = RKLLMClient(url=server.url, history=ConversationHistory(), response_cache=cache)
+    assert ask(numbers, "dame un número") == "dame un número"
+    requests = server.requests
+    assert ask(numbers, "otro") == "dame un número / otro", "the joke follow-up was replayed"
+    assert server.requests == requests + 1
+
+    again = RKLLMClient(url=server.url, history=ConversationHistory(), response_cache=cache)
+    requests = server.requests
+    assert ask(again, "cuéntame un chiste") == "cuéntame un chiste"
+    assert server.requests == requests, "a standalone question is still answered from the cache"
+
+if __name__ == "__main__":
+    tests = [test_standalone_questions_are_cacheable, test_context_dependent_questions_are_not,
+             test_follow_up_is_not_served_from_the_cache]
+    failed = 0
+    try:
+        for test in tests:
+            try:
+                test()
+                print(f"✓ {test.__name__}")
+            except AssertionError as e:
+                failed += 1
+                print(f"✗ {test.__name__}: {e}")
+    finally:
+        shared_server.stop()
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Test the asyncio RKLLM client against the local fake Gradio server
+"""
+
+import asyncio
+import socket
+import sys
+import threading
+import time
+
+from conversation_history import ConversationHistory
+from fake_rkllm_server import SharedFakeServer
+from rkllm_async_client import AsyncRKLLMClient, RKLLMTimeoutError
+from stream_decoder import DELTA, DONE, ERROR
+
+REPLY = "Hola. Esta es una respuesta de prueba bastante larga para medir el streaming."
+
+shared_server = SharedFakeServer(reply=REPLY)
+get_server = shared_server.get
+
+def generation_stopped(server, settle=0.3, window=1.0):
+    """True if the server streams at most one more token over the window (the one in flight)"""
+    time.sleep(settle)
+    before = server.tokens
+    time.sleep(window)
+    return server.tokens - before <= 1
+
+def run(coro):
+    """Like asyncio.run, but do not wait for executor threads stuck on a dead server"""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+def start_silent_server():
+    """A socket that accepts connections but never answers"""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(8)
+    return sock, f"http://127.0.0.1:{sock.getsockname()[1]}/"
+
+def collect(client, message, consume=None):
+    async def consume_all():
+        events = []
+        async for event in client.stream(message):
+            events.append(event)
+            if consume is not None:
+                consume(event, events)
+        return events
+    return run(consume_all())
+
+def test_streams_deltas_then_done():
+    server = get_server()
+    client = AsyncRKLLMClient(url=server.url, history=ConversationHistory())
+    events = collect(client, "hola")
+    kinds = [event.kind for event in events]
+    assert kinds[-1] == DONE, f"expected DONE last, got {kinds}"
+    assert kinds.count(DELTA) > 1, "answer should arrive in several deltas"
+    assert "".join(e.text for e in events if e.kind == DELTA) == REPLY
+    assert events[-1].text == REPLY
+    assert len(client.history) == 2
+
+def test_first_token_timeout_cancels_server_job():
+    server = get_server(first_token_delay=1.0)
+    client = AsyncRKLLMClient(url=server.url, history=ConversationHistory(), first_token_timeout=0.3)
+    start = time.monotonic()
+    events = collect(client, "hola")
+    assert time.monotonic() - start < 1.2, "first-token deadline was not enforced"
+    assert [e.kind for e in events] == [ERROR]
+    assert "first token" in events[0].text
+    assert len(client.history) == 0, "failed turns must not enter the history"
+    assert generation_stopped(server), "server job was not cancelled"
+
+def test_total_timeout():
+    server = get_server(tokens_per_second=10.0)
+    client = AsyncRKLLMClient(url=server.url, history=ConversationHistory(), total_timeout=0.6)
+    events = collect(client, "hola")
+    assert events[-1].kind == ERROR and "total" in events[-1].text
+    assert any(e.kind == DELTA for e in events), "partial text should have been streamed"
+
+def test_cancel_mid_stream():
+    server = get_server(tokens_per_second=10.0)
+    client = AsyncRKLLMClient(url=server.url, history=ConversationHistory())
+
+    def cancel_after_two(event, events):
+        if len(events) == 2:
+            client.cancel()
+
+    events = collect(client, "hola", consume=cancel_after_two)
+    assert all(e.kind == DELTA for e in events), "a cancelled stream ends without DONE"
+    assert len(events) < 5
+    assert generation_stopped(server), "server job was not cancelled"
+
+def test_cancel_only_stops_its_own_stream():
+    server = get_server(tokens_per_second=20.0)
+    client = AsyncRKLLMClient(url=server.url, history=ConversationHistory())
+    abandoned = threading.Event()
+
+    async def consume(message, cancel_event=None):
+        kinds = []
+        async for event in client.stream(message, cancel_event=cancel_event):
+            kinds.append(event.kind)
+            if cancel_event is not None and len(kinds) == 2:
+                client.cancel(cancel_event)
+        return kinds
+
+    async def both():
+        return await asyncio.gather(consume("hola", abandoned), consume("adiós"))
+
+    first, second = run(both())
+    assert DONE not in first and len(first) < 5, first
+    assert second[-1] == DONE, f"the other stream on the client was cancelled too: {second}"
+    assert len(client.history) == 2, "only the finished answer enters the history"
+
+def test_task_cancellation_cancels_server_job():
+    server = get_server(tokens_per_second=10.0)
+    client = AsyncRKLLMClient(url=server.url, history=ConversationHistory())
+
+    async def ask_then_cancel():
+        task = asyncio.create_task(client.ask("hola"))
+        await asyncio.sleep(0.5)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await asyncio.sleep(0.1)  # Let the executor send the cancel request
+
+    run(ask_then_cancel())
+    assert generation_stopped(server), "server job was not cancelled"
+
+def test_connect_timeout():
+    sock, url = start_silent_server()
+    try:
+        client = AsyncRKLLMClient(url=url, history=ConversationHistory(), connect_timeout=0.3)
+        start = time.monotonic()
+        try:
+            run(client.open())
+            assert False, "expected RKLLMTimeoutError"
+        except RKLLMTimeoutError:
+            pass
+        assert time.monotonic() - start < 1.0
+    finally:
+        sock.close()
+
+if __name__ == "__main__":
+    tests = [test_streams_deltas_then_done, test_first_token_timeout_cancels_server_job,
+             test_total_timeout, test_cancel_mid_stream, test_cancel_only_stops_its_own_stream,
+             test_task_cancellation_cancels_server_job,
+             test_connect_timeout]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"✗ {test.__name__}: {e}")
+    shared_server.stop()
+    sys.exit(1 if failed else 0)
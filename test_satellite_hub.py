@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Loopback test of satellite mode: several simulated satellites talk to one
+hub over TCP, with scripted speech recognition, a fake TTS and the local
+fake Gradio server standing in for the NPU
+"""
+
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+import wave
+from array import array
+
+import assistant_hub
+import main_assistant as assistant
+from audio_cache import AudioCache
+from audio_output import SPEECH, AudioOutput, NullSink, read_wav
+from fake_rkllm_server import SharedFakeServer
+from satellite import BACKLOG_BLOCKS, Satellite
+from satellite_protocol import (BYE, HELLO, PROTOCOL_VERSION, REJECT, WELCOME, Connection,
+                                decode_json)
+from vad import VoiceActivityDetector
+
+BLOCK = 2048
+
+def reply(history):
+    """Answers "Turn N." where N counts the user messages in the history it was sent"""
+    turns = sum(1 for message in history if message.get('role') == 'user')
+    return f"Turn {turns}."
+
+shared_server = SharedFakeServer(reply=reply)
+get_server = shared_server.get
+
+def tone_block(frequency=300.0, amplitude=8000):
+    return array('h', (int(amplitude * math.sin(2 * math.pi * frequency * i / 16000))
+                       for i in range(BLOCK))).tobytes()
+
+VOICE = tone_block()
+SILENCE = bytes(2 * BLOCK)
+
+class FakeTTS:
+    """Writes a WAV whose samples are the UTF-8 text, so a satellite can tell what it was sent"""
+
+    def __init__(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.model = os.path.join(self.output_dir, "voice.onnx")
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def synthesize(self, text):
+        with self._lock:
+            self._count += 1
+            path = os.path.join(self.output_dir, f"{self._count}.wav")
+        data = text.encode('utf-8')
+        with wave.open(path, 'wb') as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(22050)
+            wav_file.writeframes(data + b"\0" * (len(data) % 2))
+        return path
+
+def decode_text(wav_data):
+    return read_wav(wav_data)[0].rstrip(b"\0").decode('utf-8')
+
+class FakeWakeDetector:
+    """Fires at the first silent block after a burst of at least three speech blocks"""
+
+    def __init__(self, delay=0.0):
+        self.vad = VoiceActivityDetector()
+        self.delay = delay  # Seconds per block, to play a slow recognizer
+        self.speech_blocks = 0
+
+    def process(self, data):
+        time.sleep(self.delay)
+        if self.vad.is_speech(data):
+            self.speech_blocks += 1
+            return False
+        detected = self.speech_blocks >= 3
+        self.speech_blocks = 0
+        return detected
+
+    def reset(self):
+        self.speech_blocks = 0
+
+    def utterance_audio(self):
+        return b""
+
+class FakeRecognizer:
+    """Returns the next scripted command once it has heard audio"""
+
+    def __init__(self, commands):
+        self.commands = list(commands)
+        self.heard = 0
+
+    def AcceptWaveform(self, data):
+        self.heard += 1
+        return False
+
+    def Result(self):
+        return '{"text": ""}'
+
+    def PartialResult(self):
+        return '{"partial": ""}'
+
+    def FinalResult(self):
+        if not self.heard or not self.commands:
+            return '{"text": ""}'
+        self.heard = 0
+        return '{"text": "%s"}' % self.commands.pop(0)
+
+    def Reset(self):
+        self.heard = 0
+
+class ScriptedSpeech:
+    def __init__(self, scripts, wake_delay=0.0):
+        self.scripts = scripts  # Satellite name -> commands it will say
+        self.wake_delay = wake_delay
+
+    def wake_detector(self, session):
+        return FakeWakeDetector(self.wake_delay)
+
+    def recognizer(self, session):
+        return FakeRecognizer(self.scripts.get(session.name, []))
+
+class ScriptedCapture:
+    """
+    Microphone stand-in, faster than real time. The plan is a list of
+    ('speech', blocks), ('silence', blocks), ('until', predicate) and
+    ('sleep', seconds); silence is returned once it is over.
+    """
+
+    def __init__(self, plan, interval=0.005):
+        self.plan = list(plan)
+        self.interval = interval
+        self.done = threading.Event()
+
+    def read(self, timeout=None):
+        time.sleep(self.interval)
+        while self.plan:
+            kind, value = self.plan[0]
+            if kind == 'until':
+                if not value():
+                    return SILENCE
+            elif kind == 'sleep':
+                time.sleep(value)
+            elif value > 0:
+                self.plan[0] = (kind, value - 1)
+                return VOICE if kind == 'speech' else SILENCE
+            self.plan.pop(0)
+        self.done.set()
+        return SILENCE
+
+class RecordingOutput(AudioOutput):
+    def __init__(self):
+        super().__init__(NullSink(realtime=False))
+        self.answers = []
+        self.beeps = 0
+        self.start()
+
+    def play_wav(self, wav_data, channel=SPEECH, label=None):
+        self.answers.append(decode_text(wav_data))
+        return super().play_wav(wav_data, channel, label)
+
+    def play_file(self, path, channel=SPEECH):
+        self.beeps += 1
+        return super().play_file(path, channel)
+
+def beep_file():
+    path = os.path.join(tempfile.mkdtemp(), "beep.wav")
+    assistant.create_beep_wav(path)
+    return path
+
+def start_hub(scripts, llm_url=None, **kwargs):
+    assistant.WAKE_WORD_COOLDOWN = 0.0
+    tts = FakeTTS()
+    wake_delay = kwargs.pop('wake_delay', 0.0)
+    hub = assistant_hub.Hub(ScriptedSpeech(scripts, wake_delay), tts,
+                            AudioCache(tts, cache_dir=os.path.join(tts.output_dir, "cache")),
+                            llm_url=llm_url, **kwargs)
+    return hub, hub.start("127.0.0.1", 0)
+
+def ask(output, commands):
+    """Plan for saying the wake word and a command, waiting for each answer"""
+    plan = []
+    for i in range(commands):
+        plan += [('speech', 6), ('silence', 2),
+                 ('until', lambda i=i: output.beeps > i),
+                 ('speech', 6), ('silence', 8),
+                 ('until', lambda i=i: len(output.answers) > i), ('sleep', 0.3)]
+    return plan
+
+def wait_for(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+def test_satellites_get_their_own_answers():
+    server = get_server()
+    scripts = {
+        'kitchen': ["que hora es", "que hora es"],
+        'bedroom': ["cuentame un chiste", "otro"],
+        'office': ["tell me a joke", "another one"],
+    }
+    hub, port = start_hub(scripts, llm_url=server.url)
+    satellites = []
+    try:
+        beep = beep_file()
+        for name, language in (('kitchen', 'es'), ('bedroom', 'es'), ('office', 'en')):
+            output = RecordingOutput()
+            capture = ScriptedCapture(ask(output, 2))
+            satellite = Satellite(capture, output, "127.0.0.1", port, name=name,
+                                  beep_path=beep, language=language)
+            threading.Thread(target=satellite.run, daemon=True).start()
+            satellites.append(satellite)
+
+        assert wait_for(lambda: all(len(s.output.answers) >= 2 for s in satellites), 60), \
+            f"answers: {[s.output.answers for s in satellites]}"
+        kitchen, bedroom, office = [s.output.answers for s in satellites]
+        assert all(answer.startswith("It is") for answer in kitchen), kitchen
+        # Each satellite has its own conversation: the second question is its turn 2
+        assert bedroom == ["Turn 1.", "Turn 2."], bedroom
+        assert office == ["Turn 1.", "Turn 2."], office
+        assert server.last_history[0]['role'] == 'system'
+
+        stats = {session['name']: session for session in hub.stats()['sessions']}
+        assert stats['kitchen']['local_answers'] == 2 and stats['kitchen']['llm_answers'] == 0
+        assert stats['bedroom']['llm_answers'] == 2
+        assert all(session['overflows'] == 0 for session in stats.values())
+        assert all(s.blocks_dropped == 0 for s in satellites)
+    finally:
+        for satellite in satellites:
+            satellite.stop()
+            satellite.output.stop()
+        hub.stop()
+
+def test_slow_hub_pushes_back_on_the_satellite():
+    credits = 8
+    hub, port = start_hub({}, credits=credits, wake_delay=0.05)
+    output = RecordingOutput()
+    capture = ScriptedCapture([('speech', 150)], interval=0.002)
+    satellite = Satellite(capture, output, "127.0.0.1", port, name="noisy", beep_path=beep_file())
+    threading.Thread(target=satellite.run, daemon=True).start()
+    try:
+        assert capture.done.wait(30)
+        session = hub.stats()['sessions'][0]
+        # The hub never holds more than the credit it granted; the satellite drops its oldest audio
+        assert session['overflows'] == 0
+        assert session['max_queued'] <= credits
+        assert satellite.blocks_dropped > 0
+        with satellite._lock:
+            # (plus the gate's hangover once the speech is over)
+            assert satellite.blocks_sent + len(satellite._backlog) + satellite.blocks_dropped >= 150
+            assert 0 < len(satellite._backlog) <= BACKLOG_BLOCKS, "the hub may grant credit meanwhile"
+    finally:
+        satellite.stop()
+        output.stop()
+        hub.stop()
+
+def test_hub_rejects_satellites_beyond_max_sessions():
+    hub, port = start_hub({}, max_sessions=1)
+    first = Satellite(ScriptedCapture([]), None, "127.0.0.1", port, name="first")
+    second = Satellite(ScriptedCapture([]), None, "127.0.0.1", port, name="second")
+    try:
+        first.connect()
+        try:
+            second.connect()
+            assert False, "second satellite should have been rejected"
+        except ConnectionRefusedError as e:
+            assert "hub full" in str(e)
+        assert hub.stats()['rejected'] == 1
+    finally:
+        first.stop()
+        hub.stop()
+
+def test_hub_rejects_a_malformed_hello():
+    hub, port = start_hub({})
+    try:
+        for hello in (b'["kitchen"]', b'"kitchen"', b'{"version": %d, "rate": 8000}' % PROTOCOL_VERSION):
+            conn = Connection.connect("127.0.0.1", port)
+            try:
+                conn.send(HELLO, hello)
+                kind, payload = conn.recv()
+                assert kind == REJECT, f"{hello} was not rejected"
+                assert decode_json(payload)['reason']
+            finally:
+                conn.close()
+        assert hub.stats()['rejected'] == 3 and not hub.stats()['sessions']
+    finally:
+        hub.stop()
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+def test_unnamed_sessions_end_with_the_connection():
+    hub, port = start_hub({})
+    accept_thread = next(thread for thread in threading.enumerate() if thread.name == "hub-accept")
+    try:
+        for name in ("kitchen", None):
+            conn = Connection.connect("127.0.0.1", port)
+            hello = {'version': PROTOCOL_VERSION, 'rate': 16000}
+            if name:
+                hello['name'] = name
+            conn.send_json(HELLO, hello)
+            assert conn.recv()[0] == WELCOME
+            assert wait_for(lambda: len(hub.scheduler.sessions) == (1 if name else 2))
+            conn.send(BYE)
+            conn.close()
+            assert wait_for(lambda: not hub.stats()['sessions'])
+        assert list(hub.scheduler.sessions) == ["kitchen"], "a named satellite keeps its conversation"
+    finally:
+        hub.stop()
+    accept_thread.join(2)
+    assert not accept_thread.is_alive(), "stop() must end the accept loop"
+
+if __name__ == "__main__":
+    tests = [test_satellites_get_their_own_answers, test_slow_hub_pushes_back_on_the_satellite,
+             test_hub_rejects_satellites_beyond_max_sessions, test_hub_rejects_a_malformed_hello,
+             test_unnamed_sessions_end_with_the_connection]
+    failed = 0
+    try:
+        for test in tests:
+            try:
+                test()
+                print(f"✓ {test.__name__}")
+            except AssertionError as e:
+                failed += 1
+                print(f"✗ {test.__name__}: {e}")
+    finally:
+        shared_server.stop()
+    sys.exit(1 if failed else 0)
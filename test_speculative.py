@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test speculative LLM dispatch against the local fake Gradio server
+"""
+
+import sys
+import threading
+import time
+
+from conversation_history import ConversationHistory
+from fake_rkllm_server import SharedFakeServer
+from rkllm_client import RKLLMClient
+from speculative import SpeculativeDispatcher
+from stream_decoder import DONE
+
+BLOCK_SECONDS = 0.128
+REPLY = "Esta es la respuesta del servidor falso."
+
+# Two at once: the early request may still be winding down when the real one starts
+shared_server = SharedFakeServer(reply=REPLY, concurrency_limit=2)
+get_server = shared_server.get
+
+def make_dispatcher(server, **kwargs):
+    client = RKLLMClient(url=server.url, history=ConversationHistory())
+    return SpeculativeDispatcher(client, BLOCK_SECONDS, stable_seconds=0.3, **kwargs)
+
+def speak(dispatcher, *partials):
+    """Feed one partial result per block"""
+    for partial in partials:
+        dispatcher.observe(partial)
+
+def test_stable_partial_is_sent_early_and_used():
+    server = get_server()
+    dispatcher = make_dispatcher(server)
+    requests = server.requests
+    speak(dispatcher, "cuentame", "cuentame un", "cuentame un chiste", "cuentame un chiste",
+          "cuentame un chiste", "cuentame un chiste")
+    assert dispatcher.started == 1, "a partial stable for 0.3 s should have been sent"
+    stream = dispatcher.take("Cuéntame un chiste")
+    assert stream is not None, "same question after normalization is a hit"
+    assert "".join(stream) == REPLY
+    assert server.requests == requests + 1, "a hit must not send the question again"
+    assert dispatcher.stats()['hits'] == 1 and dispatcher.stats()['hit_rate'] == 1.0
+    assert len(dispatcher.client.history) == 2
+
+def test_different_final_transcript_is_a_miss():
+    server = get_server()
+    dispatcher = make_dispatcher(server)
+    speak(dispatcher, "cuentame un", *["cuentame un"] * 4)
+    time.sleep(0.5)  # Let the early answer complete
+    assert dispatcher.take("cuentame un cuento de miedo") is None
+    stats = dispatcher.stats()
+    assert stats['misses'] == 1 and stats['wasted_tokens'] > 0
+    assert len(dispatcher.client.history) == 0, "an unused answer must leave the history"
+
+def test_changed_partial_abandons_the_request():
+    server = get_server(tokens_per_second=10.0)
+    dispatcher = make_dispatcher(server)
+    speak(dispatcher, *["que es un"] * 4)
+    assert dispatcher.speculation is not None
+    tokens = server.tokens
+    speak(dispatcher, "que es un agujero negro")
+    assert dispatcher.speculation is None and dispatcher.abandoned == 1
+    time.sleep(0.5)
+    assert server.tokens - tokens <= 2, "the abandoned request kept generating"
+
+def test_abandoning_does_not_block_the_audio_loop():
+    server = get_server(first_token_delay=1.0)
+    dispatcher = make_dispatcher(server)
+    speak(dispatcher, *["que es un"] * 4)
+    time.sleep(0.2)  # The request is waiting for its first token
+    start = time.monotonic()
+    speak(dispatcher, "que es un agujero negro")
+    assert time.monotonic() - start < 0.1, "observe() waited for the cancelled request"
+    assert dispatcher.abandoned == 1
+
+def test_cancelling_the_early_request_leaves_the_real_one_cancellable():
+    server = get_server(tokens_per_second=10.0)
+    dispatcher = make_dispatcher(server)
+    client = dispatcher.client
+    speak(dispatcher, *["que es un"] * 4)
+    time.sleep(0.3)  # Streaming
+    assert dispatcher.take("que es un agujero negro") is None
+    events = []
+    real = threading.Thread(target=lambda: events.extend(client.chat_events("que es un agujero negro")))
+    real.start()
+    time.sleep(0.6)  # The early request has ended by now; the real one is streaming
+    tokens = server.tokens
+    client.cancel()  # Barge-in
+    real.join(5)
+    time.sleep(0.3)
+    assert server.tokens - tokens <= 3, "the real request was not cancelled on the server"
+    assert not any(event.kind == DONE and event.text == REPLY for event in events)
+    assert all(message['content'] != "que es un" for message in client.history.messages)
+
+def test_skipped_partials_are_not_sent():
+    server = get_server()
+    dispatcher = make_dispatcher(server, skip=lambda partial: "hora" in partial)
+    speak(dispatcher, *["que hora es"] * 6)
+    assert dispatcher.started == 0
+    assert dispatcher.take("que hora es") is None
+
+if __name__ == "__main__":
+    tests = [test_stable_partial_is_sent_early_and_used, test_different_final_transcript_is_a_miss,
+             test_changed_partial_abandons_the_request, test_abandoning_does_not_block_the_audio_loop,
+             test_cancelling_the_early_request_leaves_the_real_one_cancellable,
+             test_skipped_partials_are_not_sent]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"✗ {test.__name__}: {e}")
+    shared_server.stop()
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Test the parallel startup: task ordering, results passed to dependent
+tasks, and that the TTS prewarm step really fills the audio cache
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+import main_assistant as assistant
+from audio_cache import AudioCache
+from startup import Startup
+
+class FakeTTSEngine:
+    """Takes a moment to start, then writes a short silent WAV per phrase"""
+
+    def __init__(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.model = os.path.join(self.output_dir, "voice.onnx")
+        self.started = threading.Event()
+        self.synthesized = []
+
+    def start(self):
+        time.sleep(0.1)
+        self.started.set()
+        return self  # A result that must not be passed to the prewarm step
+
+    def synthesize(self, text):
+        assert self.started.is_set(), "synthesize called before the engine started"
+        self.synthesized.append(text)
+        path = os.path.join(self.output_dir, f"{len(self.synthesized)}.wav")
+        with wave.open(path, 'wb') as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(22050)
+            wav_file.writeframes(b"\0\0" * 100)
+        return path
+
+def test_requires_passes_results_and_after_does_not():
+    startup = Startup()
+    startup.add('model', lambda: "model")
+    startup.add('engine', lambda: time.sleep(0.05) or "engine")
+    startup.add('recognizer', lambda model: f"recognizer({model})", requires=['model'])
+    startup.add('warmup', lambda: "warm", after=['engine'])
+    assert startup.result('recognizer') == "recognizer(model)"
+    assert startup.result('warmup') == "warm"
+    tasks = startup.tasks
+    assert tasks['warmup'].started >= tasks['engine'].finished
+
+def test_unknown_dependency_is_rejected():
+    startup = Startup()
+    try:
+        startup.add('warmup', lambda: None, after=['missing'])
+        assert False, "an unknown task name should raise"
+    except ValueError:
+        pass
+
+def test_tts_prewarm_fills_the_cache():
+    engine = FakeTTSEngine()
+    cache = AudioCache(engine, cache_dir=os.path.join(engine.output_dir, "cache"))
+    saved = assistant.tts_engine, assistant.audio_cache
+    assistant.tts_engine, assistant.audio_cache = engine, cache
+    try:
+        startup = Startup()
+        assistant.add_tts_startup(startup)
+        startup.result('tts_prewarm', timeout=10)  # Re-raises if the step failed
+        for phrase in assistant.TTS_PREWARM_PHRASES:
+            assert cache.get(phrase) is not None, f"'{phrase}' was not prewarmed"
+        assert set(assistant.TTS_PREWARM_PHRASES) <= set(engine.synthesized)
+    finally:
+        assistant.tts_engine, assistant.audio_cache = saved
+
+if __name__ == "__main__":
+    tests = [test_requires_passes_results_and_after_does_not, test_unknown_dependency_is_rejected,
+             test_tts_prewarm_fills_the_cache]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"✗ {test.__name__}: {e}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Test the streaming sentence segmenter: boundaries, abbreviations, numbers,
+the length cut and the flush timeout
+"""
+
+import sys
+import time
+
+from text_segmenter import SentenceSegmenter, segment_stream
+
+def feed_all(text, language='es', chunk_size=None, **kwargs):
+    """Feed text in chunks (whole by default) and return every segment, flush included"""
+    segmenter = SentenceSegmenter(language, **kwargs)
+    chunk_size = chunk_size or len(text)
+    segments = []
+    for start in range(0, len(text), chunk_size):
+        segments.extend(segmenter.feed(text[start:start + chunk_size]))
+    last = segmenter.flush()
+    if last:
+        segments.append(last)
+    return segments
+
+def test_splits_sentences_and_long_clauses():
+    segments = feed_all("Hola. ¿Qué tal estás hoy? Mañana hará sol por la mañana, aunque lloverá, "
+                        "poco, por la tarde.")
+    assert segments == ["Hola.", "¿Qué tal estás hoy?", "Mañana hará sol por la mañana,",
+                        "aunque lloverá, poco,", "por la tarde."], segments
+
+def test_abbreviations_and_initials_do_not_split():
+    segments = feed_all("El Dr. García vive en la Av. Libertad. J. R. R. Tolkien también.")
+    assert segments == ["El Dr. García vive en la Av. Libertad.", "J. R. R. Tolkien también."], segments
+    segments = feed_all("Ask Mr. Smith, e.g. tomorrow. He is in room No. 5. I said no. Then he left.",
+                        language='en', min_chars=100)
+    assert segments == ["Ask Mr. Smith, e.g. tomorrow.", "He is in room No. 5.", "I said no.",
+                        "Then he left."], segments
+
+def test_no_at_the_end_of_a_delta_waits_for_the_next_word():
+    segmenter = SentenceSegmenter('en')
+    assert segmenter.feed("Room No. ") == [], "a number may follow"
+    assert segmenter.feed("5 is free. Say no. ") == ["Room No. 5 is free."]
+    assert segmenter.feed("Really.") == ["Say no."]
+
+def test_decimals_do_not_split():
+    segments = feed_all("Ahora hay 3.5 grados y mañana subirá a 10,5 grados. Fin.")
+    assert segments == ["Ahora hay 3.5 grados y mañana subirá a 10,5 grados.", "Fin."], segments
+
+def test_max_length_cut_at_a_space():
+    text = "palabra " * 40
+    segments = feed_all(text, max_chars=50)
+    assert all(len(segment) <= 50 for segment in segments), segments
+    assert " ".join(segments).split() == text.split(), "words must not be lost or split"
+
+def test_token_by_token_matches_whole_text():
+    text = ("El Sr. Pérez llegó a las 9.30 de la mañana, cansado; dijo: «No. Ahora no». "
+            "Luego se fue a casa... y durmió. ¡Fin!\nOtra línea")
+    for chunk_size in (1, 3, 7):
+        assert feed_all(text, chunk_size=chunk_size) == feed_all(text), f"chunk size {chunk_size}"
+
+def test_flush_timeout_emits_complete_words():
+    def slow_stream():
+        yield "Estoy pensando en la "
+        time.sleep(0.5)
+        yield "respuesta."
+
+    start = time.monotonic()
+    arrivals = [(segment, time.monotonic() - start)
+                for segment in segment_stream(slow_stream(), flush_timeout=0.1)]
+    assert [segment for segment, _ in arrivals] == ["Estoy pensando en la", "respuesta."], arrivals
+    assert arrivals[0][1] < 0.4, "complete words should be flushed before the next delta"
+
+if __name__ == "__main__":
+    tests = [test_splits_sentences_and_long_clauses, test_abbreviations_and_initials_do_not_split,
+             test_no_at_the_end_of_a_delta_waits_for_the_next_word,
+             test_decimals_do_not_split, test_max_length_cut_at_a_space,
+             test_token_by_token_matches_whole_text, test_flush_timeout_emits_complete_words]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"✗ {test.__name__}: {e}")
+    sys.exit(1 if failed else 0)
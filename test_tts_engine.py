@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Test the persistent Piper process handling with a fake Piper script:
+synthesis, respawning after a crash, and health checks racing synthesis
+"""
+
+import os
+import stat
+import sys
+import tempfile
+import threading
+
+from tts_engine import PiperTTSEngine
+
+# Reads lines like Piper and prints the path of a (tiny) WAV per line
+FAKE_PIPER = """\
+import os, sys, time
+output_dir = sys.argv[sys.argv.index("--output_dir") + 1]
+for count, line in enumerate(sys.stdin):
+    time.sleep(0.05)
+    path = os.path.join(output_dir, f"{os.getpid()}_{count}.wav")
+    with open(path, "wb") as f:
+        f.write(b"RIFF")
+    print(path, flush=True)
+"""
+
+def make_engine():
+    work_dir = tempfile.mkdtemp()
+    binary = os.path.join(work_dir, "piper")
+    with open(binary, 'w', encoding='utf-8') as f:
+        f.write(f"#!{sys.executable}\n{FAKE_PIPER}")
+    os.chmod(binary, os.stat(binary).st_mode | stat.S_IEXEC)
+    return PiperTTSEngine(binary, "voice.onnx", output_dir=os.path.join(work_dir, "out"))
+
+def test_synthesize_returns_a_wav_path():
+    engine = make_engine()
+    engine.start()
+    try:
+        path = engine.synthesize("Hola, ¿qué tal?")
+        assert path is not None and os.path.exists(path)
+        assert engine.restarts == 0
+    finally:
+        engine.shutdown()
+
+def test_crashed_piper_is_respawned_once():
+    engine = make_engine()
+    engine.start()
+    try:
+        engine.process.kill()
+        engine.process.wait()
+        errors = []
+
+        def check():
+            try:
+                engine.ensure_running()
+            except Exception as e:
+                errors.append(e)
+
+        def speak():
+            try:
+                assert engine.synthesize("Sigo aquí") is not None
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=check) for _ in range(6)]
+        threads += [threading.Thread(target=speak) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        assert not errors, errors
+        assert engine.restarts == 1, f"Piper was spawned {engine.restarts} times"
+        assert engine.is_alive()
+    finally:
+        engine.shutdown()
+
+if __name__ == "__main__":
+    tests = [test_synthesize_returns_a_wav_path, test_crashed_piper_is_respawned_once]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"✗ {test.__name__}: {e}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Test the weather provider against a local stub of the OpenWeatherMap API
+"""
+
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from weather import WeatherError, WeatherProvider
+
+class StubWeatherHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+    requests_seen = []
+    delay = 0.0
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        StubWeatherHandler.requests_seen.append(query)
+        time.sleep(StubWeatherHandler.delay)
+        city = query.get('q', [''])[0]
+        if city == "Nowhere":
+            status, body = 404, {"cod": "404", "message": "city not found"}
+        else:
+            status, body = 200, {
+                "main": {"temp": 21.5},
+                "weather": [{"description": f"cielo claro ({query.get('lang', ['?'])[0]})"}],
+            }
+        payload = json.dumps(body).encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client gave up (timeout test)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubWeatherHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/data/2.5/weather"
+    return server, url
+
+def reset_stub():
+    StubWeatherHandler.requests_seen = []
+    StubWeatherHandler.delay = 0.0
+
+def test_cache_by_city_and_language():
+    reset_stub()
+    server, url = start_stub_server()
+    try:
+        provider = WeatherProvider(base_url=url)
+        first = provider.get("Madrid", "key", lang='es')
+        second = provider.get("madrid", "key", lang='es')
+        english = provider.get("Madrid", "key", lang='en')
+        assert first == second == {'temp': 21.5, 'description': 'cielo claro (es)'}
+        assert english['description'] == 'cielo claro (en)'
+        assert len(StubWeatherHandler.requests_seen) == 2
+        assert (provider.hits, provider.misses) == (1, 2)
+        provider.stop()
+    finally:
+        server.shutdown()
+
+def test_stale_answer_served_while_refreshing():
+    reset_stub()
+    server, url = start_stub_server()
+    try:
+        provider = WeatherProvider(base_url=url, ttl=0.05, stale_limit=10.0)
+        provider.get("Madrid", "key")
+        time.sleep(0.1)
+        StubWeatherHandler.delay = 0.5
+        start = time.monotonic()
+        provider.get("Madrid", "key")
+        assert time.monotonic() - start < 0.2, "stale answer should not wait for the API"
+        time.sleep(0.7)
+        assert len(StubWeatherHandler.requests_seen) == 2
+        provider.stop()
+    finally:
+        server.shutdown()
+
+def test_errors_and_timeouts():
+    reset_stub()
+    server, url = start_stub_server()
+    try:
+        provider = WeatherProvider(base_url=url, timeout=(1.0, 0.2))
+        try:
+            provider.get("Nowhere", "key")
+            assert False, "expected WeatherError for HTTP 404"
+        except WeatherError:
+            pass
+        StubWeatherHandler.delay = 1.0
+        start = time.monotonic()
+        try:
+            provider.get("Madrid", "key")
+            assert False, "expected WeatherError on read timeout"
+        except WeatherError:
+            pass
+        assert time.monotonic() - start < 0.9
+        provider.stop()
+    finally:
+        server.shutdown()
+
+def test_background_refresh_prefetches():
+    reset_stub()
+    server, url = start_stub_server()
+    try:
+        provider = WeatherProvider(base_url=url)
+        provider.start_background_refresh(lambda: ("key", "Madrid", 'es'), interval=0.05)
+        time.sleep(0.2)
+        provider.get("Madrid", "key")
+        assert provider.misses == 0
+        assert len(StubWeatherHandler.requests_seen) == 1
+        provider.stop()
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    tests = [test_cache_by_city_and_language, test_stale_answer_served_while_refreshing,
+             test_errors_and_timeouts, test_background_refresh_prefetches]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"✗ {test.__name__}: {e}")
+    sys.exit(1 if failed else 0)
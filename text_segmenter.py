@@ -0,0 +1,190 @@
+"""
+Streaming sentence segmenter between the LLM stream and Piper.
+
+Buffers the deltas from RKLLMClient.chat_stream and emits text segments
+as soon as a sentence or clause boundary is seen, so the first sentence
+is synthesized while the model is still generating the rest.
+"""
+import queue
+import threading
+import time
+
+# Segments shorter than this are not cut at clause boundaries (, ; :)
+MIN_SEGMENT_CHARS = 20
+# Segments longer than this are cut at the last space even without punctuation
+MAX_SEGMENT_CHARS = 200
+# Seconds without a boundary before the complete words in the buffer are flushed
+FLUSH_TIMEOUT = 0.8
+
+SENTENCE_END = ".!?…"
+CLAUSE_END = ",;:"
+# Closing quotes and brackets that may follow a terminator: 'Dijo "hola."'
+CLOSERS = "\"'”’»)]"
+
+# Words ending in a period that do not end a sentence
+ABBREVIATIONS = {
+    'es': {"sr", "sra", "srta", "dr", "dra", "ud", "uds", "etc", "pág", "núm", "aprox", "av", "ej", "p.ej"},
+    'en': {"mr", "mrs", "ms", "dr", "st", "vs", "etc", "e.g", "i.e", "approx"},
+}
+# Abbreviations only when a number follows: "No. 5" but "I said no. Then..."
+NUMBER_ABBREVIATIONS = {
+    'es': set(),
+    'en': {"no"},
+}
+
+
+class SentenceSegmenter:
+    def __init__(self, language='es', min_chars=MIN_SEGMENT_CHARS, max_chars=MAX_SEGMENT_CHARS):
+        self.abbreviations = ABBREVIATIONS.get(language, ABBREVIATIONS['es'])
+        self.number_abbreviations = NUMBER_ABBREVIATIONS.get(language, NUMBER_ABBREVIATIONS['es'])
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.buffer = ""
+        self._scanned = 0  # buffer[:_scanned] holds no boundary
+
+    def _last_word(self, end):
+        """The word ending at buffer[end], without opening punctuation, lowercased"""
+        start = end
+        while start > 0 and not self.buffer[start - 1].isspace():
+            start -= 1
+        return self.buffer[start:end].lstrip("¿¡(\"'«").lower()
+
+    def _is_abbreviation(self, end, following):
+        """
+        Check whether the period at buffer[end] closes an abbreviation or an initial.
+        following is the next non-space character after it.
+        """
+        word = self._last_word(end)
+        if len(word) == 1 and word.isalpha():
+            return True
+        if word in self.number_abbreviations:
+            return following.isdigit()
+        return word in self.abbreviations
+
+    def _find_boundary(self):
+        """Return the end index of the first complete segment, or None"""
+        buf = self.buffer
+        for i in range(self._scanned, len(buf)):
+            ch = buf[i]
+            if ch == "\n":
+                return i + 1
+            if ch in SENTENCE_END or (ch in CLAUSE_END and i + 1 >= self.min_chars):
+                end = i + 1
+                while end < len(buf) and buf[end] in CLOSERS:
+                    end += 1
+                if end >= len(buf):
+                    # Need the next character to know whether this is a boundary ("3.5", "...")
+                    self._scanned = i
+                    return None
+                if not buf[end].isspace():
+                    continue
+                if ch == ".":
+                    following = end
+                    while following < len(buf) and buf[following].isspace():
+                        following += 1
+                    if following == len(buf) and self._last_word(i) in self.number_abbreviations:
+                        # "No." is only an abbreviation before a number: wait for the next word
+                        self._scanned = i
+                        return None
+                    if self._is_abbreviation(i, buf[following:following + 1]):
+                        continue
+                return end
+        self._scanned = len(buf)
+
+        if len(buf) >= self.max_chars:
+            cut = buf.rfind(" ", 0, self.max_chars)
+            return cut + 1 if cut > 0 else self.max_chars
+        return None
+
+    def feed(self, text):
+        """Add a delta and return the list of segments completed by it"""
+        self.buffer += text
+        segments = []
+        while True:
+            end = self._find_boundary()
+            if end is None:
+                break
+            segment = self.buffer[:end].strip()
+            self.buffer = self.buffer[end:]
+            self._scanned = 0
+            if segment:
+                segments.append(segment)
+        return segments
+
+    def flush_words(self):
+        """Emit the complete words in the buffer, keeping a trailing partial word"""
+        cut = self.buffer.rfind(" ")
+        if cut <= 0:
+            return None
+        segment = self.buffer[:cut].strip()
+        self.buffer = self.buffer[cut + 1:]
+        self._scanned = 0
+        return segment or None
+
+    def flush(self):
+        """Emit whatever is left in the buffer (end of stream)"""
+        segment = self.buffer.strip()
+        self.buffer = ""
+        self._scanned = 0
+        return segment or None
+
+
+_END_OF_STREAM = object()
+
+
+def _pump(text_iterator, chunks):
+    try:
+        for chunk in text_iterator:
+            chunks.put(chunk)
+    except Exception as e:
+        chunks.put(e)
+    chunks.put(_END_OF_STREAM)
+
+
+def segment_stream(text_iterator, language='es', flush_timeout=FLUSH_TIMEOUT,
+                   min_chars=MIN_SEGMENT_CHARS, max_chars=MAX_SEGMENT_CHARS, on_delta=None):
+    """
+    Wrap a stream of text deltas and yield segments ready for synthesis.
+    The source is read on a background thread so the buffer can be flushed
+    on a timeout even while the LLM is still computing the next token.
+    on_delta, if given, is called with every raw delta (e.g. to print it).
+    """
+    segmenter = SentenceSegmenter(language, min_chars, max_chars)
+    chunks = queue.Queue()
+    threading.Thread(target=_pump, args=(text_iterator, chunks), daemon=True).start()
+
+    pending_since = None
+    while True:
+        timeout = None
+        if pending_since is not None:
+            timeout = max(0.0, pending_since + flush_timeout - time.monotonic())
+        try:
+            chunk = chunks.get(timeout=timeout)
+        except queue.Empty:
+            segment = segmenter.flush_words()
+            if segment:
+                yield segment
+            pending_since = time.monotonic() if segmenter.buffer.strip() else None
+            continue
+
+        if chunk is _END_OF_STREAM:
+            break
+        if isinstance(chunk, Exception):
+            raise chunk
+        if not chunk:
+            continue
+
+        if on_delta:
+            on_delta(chunk)
+        for segment in segmenter.feed(chunk):
+            yield segment
+            pending_since = None
+        if segmenter.buffer.strip():
+            if pending_since is None:
+                pending_since = time.monotonic()
+        else:
+            pending_since = None
+
+    segment = segmenter.flush()
+    if segment:
+        yield segment
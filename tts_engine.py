@@ -0,0 +1,139 @@
+"""
+Persistent Piper TTS engine.
+
+Piper is started once with the voice model loaded and kept running.
+Each text segment is written as one line to its stdin; Piper writes a WAV
+file per line into an output directory and prints the file path on stdout.
+"""
+import os
+import queue
+import subprocess
+import tempfile
+import threading
+
+# Seconds to wait for Piper to synthesize a segment before respawning it
+SYNTHESIS_TIMEOUT = 30.0
+
+
+def clean_tts_text(text):
+    """Remove characters that Piper reads out loud or that break the line protocol"""
+    return text.replace('"', '').replace("'", "").replace('`', '').replace('\n', ' ').strip()
+
+
+def default_output_dir():
+    """Prefer a RAM-backed directory so segments never hit the SD card"""
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "assistant_tts")
+
+
+class PiperTTSEngine:
+    def __init__(self, binary, model, output_dir=None, synthesis_timeout=SYNTHESIS_TIMEOUT):
+        self.binary = binary
+        self.model = model
+        self.output_dir = output_dir or default_output_dir()
+        self.synthesis_timeout = synthesis_timeout
+        self.process = None
+        self.restarts = 0
+        self._paths = queue.Queue()
+        # Guards self.process: the health check runs while other threads synthesize
+        self._lock = threading.RLock()
+
+    def start(self):
+        """Launch Piper and load the voice model"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        print(f"Starting Piper TTS engine ({self.model})...")
+        with self._lock:
+            self.process = subprocess.Popen(
+                [self.binary, "--model", self.model, "--output_dir", self.output_dir],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                bufsize=1,
+            )
+            # Each process gets its own queue so a dying reader cannot confuse the next one
+            self._paths = queue.Queue()
+            reader = threading.Thread(target=self._read_output,
+                                      args=(self.process, self._paths), daemon=True)
+            reader.start()
+
+    def _read_output(self, process, paths):
+        try:
+            for line in process.stdout:
+                path = line.strip()
+                if path:
+                    paths.put(path)
+        except (OSError, ValueError):
+            pass
+        # Signal EOF: the process exited or its stdout was closed
+        paths.put(None)
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def ensure_running(self):
+        """Health check: respawn Piper if it is not running"""
+        with self._lock:
+            if not self.is_alive():
+                if self.process is not None:
+                    print(f"[Warning: Piper exited with code {self.process.returncode}, restarting]")
+                self.restart()
+
+    def restart(self):
+        with self._lock:
+            self.shutdown()
+            self.start()
+            self.restarts += 1
+
+    def shutdown(self):
+        """Close Piper's stdin so it finishes cleanly, killing it if needed"""
+        with self._lock:
+            process, self.process = self.process, None
+        if process is None:
+            return
+        try:
+            if process.stdin:
+                process.stdin.close()
+        except OSError:
+            pass
+        try:
+            process.wait(timeout=2.0)
+        except subprocess.TimeoutExpired:
+            process.terminate()
+            try:
+                process.wait(timeout=1.0)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def synthesize(self, text):
+        """
+        Synthesize one text segment.
+        Returns the path of the generated WAV file, or None on failure.
+        The caller owns the file and should delete it after playback.
+        """
+        clean_text = clean_tts_text(text)
+        if not clean_text:
+            return None
+
+        with self._lock:
+            self.ensure_running()
+            try:
+                self.process.stdin.write(clean_text + "\n")
+                self.process.stdin.flush()
+            except (BrokenPipeError, OSError):
+                print("[Warning: Piper pipe broken, restarting]")
+                self.restart()
+                return None
+
+            try:
+                path = self._paths.get(timeout=self.synthesis_timeout)
+            except queue.Empty:
+                print("[Warning: Piper synthesis timeout, restarting]")
+                self.restart()
+                return None
+
+            if path is None:
+                print("[Warning: Piper exited during synthesis, restarting]")
+                self.restart()
+                return None
+            return path
@@ -0,0 +1,206 @@
+"""
+Per-turn stage tracing.
+
+main() opens a turn when the wake word is heard. The state machine, the
+RKLLM client and the TTS functions mark named stages on it with monotonic
+timestamps, and when the turn ends one JSON line is appended to a rotating
+trace file. config_app.py aggregates the file for its /metrics route, so
+the two processes only share the file.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+
+TRACE_FILE = os.path.join("logs", "turns.jsonl")
+TRACE_MAX_BYTES = 1024 * 1024
+TRACE_BACKUPS = 3
+
+# (stage, start mark, end mark). A stage is measured when both marks are present.
+STAGES = [
+    ('wake_to_listen', 'wake', 'listening'),
+    ('speech_end_to_command', 'speech_end', 'command'),
+    ('intent', 'command', 'intent_done'),
+    ('llm_first_token', 'llm_submit', 'llm_first_token'),
+    ('llm_total', 'llm_submit', 'llm_done'),
+    ('tts_first_segment', 'tts_first_request', 'tts_first_segment'),
+    ('command_to_first_audio', 'command', 'first_audio'),
+    ('turn', 'wake', 'turn_end'),
+]
+# Upper bounds (ms) of the histogram buckets in the metrics
+HISTOGRAM_BUCKETS_MS = [100, 250, 500, 1000, 2000, 5000, 10000]
+
+def percentile(values, p):
+    """Linear-interpolated percentile of a list of numbers (p in 0-100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+class Turn:
+    def __init__(self):
+        self.start = time.monotonic()
+        self.wall_time = time.time()
+        self.marks = {}    # name -> seconds since the start of the turn (first occurrence)
+        self.fields = {}
+        self.errors = []
+
+    def mark(self, name):
+        if name not in self.marks:
+            self.marks[name] = time.monotonic() - self.start
+
+    def discard(self, name):
+        self.marks.pop(name, None)
+
+    def error(self, source, message):
+        kind = 'timeout' if 'timeout' in str(message).lower() else 'error'
+        self.errors.append({'source': source, 'kind': kind, 'message': str(message)[:200]})
+
+    def record(self, outcome):
+        stages = {}
+        for name, start, end in STAGES:
+            if start in self.marks and end in self.marks:
+                stages[name] = round(1000.0 * (self.marks[end] - self.marks[start]), 1)
+        return {
+            'time': round(self.wall_time, 3),
+            'outcome': outcome,
+            'stages_ms': stages,
+            'marks': {name: round(value, 4) for name, value in self.marks.items()},
+            'fields': self.fields,
+            'errors': self.errors,
+        }
+
+class TurnTracer:
+    """
+    Holds the turn in progress. Every method is a no-op when no turn is open,
+    so instrumented code does not need to know whether tracing is active.
+    """
+
+    def __init__(self, path=TRACE_FILE, max_bytes=TRACE_MAX_BYTES, backups=TRACE_BACKUPS, enabled=True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.enabled = enabled
+        self._turn = None
+        self._lock = threading.Lock()
+        self._logger = None
+
+    def start_turn(self):
+        with self._lock:
+            previous = self._turn
+            self._turn = Turn() if self.enabled else None
+        if previous is not None:
+            self._write(previous.record('abandoned'))
+
+    def mark(self, name):
+        with self._lock:
+            if self._turn is not None:
+                self._turn.mark(name)
+
+    def discard(self, *names):
+        """Forget marks, e.g. those of a speculative LLM request that was thrown away"""
+        with self._lock:
+            if self._turn is not None:
+                for name in names:
+                    self._turn.discard(name)
+
+    def set(self, key, value):
+        with self._lock:
+            if self._turn is not None:
+                self._turn.fields[key] = value
+
+    def error(self, source, message):
+        with self._lock:
+            if self._turn is not None:
+                self._turn.error(source, message)
+
+    def end_turn(self, outcome):
+        with self._lock:
+            turn, self._turn = self._turn, None
+        if turn is not None:
+            turn.mark('turn_end')
+            self._write(turn.record(outcome))
+
+    def _write(self, record):
+        try:
+            if self._logger is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(
+                    self.path, maxBytes=self.max_bytes, backupCount=self.backups, encoding='utf-8')
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger = logging.getLogger("turn_trace")
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                logger.addHandler(handler)
+                self._logger = logger
+            self._logger.info(json.dumps(record, ensure_ascii=False))
+        except OSError as e:
+            print(f"[Warning: could not write turn trace, tracing disabled: {e}]")
+            self.enabled = False
+
+# Shared by main_assistant, rkllm_client and the TTS functions
+tracer = TurnTracer()
+
+def read_turns(path=TRACE_FILE, backups=TRACE_BACKUPS):
+    """Return the traced turns, oldest first, from the trace file and its rotated copies"""
+    paths = [f"{path}.{index}" for index in range(backups, 0, -1)] + [path]
+    turns = []
+    for trace_path in paths:
+        try:
+            with open(trace_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        turns.append(json.loads(line))
+                    except ValueError:
+                        pass  # Line cut by a crash
+        except OSError:
+            pass
+    return turns
+
+def summarize(turns):
+    """Aggregate traced turns into counters, percentiles and histograms per stage"""
+    outcomes = {}
+    errors = {}
+    timeouts = 0
+    speculative = {'hit': 0, 'miss': 0, 'abandoned': 0, 'wasted_tokens': 0}
+    for turn in turns:
+        outcomes[turn.get('outcome')] = outcomes.get(turn.get('outcome'), 0) + 1
+        fields = turn.get('fields', {})
+        if fields.get('speculative') in speculative:
+            speculative[fields['speculative']] += 1
+        speculative['wasted_tokens'] += fields.get('speculative_wasted_tokens', 0)
+        for error in turn.get('errors', []):
+            if error.get('kind') == 'timeout':
+                timeouts += 1
+            errors[error.get('source')] = errors.get(error.get('source'), 0) + 1
+
+    stages = {}
+    for name, _, _ in STAGES:
+        values = [turn['stages_ms'][name] for turn in turns if name in turn.get('stages_ms', {})]
+        histogram = {f"<={bound}": 0 for bound in HISTOGRAM_BUCKETS_MS}
+        histogram[f">{HISTOGRAM_BUCKETS_MS[-1]}"] = 0
+        for value in values:
+            bucket = next((f"<={bound}" for bound in HISTOGRAM_BUCKETS_MS if value <= bound),
+                          f">{HISTOGRAM_BUCKETS_MS[-1]}")
+            histogram[bucket] += 1
+        stats = {'count': len(values)}
+        for key, p in (('p50_ms', 50), ('p95_ms', 95), ('max_ms', 100)):
+            value = percentile(values, p)
+            stats[key] = round(value, 1) if value is not None else None
+        stats['histogram'] = histogram
+        stages[name] = stats
+
+    return {
+        'turns': len(turns),
+        'outcomes': outcomes,
+        'errors': sum(errors.values()),
+        'errors_by_source': errors,
+        'timeouts': timeouts,
+        'speculative_llm': speculative,
+        'stages': stages,
+    }
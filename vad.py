@@ -0,0 +1,125 @@
+"""
+Cheap frame-level voice activity detection on 16-bit mono PCM.
+
+Uses the RMS energy against an adaptive noise floor plus the zero-crossing
+rate, which is enough to keep the Vosk decoder idle while the room is silent.
+"""
+import math
+import warnings
+from array import array
+
+# C frame measurements; the array fallbacks below cover Pythons without it (3.13+)
+with warnings.catch_warnings():
+    warnings.simplefilter('ignore', DeprecationWarning)
+    try:
+        import audioop
+    except ImportError:
+        audioop = None
+
+# Absolute RMS below which a block is never speech (16-bit full scale is 32768)
+MIN_SPEECH_RMS = 300.0
+# A block is speech when its RMS exceeds the noise floor by this factor
+SPEECH_TO_NOISE_RATIO = 2.5
+# Blocks with more zero crossings per sample than this are hiss or clicks, not voice
+MAX_SPEECH_ZCR = 0.35
+# Smoothing factor for the noise floor estimate (per block)
+NOISE_FLOOR_ALPHA = 0.05
+# Fraction of NOISE_FLOOR_ALPHA used on loud blocks, so a constant loud noise is learned slowly
+NOISE_FLOOR_RISE = 0.05
+
+def frame_rms(data):
+    data = data[:len(data) - len(data) % 2]
+    if not data:
+        return 0.0
+    if audioop:
+        return float(audioop.rms(data, 2))
+    samples = array('h', data)
+    return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+def zero_crossing_rate(data):
+    data = data[:len(data) - len(data) % 2]
+    if len(data) < 4:
+        return 0.0
+    if audioop:
+        return audioop.cross(data, 2) / (len(data) // 2 - 1)
+    samples = array('h', data)
+    crossings = sum(1 for a, b in zip(samples, samples[1:]) if (a < 0) != (b < 0))
+    return crossings / (len(samples) - 1)
+
+class VoiceActivityDetector:
+    def __init__(self, min_rms=MIN_SPEECH_RMS, ratio=SPEECH_TO_NOISE_RATIO,
+                 max_zcr=MAX_SPEECH_ZCR, alpha=NOISE_FLOOR_ALPHA):
+        self.min_rms = min_rms
+        self.ratio = ratio
+        self.max_zcr = max_zcr
+        self.alpha = alpha
+        self.noise_floor = min_rms / ratio
+        self.last_rms = 0.0
+        self.last_zcr = 0.0
+
+    def threshold(self):
+        return max(self.min_rms, self.noise_floor * self.ratio)
+
+    def is_speech(self, data):
+        """Classify one block and update the noise floor on non-speech blocks"""
+        rms = frame_rms(data)
+        self.last_rms = rms
+        if rms < self.threshold():
+            self.noise_floor += self.alpha * (rms - self.noise_floor)
+            return False
+        self.noise_floor += self.alpha * NOISE_FLOOR_RISE * (rms - self.noise_floor)
+        # Only pay for the zero-crossing count when the block is loud enough
+        self.last_zcr = zero_crossing_rate(data)
+        return self.last_zcr <= self.max_zcr
+
+class Endpointer:
+    """
+    Decide when a spoken command is over from per-block voice activity.
+
+    Time is counted in audio blocks rather than wall-clock seconds, so the
+    decision stays correct when buffered audio is consumed faster than real time.
+    """
+    NO_SPEECH = 'no_speech'        # Nobody started speaking in time
+    SPEECH_ENDED = 'speech_ended'  # Speech followed by enough trailing silence (or too long)
+
+    def __init__(self, block_seconds, no_speech_timeout=5.0, end_silence=0.4,
+                 min_speech=0.15, max_utterance=12.0):
+        self.block_seconds = block_seconds
+        self.no_speech_timeout = no_speech_timeout
+        self.end_silence = end_silence
+        self.min_speech = min_speech
+        self.max_utterance = max_utterance
+        self.reset()
+
+    def reset(self):
+        self.elapsed = 0.0
+        self.speech_time = 0.0
+        self.silence_time = 0.0
+        self.speech_started = False
+
+    def resume(self):
+        """Keep waiting for speech after a false start, without extending the deadline"""
+        self.speech_time = 0.0
+        self.silence_time = 0.0
+        self.speech_started = False
+
+    def process(self, is_speech):
+        """Feed the activity of one block. Returns None or an end event."""
+        self.elapsed += self.block_seconds
+        if is_speech:
+            self.speech_time += self.block_seconds
+            self.silence_time = 0.0
+            if self.speech_time >= self.min_speech:
+                self.speech_started = True
+        else:
+            self.silence_time += self.block_seconds
+            if not self.speech_started:
+                # Isolated noise bursts do not count as the start of a command
+                self.speech_time = 0.0
+
+        if self.speech_started:
+            if self.silence_time >= self.end_silence or self.elapsed >= self.max_utterance:
+                return self.SPEECH_ENDED
+        elif self.elapsed >= self.no_speech_timeout:
+            return self.NO_SPEECH
+        return None
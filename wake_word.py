@@ -0,0 +1,203 @@
+"""
+Wake word frontend: a cheap voice-activity gate in front of a Vosk
+recognizer restricted to the wake phrase plus an [unk] garbage class.
+
+In silence no audio reaches Kaldi at all, and when someone speaks the
+decoder only has to choose between the wake phrase and "anything else".
+"""
+import json
+import threading
+import time
+from collections import deque
+
+from vad import VoiceActivityDetector
+
+# Blocks of audio before speech onset fed to the recognizer when the gate opens
+GATE_PREROLL_BLOCKS = 2
+# Blocks the gate stays open after the last speech block, so words are not clipped
+GATE_HANGOVER_BLOCKS = 4
+# Audio blocks of the decoded utterance kept for utterance_audio() (~15 s at 2048 frames)
+UTTERANCE_MAX_BLOCKS = 120
+# Seconds between idle CPU usage reports
+CPU_REPORT_INTERVAL = 300.0
+# Seconds after a barge-in monitor starts during which detections are ignored
+BARGE_IN_HOLDOFF = 0.5
+
+class WakeWordDetector:
+    def __init__(self, model, phrase, rate=16000, use_grammar=True,
+                 preroll_blocks=GATE_PREROLL_BLOCKS, hangover_blocks=GATE_HANGOVER_BLOCKS,
+                 vad=None, min_confidence=0.0):
+        """
+        vad replaces the default VoiceActivityDetector (e.g. a stricter one during playback).
+        min_confidence (0-1) rejects detections whose phrase words Vosk is less sure about.
+        """
+        from vosk import KaldiRecognizer  # Already loaded with the model; kept out of import time
+        self.phrase = phrase.lower().strip()
+        self.min_confidence = min_confidence
+        if use_grammar:
+            # Vosk falls back to the full vocabulary if the model has no runtime grammar support
+            grammar = json.dumps([self.phrase, "[unk]"], ensure_ascii=False)
+            self.recognizer = KaldiRecognizer(model, rate, grammar)
+        else:
+            self.recognizer = KaldiRecognizer(model, rate)
+        if min_confidence > 0:
+            self.recognizer.SetWords(True)  # Per-word confidences in the results
+        self.vad = vad if vad is not None else VoiceActivityDetector()
+        self.hangover_blocks = hangover_blocks
+        self._preroll = deque(maxlen=preroll_blocks)
+        self._hangover = 0
+        self._utterance = deque(maxlen=UTTERANCE_MAX_BLOCKS)
+        self._utterance_done = False
+        self.last_text = ""
+
+        # Counters
+        self.blocks_total = 0
+        self.blocks_decoded = 0
+        self.rejected = 0  # Phrase recognized below min_confidence
+
+    def reset(self):
+        self.recognizer.Reset()
+        self._preroll.clear()
+        self._hangover = 0
+        self._utterance.clear()
+        self._utterance_done = False
+
+    def utterance_audio(self):
+        """
+        Audio of the utterance last decoded, from its pre-roll up to the detection.
+        Read it before reset(): it holds whatever was said with the wake phrase.
+        """
+        return b"".join(self._utterance)
+
+    def _matches(self, result_json):
+        result = json.loads(result_json)
+        text = result.get("text", "").lower().strip()
+        if text and text != "[unk]":
+            self.last_text = text
+        if self.phrase not in text:
+            return False
+        if self.min_confidence > 0:
+            phrase_words = set(self.phrase.split())
+            confidences = [word.get("conf", 0.0) for word in result.get("result", [])
+                           if word.get("word") in phrase_words]
+            if not confidences or min(confidences) < self.min_confidence:
+                self.rejected += 1
+                return False
+        return True
+
+    def process(self, data):
+        """Feed one audio block. Returns True when the wake phrase was recognized."""
+        self.blocks_total += 1
+        if self.vad.is_speech(data):
+            self._hangover = self.hangover_blocks
+        elif self._hangover > 0:
+            self._hangover -= 1
+            if self._hangover == 0:
+                # Speech ended: flush the decoder instead of waiting for more silence
+                detected = self._matches(self.recognizer.FinalResult())
+                self.recognizer.Reset()
+                self._utterance_done = True
+                return detected
+        else:
+            self._preroll.append(data)
+            return False
+
+        self.blocks_decoded += 1
+        if self._utterance_done:
+            self._utterance.clear()
+            self._utterance_done = False
+        while self._preroll:
+            block = self._preroll.popleft()
+            self._utterance.append(block)
+            self.recognizer.AcceptWaveform(block)
+        self._utterance.append(data)
+        if self.recognizer.AcceptWaveform(data):
+            self._utterance_done = True
+            return self._matches(self.recognizer.Result())
+        return False
+
+    def gated_ratio(self):
+        if not self.blocks_total:
+            return 0.0
+        return 1.0 - self.blocks_decoded / self.blocks_total
+
+def command_after_wake(text, phrase):
+    """
+    Return what was said after the wake phrase in a transcript
+    ("hola que hora es" -> "que hora es"), or "" if the phrase is not in it.
+    """
+    words = text.lower().split()
+    phrase_words = phrase.lower().split()
+    for start in range(len(words) - len(phrase_words) + 1):
+        if words[start:start + len(phrase_words)] == phrase_words:
+            return " ".join(words[start + len(phrase_words):])
+    return ""
+
+class BargeInMonitor:
+    """
+    Listen for the wake word on a background thread while the assistant answers.
+
+    The main loop does not read the microphone during a turn, so between
+    start() and stop() this thread is the one consuming the capture buffer.
+    on_detect is called once, from this thread, when the phrase is heard.
+    """
+
+    def __init__(self, capture, detector, on_detect, holdoff=BARGE_IN_HOLDOFF):
+        self.capture = capture
+        self.detector = detector
+        self.on_detect = on_detect
+        self.holdoff = holdoff
+        self.triggered = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.triggered = False
+        self._stop.clear()
+        self.detector.reset()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop listening and hand the microphone back. Returns True if barge-in happened."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self.triggered
+
+    def _run(self):
+        # Whatever was said before the answer started is not a barge-in
+        self.capture.skip_to_latest()
+        started = time.monotonic()
+        while not self._stop.is_set():
+            data = self.capture.read(timeout=0.1)
+            if data is None:
+                continue
+            if self.detector.process(data) and time.monotonic() - started >= self.holdoff:
+                self.triggered = True
+                self.on_detect()
+                return
+
+class IdleCpuMonitor:
+    """Report the CPU used by this process while it is waiting for the wake word"""
+
+    def __init__(self, interval=CPU_REPORT_INTERVAL):
+        self.interval = interval
+        self.reset()
+
+    def reset(self):
+        self._wall_start = time.monotonic()
+        self._cpu_start = time.process_time()
+
+    def tick(self, detector=None):
+        elapsed = time.monotonic() - self._wall_start
+        if elapsed < self.interval:
+            return None
+        cpu_percent = 100.0 * (time.process_time() - self._cpu_start) / elapsed
+        message = f"[Idle CPU: {cpu_percent:.1f}% of one core over {elapsed:.0f}s"
+        if detector is not None:
+            message += f", {100.0 * detector.gated_ratio():.0f}% of audio blocks gated"
+        print(message + "]")
+        self.reset()
+        return cpu_percent
@@ -0,0 +1,142 @@
+"""
+Weather lookups through OpenWeatherMap with a pooled session and a TTL cache.
+
+Answers are cached per (city, language). A background thread refreshes the
+configured city before its entry expires, so a weather question is normally
+answered from memory without any network round-trip.
+"""
+import threading
+import time
+
+import requests
+
+OPENWEATHERMAP_URL = "http://api.openweathermap.org/data/2.5/weather"
+
+# Seconds a cached answer is considered fresh
+WEATHER_CACHE_TTL = 600.0
+# Expired answers younger than this are still served while a refresh runs in the background
+WEATHER_STALE_LIMIT = 3 * WEATHER_CACHE_TTL
+# (connect, read) timeouts in seconds
+WEATHER_TIMEOUT = (3.05, 5.0)
+# Seconds between background refresh checks
+WEATHER_REFRESH_INTERVAL = 60.0
+
+class WeatherError(Exception):
+    pass
+
+class WeatherProvider:
+    def __init__(self, base_url=OPENWEATHERMAP_URL, ttl=WEATHER_CACHE_TTL,
+                 stale_limit=WEATHER_STALE_LIMIT, timeout=WEATHER_TIMEOUT):
+        self.base_url = base_url
+        self.ttl = ttl
+        self.stale_limit = stale_limit
+        self.timeout = timeout
+        # Keep-alive connection pool reused across lookups
+        self.session = requests.Session()
+        self._cache = {}  # (city, lang) -> (fetched_at, weather dict)
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._stop = threading.Event()
+        self._refresh_thread = None
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(city, lang):
+        return (city.strip().lower(), lang)
+
+    def fetch(self, city, api_key, lang='es'):
+        """Query the API and update the cache. Raises WeatherError on failure."""
+        params = {'q': city, 'appid': api_key, 'units': 'metric', 'lang': lang}
+        try:
+            response = self.session.get(self.base_url, params=params, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise WeatherError(f"request failed: {e}") from e
+        if response.status_code != 200:
+            raise WeatherError(f"HTTP {response.status_code}")
+        try:
+            data = response.json()
+            weather = {
+                'temp': data['main']['temp'],
+                'description': data['weather'][0]['description'],
+            }
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise WeatherError(f"unexpected response: {e}") from e
+
+        with self._lock:
+            self._cache[self._key(city, lang)] = (time.monotonic(), weather)
+        return weather
+
+    def _refresh_async(self, city, api_key, lang):
+        key = self._key(city, lang)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.fetch(city, api_key, lang)
+            except WeatherError as e:
+                print(f"[Weather refresh failed: {e}]")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def get(self, city, api_key, lang='es'):
+        """
+        Return {'temp', 'description'} for the city, from memory when possible.
+        Raises WeatherError if there is no usable cached answer and the API fails.
+        """
+        with self._lock:
+            entry = self._cache.get(self._key(city, lang))
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age < self.ttl:
+                self.hits += 1
+                return entry[1]
+            if age < self.stale_limit:
+                # Serve the slightly old answer now and update it for next time
+                self.hits += 1
+                self._refresh_async(city, api_key, lang)
+                return entry[1]
+        self.misses += 1
+        return self.fetch(city, api_key, lang)
+
+    def start_background_refresh(self, settings, interval=WEATHER_REFRESH_INTERVAL):
+        """
+        Keep the configured city warm. settings is a callable returning
+        (api_key, city, lang), so configuration changes are picked up.
+        """
+        if self._refresh_thread is not None:
+            return
+        self._stop.clear()
+
+        def loop():
+            while True:
+                api_key, city, lang = settings()
+                if api_key and city:
+                    with self._lock:
+                        entry = self._cache.get(self._key(city, lang))
+                    # Refresh a little before expiry so lookups never wait
+                    if entry is None or time.monotonic() - entry[0] >= self.ttl - interval:
+                        try:
+                            self.fetch(city, api_key, lang)
+                        except WeatherError as e:
+                            print(f"[Weather refresh failed: {e}]")
+                if self._stop.wait(interval):
+                    break
+
+        self._refresh_thread = threading.Thread(target=loop, daemon=True)
+        self._refresh_thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._refresh_thread is not None:
+            self._refresh_thread.join(timeout=1.0)
+            self._refresh_thread = None
+        self.session.close()